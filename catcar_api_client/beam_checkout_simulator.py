@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+CatCar Wash Service - Beam Checkout Simulator
+Local stand-in ของ Beam Checkout API สำหรับ payment load test แบบ offline
+
+ชี้ server มาที่ simulator นี้ด้วย BEAM_API_URL=http://localhost:8090
+- POST /api/v1/charges        → สร้าง charge พร้อม QR encodedImage
+- GET  /api/v1/charges/{id}   → charge status
+แล้วส่ง webhook ที่ sign ถูกต้อง (ตาม beam-webhook-signature.guard) กลับไปที่
+POST /api/v1/payment-gateway/webhook ตาม delay / outcome mix ที่กำหนด
+"""
+
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmark_results import percentile
+from catcar_sdk import ConnectionManager
+
+# Webhook event ที่ server รองรับ (validEventTypes ใน beam-webhook-signature.guard)
+WEBHOOK_EVENT = "charge.succeeded"
+
+# สัดส่วนผลลัพธ์ของ charge (ส่งใน field status ของ webhook payload)
+DEFAULT_OUTCOME_MIX = {"SUCCEEDED": 0.9, "FAILED": 0.07, "CANCELLED": 0.03}
+
+# เวลาตั้งแต่สร้าง charge จนส่ง webhook (ลูกค้าสแกน QR + ธนาคารยืนยัน)
+DEFAULT_WEBHOOK_DELAY = {"model": "lognormal", "median": 5.0, "sigma": 0.5}
+
+# QR ของ charge หมดอายุหลังสร้าง (วินาที)
+QR_EXPIRY_SECONDS = 15 * 60
+
+
+def _iso_now(offset_seconds: float = 0.0) -> str:
+    """เวลาปัจจุบัน (UTC) ในรูปแบบ ISO 8601 แบบที่ Beam ใช้"""
+    moment = datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def sample_delay(spec: Dict) -> float:
+    """
+    สุ่ม delay (วินาที) ตาม distribution
+
+    Args:
+        spec: {"model": "constant", "seconds": 3}
+              {"model": "uniform", "min": 2, "max": 10}
+              {"model": "exponential", "mean": 5}
+              {"model": "lognormal", "median": 5, "sigma": 0.5}
+    """
+    model = spec.get("model", "constant")
+    if model == "constant":
+        return float(spec.get("seconds", 0.0))
+    if model == "uniform":
+        return random.uniform(float(spec.get("min", 0.0)), float(spec.get("max", 0.0)))
+    if model == "exponential":
+        return random.expovariate(1.0 / float(spec.get("mean", 1.0)))
+    if model == "lognormal":
+        return random.lognormvariate(math.log(float(spec.get("median", 1.0))), float(spec.get("sigma", 0.5)))
+    raise ValueError(f"Unknown delay model: {model}")
+
+
+def sign_webhook(body: str, hmac_key: str) -> str:
+    """
+    Signature ของ webhook แบบเดียวกับ verifyWebhookSignature ของ server
+
+    HMAC-SHA256(body, base64decode(HMAC_key)) แล้ว encode เป็น base64
+
+    Args:
+        body: JSON string ที่ส่งจริง (ต้องตรงกับ JSON.stringify ของ body ที่ server parse)
+        hmac_key: payment_info.HMAC_key ของเจ้าของ device (base64)
+    """
+    digest = hmac.new(base64.b64decode(hmac_key), body.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def _crc16_ccitt(data: str) -> str:
+    """CRC-16/CCITT-FALSE ที่ EMVCo QR ใช้ใน tag 63"""
+    crc = 0xFFFF
+    for byte in data.encode('ascii'):
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return f"{crc:04X}"
+
+
+def promptpay_qr_payload(amount: int, reference_id: str) -> str:
+    """
+    สร้าง EMVCo PromptPay QR payload (ใช้เป็น encodedImage.rawData)
+
+    Args:
+        amount: จำนวนเงิน (satang)
+        reference_id: Reference ID ของ charge (ใส่ใน additional data)
+    """
+    def tlv(tag: str, value: str) -> str:
+        return f"{tag}{len(value):02d}{value}"
+
+    merchant = tlv("00", "A000000677010112") + tlv("01", "0105556000000")
+    additional = tlv("05", reference_id[:25])
+    payload = (tlv("00", "01") + tlv("01", "12") + tlv("30", merchant) + tlv("53", "764")
+               + tlv("54", f"{amount / 100:.2f}") + tlv("58", "TH") + tlv("62", additional) + "6304")
+    return payload + _crc16_ccitt(payload)
+
+
+class BeamCheckoutSimulator:
+    """
+    Local Beam Checkout: สร้าง charge และยิง webhook ที่ sign แล้วกลับไปที่ server
+
+    Webhook ถูกจัดคิวตามเวลา (heap) แล้วส่งโดย worker pool โดยจำกัดอัตราส่ง
+    (webhook_rate) ทำให้ควบคุมได้ทั้ง delay distribution, outcome mix,
+    duplicate delivery และ out-of-order delivery
+    """
+
+    def __init__(self,
+                 hmac_key: str,
+                 webhook_url: str = "http://localhost:3000/api/v1/payment-gateway/webhook",
+                 host: str = "0.0.0.0",
+                 port: int = 8090,
+                 outcome_mix: Optional[Dict[str, float]] = None,
+                 webhook_delay: Optional[Dict] = None,
+                 duplicate_ratio: float = 0.0,
+                 reorder_ratio: float = 0.0,
+                 reorder_delay: float = 5.0,
+                 webhook_rate: float = 0.0,
+                 merchant_keys: Optional[Dict[str, str]] = None,
+                 max_workers: int = 20,
+                 silent: bool = False):
+        """
+        Initialize Beam Checkout Simulator
+
+        Args:
+            hmac_key: HMAC key (base64) ตรงกับ payment_info.HMAC_key ของเจ้าของ device
+            webhook_url: Webhook endpoint ของ server
+            host: Host ที่ simulator listen
+            port: Port ที่ simulator listen (ตั้ง BEAM_API_URL ของ server มาที่ port นี้)
+            outcome_mix: สัดส่วน SUCCEEDED / FAILED / CANCELLED (default: DEFAULT_OUTCOME_MIX)
+            webhook_delay: Delay distribution ก่อนส่ง webhook (default: DEFAULT_WEBHOOK_DELAY)
+            duplicate_ratio: สัดส่วน charge ที่ส่ง webhook ซ้ำ (delay ของตัวซ้ำสุ่มแยกกัน)
+            reorder_ratio: สัดส่วน webhook ที่ถูกหน่วงเพิ่มจนมาถึงหลัง webhook ของ charge ที่สร้างทีหลัง
+            reorder_delay: เวลาที่หน่วงเพิ่มสำหรับ webhook ที่ถูก reorder (วินาที)
+            webhook_rate: จำนวน webhook ต่อวินาทีสูงสุด (0 = ไม่จำกัด)
+            merchant_keys: HMAC key แยกตาม merchantId (จาก Basic auth ของ createCharge)
+            max_workers: จำนวน webhook ที่ส่งพร้อมกันสูงสุด
+            silent: If True, don't print per-charge messages
+        """
+        self.hmac_key = hmac_key
+        self.webhook_url = webhook_url
+        self.host = host
+        self.port = port
+        self.outcome_mix = outcome_mix or dict(DEFAULT_OUTCOME_MIX)
+        self.webhook_delay = webhook_delay or dict(DEFAULT_WEBHOOK_DELAY)
+        self.duplicate_ratio = duplicate_ratio
+        self.reorder_ratio = reorder_ratio
+        self.reorder_delay = reorder_delay
+        self.webhook_rate = webhook_rate
+        self.merchant_keys = merchant_keys or {}
+        self.silent = silent
+
+        # ไม่ retry: webhook ที่ส่งซ้ำมีแค่ที่ตั้งใจ (duplicate_ratio)
+        self.http = ConnectionManager(pool_size=max_workers, timeout=30, retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="beam-webhook")
+
+        self._lock = threading.Lock()
+        self._charges: Dict[str, Dict] = {}
+        self._queue: List[tuple] = []  # heap ของ (due_time, seq, charge_id, attempt)
+        self._seq = 0
+        self._queue_cv = threading.Condition(self._lock)
+        self._next_send = 0.0
+        self._running = False
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._threads: List[threading.Thread] = []
+
+        self.stats = {"charges": 0, "webhooks_sent": 0, "duplicates_sent": 0, "reordered": 0,
+                      "webhook_errors": 0, "outcomes": {}, "http_status": {}}
+        self.webhook_latencies: List[float] = []
+
+    def _log(self, message: str):
+        if not self.silent:
+            print(message)
+
+    # ------------------------------------------------------------------
+    # Charges API
+    # ------------------------------------------------------------------
+    def _pick_outcome(self) -> str:
+        statuses = list(self.outcome_mix)
+        return random.choices(statuses, weights=[self.outcome_mix[s] for s in statuses])[0]
+
+    def create_charge(self, data: Dict, merchant_id: str = "") -> Dict:
+        """
+        สร้าง charge และจัดคิว webhook ของ charge นั้น
+
+        Args:
+            data: ChargeData จาก server {amount, currency, referenceId, paymentMethod}
+            merchant_id: Merchant ID จาก Basic auth
+
+        Returns:
+            Dict: ChargeResult {actionRequired, chargeId, paymentMethodType, encodedImage}
+        """
+        charge_id = f"ch_{uuid.uuid4().hex[:24]}"
+        amount = int(data.get('amount', 0))
+        reference_id = data.get('referenceId', '')
+        payment_method_type = data.get('paymentMethod', {}).get('paymentMethodType', 'QR_PROMPT_PAY')
+        created_at = _iso_now()
+        charge = {
+            "chargeId": charge_id,
+            "merchantId": merchant_id,
+            "referenceId": reference_id,
+            "amount": amount,
+            "currency": data.get('currency', 'THB'),
+            "paymentMethodType": payment_method_type,
+            "status": "PENDING",
+            "outcome": self._pick_outcome(),
+            "createdAt": created_at,
+            "updatedAt": created_at,
+        }
+
+        delay = sample_delay(self.webhook_delay)
+        reordered = random.random() < self.reorder_ratio
+        if reordered:
+            delay += self.reorder_delay
+        now = time.monotonic()
+        with self._lock:
+            self._charges[charge_id] = charge
+            self.stats["charges"] += 1
+            if reordered:
+                self.stats["reordered"] += 1
+            self._schedule(now + delay, charge_id, 1)
+            if random.random() < self.duplicate_ratio:
+                self._schedule(now + sample_delay(self.webhook_delay), charge_id, 2)
+
+        self._log(f"💳 Charge {charge_id} ref={reference_id} amount={amount} → {charge['outcome']} in {delay:.1f}s")
+        return {
+            "actionRequired": "ENCODED_IMAGE",
+            "chargeId": charge_id,
+            "paymentMethodType": payment_method_type,
+            "encodedImage": {
+                "expiry": _iso_now(QR_EXPIRY_SECONDS),
+                "rawData": promptpay_qr_payload(amount, reference_id),
+            },
+        }
+
+    def get_charge(self, charge_id: str) -> Optional[Dict]:
+        """ChargeStatus ของ charge หรือ None ถ้าไม่พบ"""
+        with self._lock:
+            charge = self._charges.get(charge_id)
+            if charge is None:
+                return None
+            return {
+                "chargeId": charge["chargeId"],
+                "status": charge["status"],
+                "amount": charge["amount"],
+                "currency": charge["currency"],
+                "referenceId": charge["referenceId"],
+                "chargeSource": "API",
+                "createdAt": charge["createdAt"],
+                "updatedAt": charge["updatedAt"],
+            }
+
+    # ------------------------------------------------------------------
+    # Webhook delivery
+    # ------------------------------------------------------------------
+    def _schedule(self, due: float, charge_id: str, attempt: int):
+        """เพิ่ม webhook เข้าคิว (ต้องถือ self._lock)"""
+        self._seq += 1
+        heapq.heappush(self._queue, (due, self._seq, charge_id, attempt))
+        self._queue_cv.notify()
+
+    def _scheduler_loop(self):
+        """ดึง webhook ที่ถึงเวลาออกจาก heap แล้วส่งให้ worker pool (จำกัดอัตราตาม webhook_rate)"""
+        with self._lock:
+            while self._running:
+                if not self._queue:
+                    self._queue_cv.wait()
+                    continue
+                now = time.monotonic()
+                due = max(self._queue[0][0], self._next_send)
+                if due > now:
+                    self._queue_cv.wait(due - now)
+                    continue
+                _, _, charge_id, attempt = heapq.heappop(self._queue)
+                if self.webhook_rate > 0:
+                    self._next_send = max(now, self._next_send) + 1.0 / self.webhook_rate
+                charge = self._charges.get(charge_id)
+                if charge is None:
+                    continue
+                if charge["status"] == "PENDING":
+                    charge["status"] = charge["outcome"]
+                    charge["updatedAt"] = _iso_now()
+                payload = self._webhook_payload(charge)
+                key = self.merchant_keys.get(charge["merchantId"], self.hmac_key)
+                self._executor.submit(self._send_webhook, charge_id, payload, key, attempt > 1)
+
+    def _webhook_payload(self, charge: Dict) -> Dict:
+        """BeamChargeSucceededPayload ของ charge"""
+        return {
+            "merchantId": charge["merchantId"],
+            "chargeId": charge["chargeId"],
+            "referenceId": charge["referenceId"],
+            "status": charge["status"],
+            "currency": charge["currency"],
+            "amount": charge["amount"],
+            "source": "API",
+            "sourceId": charge["chargeId"],
+            "transactionTime": charge["updatedAt"],
+            "paymentMethod": {"paymentMethodType": charge["paymentMethodType"], "qrPromptPay": {}},
+            "failureCode": "" if charge["status"] == "SUCCEEDED" else "PAYMENT_" + charge["status"],
+            "createdAt": charge["createdAt"],
+            "updatedAt": charge["updatedAt"],
+        }
+
+    def _send_webhook(self, charge_id: str, payload: Dict, hmac_key: str, duplicate: bool):
+        """POST webhook ที่ sign แล้วไปยัง server"""
+        # ส่ง body ตามที่ sign ทุก byte (compact JSON ตรงกับ JSON.stringify ฝั่ง server)
+        body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+        headers = {
+            'Content-Type': 'application/json',
+            'x-beam-signature': sign_webhook(body, hmac_key),
+            'x-beam-event': WEBHOOK_EVENT,
+        }
+        started = time.perf_counter()
+        try:
+            response = self.http.request("POST", self.webhook_url, data=body.encode('utf-8'), headers=headers)
+            code = str(response.status_code)
+        except requests.exceptions.RequestException as e:
+            code = type(e).__name__
+        latency = time.perf_counter() - started
+
+        with self._lock:
+            self.stats["webhooks_sent"] += 1
+            if duplicate:
+                self.stats["duplicates_sent"] += 1
+            else:
+                self.stats["outcomes"][payload["status"]] = self.stats["outcomes"].get(payload["status"], 0) + 1
+            self.stats["http_status"][code] = self.stats["http_status"].get(code, 0) + 1
+            if not code.startswith('2'):
+                self.stats["webhook_errors"] += 1
+            self.webhook_latencies.append(latency)
+
+        marker = " (duplicate)" if duplicate else ""
+        self._log(f"📤 Webhook {charge_id} {payload['status']}{marker} → {code} ({latency * 1000:.0f} ms)")
+
+    # ------------------------------------------------------------------
+    # HTTP server
+    # ------------------------------------------------------------------
+    def _make_handler(self):
+        simulator = self
+
+        class BeamRequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status: int, body: Dict):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status: int, code: str, message: str):
+                self._json(status, {"error": {"errorCode": code, "message": message}})
+
+            def _merchant_id(self) -> str:
+                auth = self.headers.get('Authorization', '')
+                if auth.startswith('Basic '):
+                    try:
+                        return base64.b64decode(auth[6:]).decode('utf-8').split(':', 1)[0]
+                    except ValueError:
+                        return ''
+                return ''
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/api/v1/charges':
+                    return self._error(404, "NOT_FOUND", f"No route for POST {self.path}")
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    data = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._error(400, "INVALID_REQUEST", "Invalid JSON body")
+                if int(data.get('amount', 0)) <= 0 or not data.get('referenceId'):
+                    return self._error(400, "INVALID_REQUEST", "amount and referenceId are required")
+                self._json(200, simulator.create_charge(data, self._merchant_id()))
+
+            def do_GET(self):
+                prefix = '/api/v1/charges/'
+                if not self.path.startswith(prefix):
+                    return self._error(404, "NOT_FOUND", f"No route for GET {self.path}")
+                charge = simulator.get_charge(self.path[len(prefix):].split('?')[0])
+                if charge is None:
+                    return self._error(404, "CHARGE_NOT_FOUND", "Charge not found")
+                self._json(200, charge)
+
+        return BeamRequestHandler
+
+    def start(self):
+        """เริ่ม HTTP server และ webhook scheduler (background threads)"""
+        self._running = True
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, name="beam-http", daemon=True),
+            threading.Thread(target=self._scheduler_loop, name="beam-scheduler", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        print(f"🏦 Beam Checkout Simulator listening on http://{self.host}:{self.port}")
+        print(f"📮 Webhook URL: {self.webhook_url}")
+        print(f"🎲 Outcome mix: {', '.join(f'{k}={v:.0%}' for k, v in self.outcome_mix.items())}")
+        print(f"⏱️  Webhook delay: {self.webhook_delay}")
+        print(f"♻️  Duplicates: {self.duplicate_ratio:.0%} | 🔀 Reordered: {self.reorder_ratio:.0%} "
+              f"(+{self.reorder_delay}s) | Rate limit: {self.webhook_rate or 'none'}")
+
+    def pending_webhooks(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def stop(self):
+        """หยุด server แล้วแสดงสถิติ (webhook ที่ยังไม่ถึงเวลาจะไม่ถูกส่ง)"""
+        with self._lock:
+            self._running = False
+            pending = len(self._queue)
+            self._queue_cv.notify_all()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        self._executor.shutdown(wait=True)
+        self.http.close()
+
+        stats = self.stats
+        print(f"\n{'='*60}")
+        print("📊 Beam Checkout Simulator Statistics")
+        print(f"{'='*60}")
+        print(f"💳 Charges created: {stats['charges']}")
+        print(f"📤 Webhooks sent: {stats['webhooks_sent']} (duplicates {stats['duplicates_sent']}, "
+              f"reordered {stats['reordered']}, not sent {pending})")
+        print(f"🎲 Outcomes: {', '.join(f'{k}={v}' for k, v in sorted(stats['outcomes'].items())) or '-'}")
+        print(f"📊 Webhook responses: {', '.join(f'{k}={v}' for k, v in sorted(stats['http_status'].items())) or '-'}")
+        p50 = percentile(self.webhook_latencies, 50)
+        p95 = percentile(self.webhook_latencies, 95)
+        if p50 is not None:
+            print(f"⏱️  Webhook latency p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms")
+        print(f"{'='*60}")
+
+
+def main():
+    """Main function"""
+    print("🏦 CatCar Wash Service - Beam Checkout Simulator")
+    print("=" * 60)
+
+    hmac_key = input("🔑 HMAC key (base64, ตรงกับ payment_info.HMAC_key): ").strip()
+    if not hmac_key:
+        print("❌ HMAC key ไม่สามารถว่างได้")
+        return
+    try:
+        base64.b64decode(hmac_key, validate=True)
+    except ValueError:
+        print("❌ HMAC key ต้องเป็น base64")
+        return
+
+    port = int(input("🔌 Port (default: 8090): ").strip() or "8090")
+    webhook_url = (input("📮 Webhook URL (default: http://localhost:3000/api/v1/payment-gateway/webhook): ").strip()
+                   or "http://localhost:3000/api/v1/payment-gateway/webhook")
+    succeeded = float(input("✅ SUCCEEDED % (default: 90): ").strip() or "90") / 100
+    failed = float(input("❌ FAILED % (default: 7): ").strip() or "7") / 100
+    cancelled = max(0.0, 1.0 - succeeded - failed)
+    median = float(input("⏱️  Webhook delay median (วินาที, default: 5): ").strip() or "5")
+    duplicate_ratio = float(input("♻️  Duplicate webhook % (default: 0): ").strip() or "0") / 100
+    reorder_ratio = float(input("🔀 Out-of-order webhook % (default: 0): ").strip() or "0") / 100
+    webhook_rate = float(input("🚦 Max webhooks/s (default: 0 = ไม่จำกัด): ").strip() or "0")
+
+    simulator = BeamCheckoutSimulator(
+        hmac_key=hmac_key,
+        webhook_url=webhook_url,
+        port=port,
+        outcome_mix={"SUCCEEDED": succeeded, "FAILED": failed, "CANCELLED": cancelled},
+        webhook_delay={"model": "lognormal", "median": median, "sigma": 0.5},
+        duplicate_ratio=duplicate_ratio,
+        reorder_ratio=reorder_ratio,
+        webhook_rate=webhook_rate,
+    )
+    simulator.start()
+    print(f"\n💡 ตั้งค่า server: BEAM_API_URL=http://localhost:{port}")
+    print("⏹️  กด Ctrl+C เพื่อหยุด")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n\n👋 หยุด Beam Checkout Simulator")
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
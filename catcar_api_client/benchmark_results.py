@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+CatCar Benchmark Results Store
+เก็บผลการรัน simulator / harness เป็นไฟล์ JSON (scenario + git SHA + timestamp)
+และเปรียบเทียบสองรอบแบบ metric ต่อ metric เพื่อใช้เป็น performance gate ก่อน deploy
+
+Usage:
+    python benchmark_results.py                                   # เมนูแบบ interactive
+    python benchmark_results.py list [scenario]
+    python benchmark_results.py compare payment-load              # รอบล่าสุด เทียบกับรอบก่อนหน้า
+    python benchmark_results.py compare payment-load@a1b2c3d payment-load --tolerance "*p95=0.1"
+
+Exit code ของ compare: 0 = ผ่าน, 1 = มี regression, 2 = หาผลไม่เจอ / argument ผิด
+"""
+
+import argparse
+import fnmatch
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# โฟลเดอร์เก็บผล (override ได้ด้วย CATCAR_BENCHMARK_DIR)
+RESULTS_DIR = os.environ.get(
+    "CATCAR_BENCHMARK_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results"),
+)
+
+# key ที่เป็นข้อมูลดิบ ไม่ใช่ metric (ไม่เก็บลงไฟล์)
+SKIPPED_KEYS = {"results", "events", "remaining", "statuses"}
+
+# key ที่ใช้ตั้งชื่อ item ใน list เช่น sweep step หรือ benchmark round
+LIST_LABEL_KEYS = ("target_rate", "devices", "wave", "size")
+
+# กฎเปรียบเทียบ: (pattern ของชื่อ metric, ทิศทางที่ดี, tolerance, mode, floor)
+#   mode "relative": เปลี่ยนได้ไม่เกิน tolerance (0.2 = 20%)
+#   mode "absolute": เปลี่ยนได้ไม่เกิน tolerance (หน่วยเดียวกับ metric เช่น ratio)
+#   floor: ส่วนต่างขั้นต่ำ (absolute) ที่จะนับเป็น regression กัน noise ของค่าที่เล็กมาก
+# กฎแรกที่ match ชื่อ metric (ส่วนสุดท้ายหลัง .) จะถูกใช้ metric ที่ไม่ match จะแสดงอย่างเดียว
+DEFAULT_RULES = [
+    ("*ratio", "lower", 0.02, "absolute", 0.0),
+    ("throughput", "higher", 0.10, "relative", 0.0),
+    ("achieved_rate", "higher", 0.10, "relative", 0.0),
+    ("*per_second", "higher", 0.10, "relative", 0.0),
+    ("*p50", "lower", 0.20, "relative", 0.005),
+    ("*p95", "lower", 0.20, "relative", 0.005),
+    ("*p99", "lower", 0.25, "relative", 0.005),
+    ("*latency*", "lower", 0.20, "relative", 0.005),
+    ("time_to_*", "lower", 0.20, "relative", 0.005),
+    # จำนวน (ไม่ใช่สัดส่วน) ขึ้นกับขนาดรอบ: ให้เพิ่มได้ 10% และไม่นับส่วนต่าง 1-2 ครั้งที่เป็น noise
+    ("*errors", "lower", 0.10, "relative", 2.0),
+    ("timeout", "lower", 0.10, "relative", 2.0),
+    ("failed", "lower", 0.10, "relative", 2.0),
+    ("missing", "lower", 0.10, "relative", 2.0),
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (pct 0-100) หรือ None ถ้าไม่มีข้อมูล"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def load_device_ids(path: str) -> List[str]:
+    """อ่าน device ID จากไฟล์ (หนึ่งบรรทัดต่อหนึ่ง device, ข้ามบรรทัดว่างและ #)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def get_git_sha() -> str:
+    """
+    หา git SHA ของ tree ปัจจุบัน (override ได้ด้วย CATCAR_GIT_SHA เช่น SHA ของ server image ที่ deploy)
+
+    Returns:
+        str: short SHA, ต่อท้าย -dirty ถ้ามีไฟล์ที่ยังไม่ commit, หรือ "unknown"
+    """
+    if os.environ.get("CATCAR_GIT_SHA"):
+        return os.environ["CATCAR_GIT_SHA"]
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True,
+                             text=True, timeout=10, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def flatten_metrics(data, prefix: str = "") -> Dict[str, float]:
+    """
+    แปลง summary ที่ซ้อนกัน (dict / list) เป็น {"commands.RESTART.p95": 0.12, ...}
+
+    เก็บเฉพาะค่าตัวเลข item ใน list ถูกตั้งชื่อด้วย LIST_LABEL_KEYS ถ้ามี เช่น "[target_rate=20]"
+    """
+    metrics: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in SKIPPED_KEYS:
+                continue
+            metrics.update(flatten_metrics(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, list):
+        for i, item in enumerate(data):
+            label = str(i)
+            if isinstance(item, dict):
+                for key in LIST_LABEL_KEYS:
+                    if item.get(key) is not None:
+                        label = f"{key}={item[key]}"
+                        break
+            metrics.update(flatten_metrics(item, f"{prefix}[{label}]"))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool) and prefix:
+        metrics[prefix] = data
+    return metrics
+
+
+def _slug(name: str) -> str:
+    """ทำชื่อ scenario ให้ใช้เป็นชื่อไฟล์ได้"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", name).strip("-") or "run"
+
+
+def save_run(scenario: str, summary, config: Optional[Dict] = None, git_sha: Optional[str] = None,
+             results_dir: str = RESULTS_DIR, silent: bool = False) -> str:
+    """
+    บันทึกผลการรันหนึ่งครั้ง
+
+    Args:
+        scenario: ชื่อ scenario เช่น "command-benchmark-20rps"
+        summary: ผลสรุปที่ harness คืนมา (dict หรือ list)
+        config: พารามิเตอร์ของการรัน (rate, duration, ...)
+        git_sha: SHA ที่ใช้ (None = ตรวจจาก git)
+        results_dir: โฟลเดอร์เก็บผล
+        silent: ไม่แสดงข้อความ
+
+    Returns:
+        str: path ของไฟล์ที่บันทึก
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    now = datetime.now()
+    run = {
+        "scenario": scenario,
+        "git_sha": git_sha or get_git_sha(),
+        "timestamp": now.isoformat(timespec="seconds"),
+        "config": config or {},
+        "metrics": flatten_metrics(summary),
+    }
+    filename = f"{_slug(scenario)}__{_slug(run['git_sha'])}__{now.strftime('%Y%m%dT%H%M%S')}.json"
+    path = os.path.join(results_dir, filename)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2, ensure_ascii=False)
+    if not silent:
+        print(f"💾 บันทึกผล {scenario} ({run['git_sha']}) → {path}")
+    return path
+
+
+def list_runs(scenario: Optional[str] = None, results_dir: str = RESULTS_DIR) -> List[Dict]:
+    """
+    อ่านผลทั้งหมด (เรียงจากเก่าไปใหม่)
+
+    Args:
+        scenario: กรองเฉพาะ scenario นี้ (None = ทั้งหมด)
+        results_dir: โฟลเดอร์เก็บผล
+
+    Returns:
+        List[Dict]: run ที่อ่านได้ พร้อม key "path"
+    """
+    if not os.path.isdir(results_dir):
+        return []
+    runs = []
+    for name in os.listdir(results_dir):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(results_dir, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if scenario and run.get("scenario") != scenario:
+            continue
+        run["path"] = path
+        runs.append(run)
+    runs.sort(key=lambda r: (r.get("timestamp", ""), r["path"]))
+    return runs
+
+
+def resolve_run(ref: str, results_dir: str = RESULTS_DIR) -> Dict:
+    """
+    หา run จาก reference
+
+    รูปแบบที่รองรับ:
+        path/to/run.json        ไฟล์โดยตรง
+        scenario                รอบล่าสุดของ scenario
+        scenario~N              ย้อนหลัง N รอบ (scenario~1 = รอบก่อนล่าสุด)
+        scenario@sha            รอบล่าสุดที่ git SHA ขึ้นต้นด้วย sha
+
+    Raises:
+        LookupError: หา run ไม่เจอ
+    """
+    if os.path.isfile(ref):
+        with open(ref, encoding="utf-8") as f:
+            run = json.load(f)
+        run["path"] = ref
+        return run
+
+    match = re.fullmatch(r"(?P<scenario>[^@~]+)(?:@(?P<sha>[^~]+))?(?:~(?P<back>\d+))?", ref)
+    if not match:
+        raise LookupError(f"reference ไม่ถูกต้อง: {ref}")
+    runs = list_runs(match["scenario"], results_dir)
+    if match["sha"]:
+        runs = [r for r in runs if r.get("git_sha", "").startswith(match["sha"])]
+    back = int(match["back"] or 0)
+    if len(runs) <= back:
+        raise LookupError(f"ไม่พบผลสำหรับ {ref} ใน {results_dir}")
+    return runs[-1 - back]
+
+
+def parse_tolerances(items: List[str]) -> List[Tuple[str, float]]:
+    """แปลง ["*p95=0.1", "throughput=0.05"] เป็น [(pattern, tolerance)]"""
+    overrides = []
+    for item in items:
+        pattern, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"tolerance ต้องอยู่ในรูป PATTERN=VALUE: {item}")
+        overrides.append((pattern.strip(), float(value)))
+    return overrides
+
+
+def _rule_for(metric: str, overrides: List[Tuple[str, float]]) -> Optional[Tuple[str, float, str, float]]:
+    """หากฎของ metric: override ที่ match ชื่อเต็มหรือชื่อสุดท้าย จะแทน tolerance ของกฎเดิม"""
+    leaf = re.split(r"[.\]]", metric)[-1]
+    rule = None
+    for pattern, direction, tolerance, mode, floor in DEFAULT_RULES:
+        if fnmatch.fnmatch(leaf, pattern):
+            rule = (direction, tolerance, mode, floor)
+            break
+    for pattern, tolerance in overrides:
+        if fnmatch.fnmatch(metric, pattern) or fnmatch.fnmatch(leaf, pattern):
+            direction, _, mode, floor = rule or ("lower", 0.0, "relative", 0.0)
+            rule = (direction, tolerance, mode, floor)
+    return rule
+
+
+def compare_runs(baseline: Dict, candidate: Dict, overrides: Optional[List[Tuple[str, float]]] = None) -> List[Dict]:
+    """
+    เปรียบเทียบ metric ของสองรอบ
+
+    Args:
+        baseline: run ที่ใช้เป็นฐาน
+        candidate: run ที่ต้องการตรวจ
+        overrides: tolerance ที่ override (pattern, value)
+
+    Returns:
+        List[Dict]: {metric, baseline, candidate, change, status} โดย status เป็น
+                    OK / REGRESSION / IMPROVED / INFO / MISSING / NEW
+    """
+    overrides = overrides or []
+    base_metrics = baseline.get("metrics", {})
+    cand_metrics = candidate.get("metrics", {})
+    rows = []
+    for metric in sorted(set(base_metrics) | set(cand_metrics)):
+        base = base_metrics.get(metric)
+        cand = cand_metrics.get(metric)
+        row = {"metric": metric, "baseline": base, "candidate": cand, "change": None, "status": "INFO"}
+        rows.append(row)
+        if base is None or cand is None:
+            row["status"] = "MISSING" if cand is None else "NEW"
+            continue
+
+        delta = cand - base
+        row["change"] = (delta / base) if base else None
+        rule = _rule_for(metric, overrides)
+        if rule is None:
+            continue
+        direction, tolerance, mode, floor = rule
+        worse = delta if direction == "lower" else -delta
+        limit = tolerance * abs(base) if mode == "relative" else tolerance
+        if worse > max(limit, floor):
+            row["status"] = "REGRESSION"
+        elif worse < -max(limit, floor):
+            row["status"] = "IMPROVED"
+        else:
+            row["status"] = "OK"
+    return rows
+
+
+def print_comparison(baseline: Dict, candidate: Dict, rows: List[Dict], show_all: bool = False):
+    """แสดงผลการเปรียบเทียบเป็นตาราง"""
+    def fmt(value: Optional[float]) -> str:
+        if value is None:
+            return "-"
+        return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+    icons = {"OK": "✅", "REGRESSION": "❌", "IMPROVED": "🚀", "INFO": "  ", "MISSING": "⚠️ ", "NEW": "🆕"}
+    print("\n" + "=" * 90)
+    print(f"📊 Benchmark Comparison: {baseline.get('scenario')}")
+    print("=" * 90)
+    print(f"Baseline:  {baseline.get('git_sha')} @ {baseline.get('timestamp')}")
+    print(f"Candidate: {candidate.get('git_sha')} @ {candidate.get('timestamp')}")
+    print(f"\n   {'Metric':<45} {'Baseline':>12} {'Candidate':>12} {'Change':>9}")
+    for row in rows:
+        if not show_all and row["status"] in ("INFO", "OK"):
+            continue
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+        print(f"{icons[row['status']]} {row['metric']:<45} {fmt(row['baseline']):>12} "
+              f"{fmt(row['candidate']):>12} {change:>9}")
+
+    counts = {status: sum(1 for r in rows if r["status"] == status) for status in icons}
+    print(f"\nOK: {counts['OK']} | Regressions: {counts['REGRESSION']} | Improved: {counts['IMPROVED']} | "
+          f"Missing: {counts['MISSING']} | New: {counts['NEW']}")
+    print("=" * 90)
+
+
+def run_compare(baseline_ref: Optional[str], candidate_ref: str, overrides: List[Tuple[str, float]],
+                fail_on_missing: bool = False, show_all: bool = False,
+                results_dir: str = RESULTS_DIR) -> int:
+    """
+    เปรียบเทียบสองรอบแล้วคืน exit code (0 = ผ่าน, 1 = regression, 2 = หาผลไม่เจอ)
+
+    ถ้าไม่ระบุ baseline_ref จะใช้รอบก่อนหน้าของ candidate ใน scenario เดียวกัน
+    """
+    try:
+        candidate = resolve_run(candidate_ref, results_dir)
+        if baseline_ref:
+            baseline = resolve_run(baseline_ref, results_dir)
+        else:
+            history = list_runs(candidate.get("scenario"), results_dir)
+            older = [r for r in history if r["path"] != candidate["path"]
+                     and (r.get("timestamp", ""), r["path"]) < (candidate.get("timestamp", ""), candidate["path"])]
+            if not older:
+                raise LookupError(f"ไม่มีรอบก่อนหน้าของ {candidate.get('scenario')} ให้เปรียบเทียบ")
+            baseline = older[-1]
+    except (LookupError, OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+
+    if baseline.get("scenario") != candidate.get("scenario"):
+        print(f"⚠️  เปรียบเทียบต่าง scenario: {baseline.get('scenario')} vs {candidate.get('scenario')}")
+
+    rows = compare_runs(baseline, candidate, overrides)
+    print_comparison(baseline, candidate, rows, show_all=show_all)
+    failed = any(r["status"] == "REGRESSION" for r in rows)
+    if fail_on_missing:
+        failed = failed or any(r["status"] == "MISSING" for r in rows)
+    print("❌ พบ performance regression" if failed else "✅ ไม่พบ performance regression")
+    return 1 if failed else 0
+
+
+def show_runs(scenario: Optional[str] = None, results_dir: str = RESULTS_DIR):
+    """แสดงรายการผลที่บันทึกไว้"""
+    runs = list_runs(scenario, results_dir)
+    if not runs:
+        print(f"📭 ยังไม่มีผลใน {results_dir}")
+        return
+    print(f"\n{'Scenario':<35} {'Git SHA':<16} {'Timestamp':<20} {'Metrics':>8}")
+    for run in runs:
+        print(f"{run.get('scenario', '-'):<35} {run.get('git_sha', '-'):<16} "
+              f"{run.get('timestamp', '-'):<20} {len(run.get('metrics', {})):>8}")
+
+
+def prompt_save_run(summary, config: Optional[Dict] = None, default_scenario: str = ""):
+    """ถามชื่อ scenario หลังรัน harness แล้วบันทึกผล (Enter = ไม่บันทึก)"""
+    hint = f" (default: {default_scenario}, - = ไม่บันทึก)" if default_scenario else " (Enter = ไม่บันทึก)"
+    scenario = input(f"💾 Scenario สำหรับบันทึกผล{hint}: ").strip() or default_scenario
+    if scenario and scenario != "-":
+        save_run(scenario, summary, config=config)
+
+
+def interactive():
+    """เมนูแบบ interactive"""
+    print("📊 CatCar Benchmark Results")
+    print("=" * 50)
+    print(f"📁 Results: {RESULTS_DIR}")
+    while True:
+        print("\n1. 📋 List runs")
+        print("2. 🔍 Compare runs")
+        print("3. ❌ Exit")
+        choice = input("👉 เลือกคำสั่ง (1-3): ").strip()
+        if choice == "1":
+            show_runs(input("🏷️  Scenario (Enter = ทั้งหมด): ").strip() or None)
+        elif choice == "2":
+            candidate = input("🆕 Candidate (scenario, scenario@sha, scenario~N หรือไฟล์): ").strip()
+            baseline = input("📌 Baseline (Enter = รอบก่อนหน้า): ").strip() or None
+            tolerance = input("🎚️  Tolerances เช่น *p95=0.1,throughput=0.05 (Enter = default): ").strip()
+            try:
+                overrides = parse_tolerances([t for t in tolerance.split(",") if t.strip()])
+            except ValueError as e:
+                print(f"❌ {e}")
+                continue
+            if candidate:
+                run_compare(baseline, candidate, overrides)
+        elif choice == "3":
+            print("👋 ออกจากโปรแกรม")
+            break
+        else:
+            print("❌ กรุณาเลือกหมายเลข 1-3")
+
+
+def main() -> int:
+    """Main function"""
+    if len(sys.argv) == 1:
+        interactive()
+        return 0
+
+    parser = argparse.ArgumentParser(description="CatCar benchmark results store")
+    parser.add_argument("--dir", default=RESULTS_DIR, help="โฟลเดอร์เก็บผล")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = sub.add_parser("list", help="แสดงผลที่บันทึกไว้")
+    list_parser.add_argument("scenario", nargs="?")
+
+    compare_parser = sub.add_parser("compare", help="เปรียบเทียบสองรอบ (exit 1 ถ้ามี regression)")
+    compare_parser.add_argument("refs", nargs="+", metavar="REF",
+                                help="[BASELINE] CANDIDATE (ไม่ใส่ baseline = รอบก่อนหน้าของ candidate)")
+    compare_parser.add_argument("--tolerance", action="append", default=[], metavar="PATTERN=VALUE",
+                                help="override tolerance เช่น '*p95=0.1' (ใส่ได้หลายครั้ง)")
+    compare_parser.add_argument("--fail-on-missing", action="store_true",
+                                help="ถือว่า metric ที่หายไปใน candidate เป็น regression")
+    compare_parser.add_argument("--all", action="store_true", help="แสดงทุก metric")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        show_runs(args.scenario, args.dir)
+        return 0
+
+    if len(args.refs) > 2:
+        parser.error("compare รับได้สูงสุดสอง reference")
+    baseline_ref, candidate_ref = (args.refs if len(args.refs) == 2 else (None, args.refs[0]))
+    try:
+        overrides = parse_tolerances(args.tolerance)
+    except ValueError as e:
+        parser.error(str(e))
+    return run_compare(baseline_ref, candidate_ref, overrides, fail_on_missing=args.fail_on_missing,
+                       show_all=args.all, results_dir=args.dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
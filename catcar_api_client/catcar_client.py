@@ -4,12 +4,35 @@ CatCar Wash Service - API Client
 Script สำหรับเรียกใช้ API endpoints ของ CatCar Wash Service
 """
 
+import argparse
+import csv
+import os
 import requests
 import json
 import sys
 import random
 import string
-from typing import Dict, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from catcar_sdk import CatCarApi, CatCarApiError, ConnectionManager
+
+# อายุ PIN ของ registration session (DeviceRegistrationService.SESSION_DURATION ฝั่ง server)
+PIN_TTL_SECONDS = 5 * 60
+
+# คอลัมน์ของไฟล์ผล bulk provisioning
+PROVISION_FIELDS = ["chip_id", "mac_address", "firmware_version", "device_id", "pin", "status", "error",
+                    "registered_at"]
+
+# ชื่อคอลัมน์ใน CSV input ที่รองรับ
+PROVISION_COLUMN_ALIASES = {
+    "chip_id": ("chip_id", "chip", "chipid"),
+    "mac_address": ("mac_address", "mac"),
+    "firmware_version": ("firmware_version", "firmware", "fw"),
+}
 
 class CatCarClient:
     def __init__(self, base_url: str = "http://localhost:3000/api/v1"):
@@ -20,11 +43,7 @@ class CatCarClient:
             base_url: Base URL ของ API server
         """
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        })
+        self.api = CatCarApi(self.base_url)
         
         # เก็บผลลัพธ์จาก API
         self.last_result: Optional[Dict] = None
@@ -53,25 +72,20 @@ class CatCarClient:
             print(f"📡 กำลังส่ง request ไปยัง: {url}")
             print(f"📋 ข้อมูลที่ส่ง: {json.dumps(payload, indent=2, ensure_ascii=False)}")
             
-            response = self.session.post(url, json=payload)
+            result = self.api.request("POST", "/devices/need-register", payload)
+            self.last_result = result  # เก็บผลลัพธ์ไว้
             
-            print(f"📊 Status Code: {response.status_code}")
+            print("✅ สำเร็จ!")
+            print(f"📌 PIN: {result['data']['pin']}")
+            print(f"🆔 Device ID: {result['data']['device_id']}")
+            print(f"💬 Message: {result['message']}")
             
-            if 200 <= response.status_code <= 299:
-                result = response.json()
-                self.last_result = result  # เก็บผลลัพธ์ไว้
-                
-                print("✅ สำเร็จ!")
-                print(f"📌 PIN: {result['data']['pin']}")
-                print(f"🆔 Device ID: {result['data']['device_id']}")
-                print(f"💬 Message: {result['message']}")
-                
-                return result
-            else:
-                print(f"❌ เกิดข้อผิดพลาด: {response.status_code}")
-                print(f"📝 Response: {response.text}")
-                return {"error": f"HTTP {response.status_code}", "message": response.text}
+            return result
                 
+        except CatCarApiError as e:
+            print(f"❌ เกิดข้อผิดพลาด: {e.status_code}")
+            print(f"📝 Response: {e}")
+            return {"error": f"HTTP {e.status_code}", "message": str(e)}
         except requests.exceptions.ConnectionError:
             print("❌ ไม่สามารถเชื่อมต่อกับ server ได้")
             print(f"🔗 ตรวจสอบว่า server ทำงานอยู่ที่: {self.base_url}")
@@ -139,6 +153,172 @@ def generate_random_data():
     
     return chip_id, mac_address, firmware_version
 
+def read_provision_csv(csv_path: str) -> List[Dict]:
+    """
+    อ่าน CSV ของอุปกรณ์ที่จะ provision (header: chip_id, mac_address, firmware_version)
+    
+    Args:
+        csv_path: path ของไฟล์ CSV
+        
+    Returns:
+        List[Dict]: แถวที่ถูกต้อง (chip_id ซ้ำจะใช้แถวแรก)
+    """
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        header = {name.strip().lower(): name for name in (reader.fieldnames or [])}
+        columns = {}
+        for field, aliases in PROVISION_COLUMN_ALIASES.items():
+            match = next((header[a] for a in aliases if a in header), None)
+            if match is None:
+                raise ValueError(f"ไม่พบคอลัมน์ {field} ใน {csv_path}")
+            columns[field] = match
+        
+        rows, seen = [], set()
+        for line_no, raw in enumerate(reader, start=2):
+            row = {field: (raw.get(column) or '').strip() for field, column in columns.items()}
+            if not all(row.values()):
+                print(f"⚠️  ข้ามบรรทัด {line_no}: ข้อมูลไม่ครบ")
+                continue
+            if row['chip_id'] in seen:
+                print(f"⚠️  ข้ามบรรทัด {line_no}: chip_id {row['chip_id']} ซ้ำ")
+                continue
+            seen.add(row['chip_id'])
+            rows.append(row)
+    return rows
+
+
+def load_provision_output(output_path: str) -> Dict[str, Dict]:
+    """
+    อ่านผล provisioning เดิม (ใช้ resume) แถวหลังสุดของแต่ละ chip_id คือผลล่าสุด
+    
+    Returns:
+        Dict[str, Dict]: chip_id -> แถวผลล่าสุด
+    """
+    if not os.path.exists(output_path):
+        return {}
+    with open(output_path, newline='', encoding='utf-8') as f:
+        return {row['chip_id']: row for row in csv.DictReader(f) if row.get('chip_id')}
+
+
+def _pin_expired(row: Dict) -> bool:
+    """PIN ของแถวนี้หมดอายุแล้วหรือยัง"""
+    try:
+        registered_at = datetime.fromisoformat(row.get('registered_at') or '')
+    except ValueError:
+        return True
+    return (datetime.now() - registered_at).total_seconds() > PIN_TTL_SECONDS
+
+
+def bulk_provision(csv_path: str, output_path: str, base_url: str = "http://localhost:3000/api/v1",
+                   concurrency: int = 10, refresh_pins: bool = False, attempts: int = 3,
+                   silent: bool = False) -> Dict:
+    """
+    Register อุปกรณ์จาก CSV พร้อมกันหลายเครื่อง แล้วบันทึก device_id / PIN ลง output CSV
+    
+    ผลแต่ละเครื่องถูก append ลง output ทันทีที่ได้ เมื่อรันซ้ำจะข้ามเครื่องที่สำเร็จแล้ว
+    (need-register ฝั่ง server คืน device เดิมถ้า chip_id มีอยู่แล้ว จึงส่งซ้ำได้อย่างปลอดภัย)
+    
+    Args:
+        csv_path: CSV ของอุปกรณ์ (chip_id, mac_address, firmware_version)
+        output_path: CSV ผลลัพธ์ (ใช้ resume ด้วย)
+        base_url: Base URL ของ API server
+        concurrency: จำนวน request พร้อมกันสูงสุด
+        refresh_pins: register ซ้ำเครื่องที่สำเร็จแล้วแต่ PIN หมดอายุ (เกิน 5 นาที) เพื่อขอ PIN ใหม่
+        attempts: จำนวนครั้งที่ลองต่อเครื่อง (connection error / 5xx)
+        silent: ไม่แสดงผลรายเครื่อง
+        
+    Returns:
+        Dict: {total, provisioned, failed, skipped, elapsed, devices_per_second}
+    """
+    rows = read_provision_csv(csv_path)
+    previous = load_provision_output(output_path)
+    pending, skipped = [], 0
+    for row in rows:
+        done = previous.get(row['chip_id'])
+        if done and done.get('status') == 'OK' and not (refresh_pins and _pin_expired(done)):
+            skipped += 1
+        else:
+            pending.append(row)
+    
+    print("\n" + "=" * 50)
+    print("📦 Bulk Device Provisioning")
+    print("=" * 50)
+    print(f"📄 Input: {csv_path} ({len(rows)} devices)")
+    print(f"💾 Output: {output_path}")
+    print(f"⏭️  ข้าม (provision แล้ว): {skipped} | 🚀 ต้อง provision: {len(pending)} | 🔀 Concurrency: {concurrency}")
+    
+    manager = ConnectionManager(pool_size=concurrency, retries=0)
+    api = CatCarApi(base_url, manager=manager)
+    write_lock = threading.Lock()
+    counts = {"OK": 0, "FAILED": 0}
+    
+    def provision(row: Dict) -> Dict:
+        result = dict(row, device_id='', pin='', status='FAILED', error='', registered_at='')
+        for attempt in range(attempts):
+            try:
+                data = api.need_register(row['chip_id'], row['mac_address'], row['firmware_version'])
+                result.update(device_id=data.get('device_id', ''), pin=data.get('pin', ''), status='OK',
+                              error='', registered_at=datetime.now().isoformat(timespec='seconds'))
+                break
+            except CatCarApiError as e:
+                result['error'] = str(e)
+                if e.status_code is not None and e.status_code < 500:
+                    break
+            except requests.exceptions.RequestException as e:
+                result['error'] = str(e)
+            if attempt < attempts - 1:
+                time.sleep(0.5 * 2 ** attempt)
+        return result
+    
+    new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = []
+    try:
+        with open(output_path, 'a', newline='', encoding='utf-8') as out:
+            writer = csv.DictWriter(out, fieldnames=PROVISION_FIELDS)
+            if new_file:
+                writer.writeheader()
+            futures = [executor.submit(provision, row) for row in pending]
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                with write_lock:
+                    writer.writerow(result)
+                    out.flush()
+                    os.fsync(out.fileno())
+                counts[result['status']] += 1
+                if not silent:
+                    if result['status'] == 'OK':
+                        print(f"✅ [{done_count}/{len(pending)}] {result['chip_id']} → "
+                              f"{result['device_id']} (PIN {result['pin']})")
+                    else:
+                        print(f"❌ [{done_count}/{len(pending)}] {result['chip_id']}: {result['error']}")
+    except KeyboardInterrupt:
+        print("\n⏹️  หยุดกลางคัน - รันคำสั่งเดิมอีกครั้งเพื่อทำต่อ")
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        manager.close()
+    
+    elapsed = time.perf_counter() - started
+    summary = {
+        "total": len(rows),
+        "provisioned": counts["OK"],
+        "failed": counts["FAILED"],
+        "skipped": skipped,
+        "elapsed": elapsed,
+        "devices_per_second": counts["OK"] / elapsed if elapsed > 0 else 0.0,
+    }
+    print("\n" + "-" * 50)
+    print(f"✅ Provisioned: {summary['provisioned']} | ❌ Failed: {summary['failed']} | ⏭️  Skipped: {skipped}")
+    print(f"⏱️  {elapsed:.1f}s | ⚡ {summary['devices_per_second']:.1f} devices/s")
+    if summary['failed']:
+        print("🔁 รันคำสั่งเดิมอีกครั้งเพื่อลองเครื่องที่ล้มเหลวใหม่")
+    print(f"⏳ PIN หมดอายุภายใน {PIN_TTL_SECONDS // 60} นาทีหลัง register (ใช้ --refresh-pins เพื่อขอใหม่)")
+    return summary
+
+
 def show_menu():
     """แสดงเมนูเลือก command"""
     print("\n" + "=" * 50)
@@ -149,7 +329,8 @@ def show_menu():
     print("2. 🎲 Random Register - สร้าง registration session ด้วยข้อมูลสุ่ม")
     print("3. 📊 View Last Result - ดูผลลัพธ์ล่าสุด")
     print("4. 🔄 Change Base URL - เปลี่ยน URL")
-    print("5. ❌ Exit - ออกจากโปรแกรม")
+    print("5. 📦 Bulk Provision - register หลายเครื่องจาก CSV")
+    print("6. ❌ Exit - ออกจากโปรแกรม")
     print("=" * 50)
 
 def handle_need_register(client: CatCarClient):
@@ -222,6 +403,25 @@ def handle_view_result(client: CatCarClient):
     else:
         print("❌ ยังไม่มีผลลัพธ์ กรุณาเรียกใช้ command อื่นก่อน")
 
+def handle_bulk_provision(client: CatCarClient):
+    """จัดการ command bulk provision"""
+    print("\n📦 Bulk Provision Command")
+    print("-" * 30)
+    
+    try:
+        csv_path = input("📄 CSV (chip_id,mac_address,firmware_version): ").strip()
+        if not csv_path or not os.path.exists(csv_path):
+            print("❌ ไม่พบไฟล์ CSV")
+            return
+        default_output = f"{os.path.splitext(csv_path)[0]}_provisioned.csv"
+        output_path = input(f"💾 Output CSV (default: {default_output}): ").strip() or default_output
+        concurrency = int(input("🔀 Concurrency (default: 10): ").strip() or "10")
+        refresh_pins = input("🔑 ขอ PIN ใหม่ให้เครื่องที่ PIN หมดอายุ? (y/N): ").strip().lower() == 'y'
+        bulk_provision(csv_path, output_path, client.base_url, concurrency=concurrency,
+                       refresh_pins=refresh_pins)
+    except ValueError as e:
+        print(f"❌ ข้อมูลไม่ถูกต้อง: {e}")
+
 def handle_change_url():
     """จัดการ command change base URL"""
     print("\n🔄 Change Base URL")
@@ -236,6 +436,22 @@ def handle_change_url():
 
 def main():
     """Main function สำหรับรัน script"""
+    if len(sys.argv) > 1 and sys.argv[1] == "provision":
+        parser = argparse.ArgumentParser(prog="catcar_client.py provision",
+                                         description="Bulk register อุปกรณ์จาก CSV (resume ได้)")
+        parser.add_argument("csv_path", help="CSV: chip_id,mac_address,firmware_version")
+        parser.add_argument("-o", "--output", help="CSV ผลลัพธ์ (default: <csv>_provisioned.csv)")
+        parser.add_argument("--base-url", default="http://localhost:3000/api/v1")
+        parser.add_argument("-c", "--concurrency", type=int, default=10)
+        parser.add_argument("--refresh-pins", action="store_true",
+                            help="register ซ้ำเครื่องที่ PIN หมดอายุเพื่อขอ PIN ใหม่")
+        parser.add_argument("--quiet", action="store_true", help="ไม่แสดงผลรายเครื่อง")
+        args = parser.parse_args(sys.argv[2:])
+        output_path = args.output or f"{os.path.splitext(args.csv_path)[0]}_provisioned.csv"
+        summary = bulk_provision(args.csv_path, output_path, args.base_url, concurrency=args.concurrency,
+                                 refresh_pins=args.refresh_pins, silent=args.quiet)
+        sys.exit(1 if summary['failed'] else 0)
+    
     print("🚗 CatCar Wash Service - API Client")
     print("=" * 50)
     
@@ -249,7 +465,7 @@ def main():
     while True:
         try:
             show_menu()
-            choice = input("👉 เลือก command (1-5): ").strip()
+            choice = input("👉 เลือก command (1-6): ").strip()
             
             if choice == "1":
                 handle_need_register(client)
@@ -263,10 +479,12 @@ def main():
                     client = CatCarClient(new_url)
                     print(f"✅ เปลี่ยน Base URL เป็น: {new_url}")
             elif choice == "5":
+                handle_bulk_provision(client)
+            elif choice == "6":
                 print("👋 ออกจากโปรแกรม")
                 break
             else:
-                print("❌ กรุณาเลือกหมายเลข 1-5")
+                print("❌ กรุณาเลือกหมายเลข 1-6")
                 
         except KeyboardInterrupt:
             print("\n\n👋 ออกจากโปรแกรม")
@@ -275,7 +493,7 @@ def main():
             print(f"❌ เกิดข้อผิดพลาด: {e}")
         
         # ถามว่าจะทำต่อหรือไม่ (ยกเว้นเมื่อเลือก exit)
-        if choice != "5":
+        if choice != "6":
             try:
                 input("\n⏸️  กด Enter เพื่อกลับไปเมนูหลัก...")
             except KeyboardInterrupt:
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+CatCar Wash Service - Client SDK
+HTTP layer กลางสำหรับ simulator / load tool ทุกตัว (blocking และ asyncio)
+
+- ConnectionManager: connection pool เดียว (requests.Session + HTTPAdapter) ปรับขนาดได้
+  พร้อม timeout และ retry (retry เฉพาะ connect error ทุก method และ 502/503/504 ของ GET)
+- CatCarApi: เรียก API แบบ blocking ไม่ print อะไร คืน data หรือ raise CatCarApiError
+- AsyncCatCarApi: method เดียวกันแบบ coroutine ใช้ pool เดียวกันผ่าน thread executor
+
+Example:
+    manager = ConnectionManager(pool_size=200)
+    api = CatCarApi("http://localhost:3000/api/v1", manager=manager)
+    device = api.need_register("ESP32-001", "AA:BB:CC:DD:EE:FF", "carwash_HW_1.0_V1.0.0")
+
+    async def main():
+        async with AsyncCatCarApi("http://localhost:3000/api/v1", manager=manager) as client:
+            statuses = await asyncio.gather(*(client.get_payment_status(c) for c in charge_ids))
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Secret key สำหรับ signature ของ device (x-signature)
+SECRET_KEY = "modernchabackdoor"
+
+DEFAULT_BASE_URL = "http://localhost:3000/api/v1"
+
+# (connect timeout, read timeout) - read ต้องมากกว่า ACK timeout ของ device command (30s)
+DEFAULT_TIMEOUT = (5.0, 35.0)
+
+# HTTP status ที่ retry ได้ (เฉพาะ method ที่ idempotent)
+RETRY_STATUSES = (502, 503, 504)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class CatCarApiError(Exception):
+    """API ตอบกลับ non-2xx หรือ success = false"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: Optional[Dict] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body or {}
+
+
+def calculate_signature(payload: Dict, secret_key: str = SECRET_KEY) -> str:
+    """
+    คำนวณ x-signature = SHA256(compact JSON ของ payload + SECRET_KEY)
+
+    Args:
+        payload: Request payload (GET ใช้ {})
+        secret_key: Secret key ของ device
+
+    Returns:
+        str: SHA256 signature (hex)
+    """
+    payload_string = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256((payload_string + secret_key).encode('utf-8')).hexdigest()
+
+
+class ConnectionManager:
+    """Connection pool เดียวที่ CatCarApi / AsyncCatCarApi ใช้ร่วมกัน"""
+
+    def __init__(self, pool_size: int = 100, timeout: Timeout = DEFAULT_TIMEOUT, retries: int = 3,
+                 backoff_factor: float = 0.2, max_workers: Optional[int] = None):
+        """
+        Initialize connection manager
+
+        Args:
+            pool_size: จำนวน connection ต่อ host ที่เก็บไว้ใช้ซ้ำ
+            timeout: timeout เริ่มต้น (วินาที หรือ (connect, read))
+            retries: จำนวน retry สูงสุด
+            backoff_factor: backoff ระหว่าง retry (0.2 → 0.2s, 0.4s, 0.8s, ...)
+            max_workers: thread สำหรับ AsyncCatCarApi (default: pool_size)
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_workers = max_workers or pool_size
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept': 'application/json'})
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread executor สำหรับ async request (สร้างเมื่อใช้ครั้งแรก)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="catcar-http")
+            return self._executor
+
+    def request(self, method: str, url: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        """ส่ง HTTP request ผ่าน pool (raise requests.RequestException เมื่อ connection / timeout error)"""
+        return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+    def close(self):
+        """ปิด executor และ connection ทั้งหมด"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_manager: Optional[ConnectionManager] = None
+_default_manager_lock = threading.Lock()
+
+
+def get_connection_manager() -> ConnectionManager:
+    """ConnectionManager กลางของ process (ใช้เมื่อไม่ได้ส่ง manager ให้ client)"""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = ConnectionManager()
+        return _default_manager
+
+
+class CatCarApi:
+    """Client แบบ blocking สำหรับ CatCar Wash Service API (ไม่ print อะไร)"""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, manager: Optional[ConnectionManager] = None,
+                 timeout: Optional[Timeout] = None, secret_key: str = SECRET_KEY):
+        """
+        Initialize the client
+
+        Args:
+            base_url: Base URL ของ API server (รวม /api/v1)
+            manager: ConnectionManager ที่ใช้ (default: get_connection_manager())
+            timeout: timeout ต่อ request (default: ของ manager)
+            secret_key: Secret key สำหรับ x-signature
+        """
+        self.base_url = base_url.rstrip('/')
+        self.manager = manager or get_connection_manager()
+        self.timeout = timeout
+        self.secret_key = secret_key
+
+    def request(self, method: str, path: str, payload: Optional[Dict] = None, signed: bool = False,
+                params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                timeout: Optional[Timeout] = None) -> Dict:
+        """
+        ส่ง request แล้วคืน response body ทั้งหมด ({success, message, data})
+
+        Args:
+            method: HTTP method
+            path: path ต่อจาก base_url เช่น "/devices/need-register"
+            payload: JSON body (None = ไม่มี body)
+            signed: ใส่ x-signature (GET ใช้ signature ของ {})
+            params: query string
+            headers: header เพิ่มเติม
+            timeout: timeout ของ request นี้
+
+        Returns:
+            Dict: response body
+
+        Raises:
+            CatCarApiError: server ตอบ non-2xx หรือ success = false
+            requests.RequestException: connection / timeout error (หลัง retry ครบ)
+        """
+        request_headers = dict(headers or {})
+        data = None
+        if payload is not None:
+            # ส่ง compact JSON ชุดเดียวกับที่ใช้คำนวณ signature
+            data = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            request_headers['Content-Type'] = 'application/json'
+        if signed:
+            request_headers['x-signature'] = calculate_signature(payload or {}, self.secret_key)
+
+        response = self.manager.request(method, f"{self.base_url}{path}", data=data, params=params,
+                                        headers=request_headers, timeout=timeout or self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if not 200 <= response.status_code <= 299:
+            message = body.get('message') if isinstance(body, dict) else None
+            raise CatCarApiError(f"HTTP {response.status_code}: {message or response.text[:200]}",
+                                 response.status_code, body if isinstance(body, dict) else None)
+        if isinstance(body, dict) and body.get('success') is False:
+            raise CatCarApiError(body.get('message') or "Request failed", response.status_code, body)
+        return body
+
+    def _data(self, *args, **kwargs) -> Dict:
+        """request แล้วคืนเฉพาะ data"""
+        return self.request(*args, **kwargs).get('data') or {}
+
+    # ---- Registration / config ----
+
+    def need_register(self, chip_id: str, mac_address: str, firmware_version: str) -> Dict:
+        """POST /devices/need-register → {pin, device_id}"""
+        return self._data("POST", "/devices/need-register", {
+            "chip_id": chip_id,
+            "mac_address": mac_address,
+            "firmware_version": firmware_version,
+        })
+
+    def sync_configs(self, device_id: str, configs: Dict) -> Dict:
+        """POST /devices/sync-configs/{device_id} (signed)"""
+        return self._data("POST", f"/devices/sync-configs/{device_id}", configs, signed=True)
+
+    # ---- Payments ----
+
+    def create_payment(self, device_id: str, amount: int, payment_method: str = "QR_PROMPT_PAY",
+                       description: str = "Car wash payment") -> Dict:
+        """POST /payment-gateway/payments (signed) → data รวม payment_results.chargeId"""
+        return self._data("POST", "/payment-gateway/payments", {
+            "device_id": device_id,
+            "amount": amount,
+            "payment_method": payment_method,
+            "description": description,
+        }, signed=True)
+
+    def get_payment_status(self, charge_id: str) -> Dict:
+        """GET /payment-gateway/payments/{charge_id}/status (signed) → {chargeId, status, ...}"""
+        return self._data("GET", f"/payment-gateway/payments/{charge_id}/status", signed=True)
+
+    # ---- Logs ----
+
+    def upload_logs(self, device_id: str, items: List[Dict]) -> Dict:
+        """POST /device-event-logs/upload (signed) → {created_count}"""
+        return self._data("POST", "/device-event-logs/upload", {"device_id": device_id, "items": items},
+                          signed=True)
+
+    # ---- Device commands (รอ ACK จาก device สูงสุด 30s) ----
+
+    def send_command(self, device_id: str, command: str, body: Optional[Dict] = None) -> Dict:
+        """
+        POST /device-commands/{device_id}/{command}
+
+        Args:
+            device_id: Device ID
+            command: path ของคำสั่ง เช่น "apply-config", "restart"
+            body: JSON body ของคำสั่ง
+
+        Returns:
+            Dict: data ที่มี status (SUCCESS / SENT / FAILED / TIMEOUT)
+        """
+        return self._data("POST", f"/device-commands/{device_id}/{command}", body)
+
+    def apply_config(self, device_id: str) -> Dict:
+        return self.send_command(device_id, "apply-config")
+
+    def restart(self, device_id: str, delay_seconds: int = 5) -> Dict:
+        return self.send_command(device_id, "restart", {"delay_seconds": delay_seconds})
+
+    def update_firmware(self, device_id: str, version: Optional[str] = None) -> Dict:
+        return self.send_command(device_id, "update-firmware", {"version": version} if version else {})
+
+    def reset_config(self, device_id: str) -> Dict:
+        return self.send_command(device_id, "reset-config")
+
+    def manual_payment(self, device_id: str, amount: int) -> Dict:
+        return self.send_command(device_id, "manual-payment", {"amount": amount})
+
+    def get_latest_firmware(self, firmware_type: str = "carwash", version: Optional[str] = None) -> Dict:
+        """GET /firmwares/latest → {version, files}"""
+        params = {"type": firmware_type}
+        if version:
+            params["version"] = version
+        return self._data("GET", "/firmwares/latest", params=params)
+
+
+class AsyncCatCarApi:
+    """Client แบบ asyncio ที่ใช้ connection pool เดียวกับ CatCarApi"""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, manager: Optional[ConnectionManager] = None,
+                 timeout: Optional[Timeout] = None, secret_key: str = SECRET_KEY):
+        """
+        Initialize the async client
+
+        Args:
+            base_url: Base URL ของ API server (รวม /api/v1)
+            manager: ConnectionManager ที่ใช้ (default: get_connection_manager())
+            timeout: timeout ต่อ request (default: ของ manager)
+            secret_key: Secret key สำหรับ x-signature
+        """
+        self.api = CatCarApi(base_url, manager=manager, timeout=timeout, secret_key=secret_key)
+        self.manager = self.api.manager
+
+    async def _run(self, func, *args, **kwargs):
+        """รัน method ของ CatCarApi บน executor ของ manager"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.manager.executor, partial(func, *args, **kwargs))
+
+    async def request(self, *args, **kwargs) -> Dict:
+        return await self._run(self.api.request, *args, **kwargs)
+
+    async def need_register(self, chip_id: str, mac_address: str, firmware_version: str) -> Dict:
+        return await self._run(self.api.need_register, chip_id, mac_address, firmware_version)
+
+    async def sync_configs(self, device_id: str, configs: Dict) -> Dict:
+        return await self._run(self.api.sync_configs, device_id, configs)
+
+    async def create_payment(self, device_id: str, amount: int, payment_method: str = "QR_PROMPT_PAY",
+                             description: str = "Car wash payment") -> Dict:
+        return await self._run(self.api.create_payment, device_id, amount, payment_method, description)
+
+    async def get_payment_status(self, charge_id: str) -> Dict:
+        return await self._run(self.api.get_payment_status, charge_id)
+
+    async def upload_logs(self, device_id: str, items: List[Dict]) -> Dict:
+        return await self._run(self.api.upload_logs, device_id, items)
+
+    async def send_command(self, device_id: str, command: str, body: Optional[Dict] = None) -> Dict:
+        return await self._run(self.api.send_command, device_id, command, body)
+
+    async def apply_config(self, device_id: str) -> Dict:
+        return await self._run(self.api.apply_config, device_id)
+
+    async def restart(self, device_id: str, delay_seconds: int = 5) -> Dict:
+        return await self._run(self.api.restart, device_id, delay_seconds)
+
+    async def update_firmware(self, device_id: str, version: Optional[str] = None) -> Dict:
+        return await self._run(self.api.update_firmware, device_id, version)
+
+    async def reset_config(self, device_id: str) -> Dict:
+        return await self._run(self.api.reset_config, device_id)
+
+    async def manual_payment(self, device_id: str, amount: int) -> Dict:
+        return await self._run(self.api.manual_payment, device_id, amount)
+
+    async def get_latest_firmware(self, firmware_type: str = "carwash", version: Optional[str] = None) -> Dict:
+        return await self._run(self.api.get_latest_firmware, firmware_type, version)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
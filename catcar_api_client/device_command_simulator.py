@@ -6,6 +6,8 @@ Simulator สำหรับจำลองอุปกรณ์ที่รั
 """
 
 import paho.mqtt.client as mqtt
+import requests
+import urllib3
 import json
 import time
 import random
@@ -14,21 +16,290 @@ import sys
 import yaml
 import os
 import hashlib
+import threading
+import heapq
+import math
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Optional, Callable
+from typing import Dict, List, Optional, Callable
 from enum import Enum
 
-# Secret key สำหรับ signature verification
-SECRET_KEY = "modernchabackdoor"
+from catcar_sdk import ConnectionManager, calculate_signature
+
+# ขนาด chunk ที่ใช้อ่าน firmware (buffer นี้ถูก reuse ต่อ worker thread)
+FIRMWARE_CHUNK_SIZE = 64 * 1024
+
+class FirmwareDownloadError(Exception):
+    """Download หรือ verification ของ firmware ล้มเหลว"""
 
 class CommandStatus(Enum):
     SUCCESS = "SUCCESS"
     FAILED = "FAILED"
     PROGRESS = "PROGRESS"
 
+class LatencyModel:
+    """
+    Distribution ของเวลาตั้งแต่รับคำสั่งจนถึงส่ง ACK
+
+    รองรับ model:
+      - constant:  {"model": "constant", "seconds": 1.0}
+      - uniform:   {"model": "uniform", "min": 0.5, "max": 1.5}
+      - lognormal: {"model": "lognormal", "median": 1.0, "sigma": 0.5}
+      - bimodal:   {"model": "bimodal", "slow_ratio": 0.05, "fast": {...}, "slow": {...}}
+      - never:     {"model": "never"}  (ไม่ส่ง ACK เลย)
+      - after:     {"model": "after", "seconds": 35}  (ACK หลัง server ส่งคำสั่งไป N วินาที)
+    """
+
+    MODELS = ("constant", "uniform", "lognormal", "bimodal", "never", "after")
+
+    def __init__(self, model: str = "constant", seconds: float = 0.0, low: float = 0.0,
+                 high: float = 0.0, median: float = 1.0, sigma: float = 0.5,
+                 slow_ratio: float = 0.0, fast: Optional['LatencyModel'] = None,
+                 slow: Optional['LatencyModel'] = None):
+        if model not in self.MODELS:
+            raise ValueError(f"Unknown latency model: {model}")
+        self.model = model
+        self.seconds = seconds
+        self.low = low
+        self.high = high
+        self.median = median
+        self.sigma = sigma
+        self.slow_ratio = slow_ratio
+        self.fast = fast
+        self.slow = slow
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencyModel':
+        """สร้าง model จาก dict ใน latency profile"""
+        model = data.get('model', 'constant')
+        if model == 'bimodal':
+            return cls(
+                model,
+                slow_ratio=float(data.get('slow_ratio', 0.05)),
+                fast=cls.from_dict(data.get('fast', {'model': 'uniform', 'min': 0.5, 'max': 1.5})),
+                slow=cls.from_dict(data.get('slow', {'model': 'uniform', 'min': 20, 'max': 40})),
+            )
+        return cls(
+            model,
+            seconds=float(data.get('seconds', 0.0)),
+            low=float(data.get('min', 0.0)),
+            high=float(data.get('max', 0.0)),
+            median=float(data.get('median', 1.0)),
+            sigma=float(data.get('sigma', 0.5)),
+        )
+
+    def ack_due(self, received_at: float, sent_at_ms: Optional[int] = None) -> Optional[float]:
+        """
+        สุ่มเวลา (epoch seconds) ที่ควรส่ง ACK
+
+        "after" นับจากเวลาที่ server ส่งคำสั่ง (sent_at_ms) model อื่นนับจากตอนที่ได้รับคำสั่ง
+        ดังนั้นเวลาที่ handler ใช้ไปนับรวมใน latency อยู่แล้ว
+
+        Args:
+            received_at: เวลาที่ได้รับคำสั่ง (epoch seconds)
+            sent_at_ms: timestamp (ms) ที่ server ส่งคำสั่ง ใช้กับ model "after"
+
+        Returns:
+            float: เวลาที่ควรส่ง ACK หรือ None ถ้าไม่ควรส่ง ACK
+        """
+        if self.model == "never":
+            return None
+        if self.model == "bimodal":
+            branch = self.slow if random.random() < self.slow_ratio else self.fast
+            return branch.ack_due(received_at, sent_at_ms)
+        if self.model == "after":
+            sent_at = sent_at_ms / 1000 if sent_at_ms is not None else received_at
+            return sent_at + self.seconds
+        if self.model == "constant":
+            return received_at + self.seconds
+        if self.model == "uniform":
+            return received_at + random.uniform(self.low, self.high)
+        return received_at + random.lognormvariate(math.log(self.median), self.sigma)
+
+    def describe(self) -> str:
+        """คำอธิบายสั้นๆ สำหรับแสดงใน banner"""
+        if self.model == "constant":
+            return f"constant {self.seconds:.2f}s"
+        if self.model == "uniform":
+            return f"uniform {self.low:.2f}-{self.high:.2f}s"
+        if self.model == "lognormal":
+            return f"lognormal median={self.median:.2f}s sigma={self.sigma:.2f}"
+        if self.model == "bimodal":
+            return f"bimodal {self.slow_ratio*100:.0f}% slow [{self.fast.describe()} | {self.slow.describe()}]"
+        if self.model == "never":
+            return "never ACK"
+        return f"ACK {self.seconds:.1f}s after send"
+
+class DeferredTask:
+    """
+    Task ที่ต้องรันต่อหลัง delay โดยไม่ครอง worker thread ระหว่างรอ
+
+    Handler คืนค่านี้ให้ KeyedCommandExecutor เพื่อพัก lane ของ key นั้นไว้
+    (คำสั่งถัดไปของ device เดียวกันยังรอตามลำดับ FIFO)
+    """
+
+    def __init__(self, delay: float, fn: Callable, *args):
+        self.delay = delay
+        self.fn = fn
+        self.args = args
+
+class CommandResultCache:
+    """
+    LRU + TTL cache ของผลลัพธ์คำสั่งตาม command_id
+
+    คำสั่งมาด้วย QoS 1 broker จึงอาจส่งซ้ำหลัง reconnect / failover
+    เก็บผลของคำสั่งที่รันแล้วไว้ เพื่อตอบคำสั่งซ้ำโดยไม่รัน handler อีกรอบ
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        """คืนผลที่ cache ไว้ หรือ None ถ้าไม่มี / หมดอายุแล้ว"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: Dict):
+        """เก็บผลลัพธ์ ถ้าเกิน max_entries จะลบตัวที่ใช้ล่าสุดนานที่สุดออก"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class KeyedCommandExecutor:
+    """
+    Worker pool ที่รัน task ตามลำดับ FIFO ภายใน key เดียวกัน (เช่น device_id)
+    แต่รัน key ต่างกันแบบขนานบน thread pool ร่วมกัน
+
+    ใช้เพื่อย้าย command handler ออกจาก paho network thread:
+    handler ที่ sleep นานจะไม่บล็อก keepalive / PUBACK / command ถัดไป
+    Task ที่คืน DeferredTask จะถูกพักไว้ใน timer แทนการ sleep บน worker
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cmd-worker")
+        self._lock = threading.Lock()
+        self._lanes: Dict[str, deque] = {}
+        self._shutdown = False
+
+        # Timer สำหรับ DeferredTask: heap ของ (due_time, seq, key)
+        self._timers: List[tuple] = []
+        self._timer_seq = 0
+        self._timer_cv = threading.Condition(self._lock)
+        self._timer_thread: Optional[threading.Thread] = None
+
+    def submit(self, key: str, fn: Callable, *args) -> bool:
+        """
+        เพิ่ม task เข้าคิวของ key
+
+        Returns:
+            bool: False ถ้า executor ถูกปิดแล้ว
+        """
+        with self._lock:
+            if self._shutdown:
+                return False
+            lane = self._lanes.get(key)
+            if lane is not None:
+                # มี worker กำลัง drain (หรือ lane ถูกพักรอ timer) → ต่อท้ายคิว
+                lane.append((fn, args))
+                return True
+            self._lanes[key] = deque([(fn, args)])
+        self._pool.submit(self._drain, key)
+        return True
+
+    def _drain(self, key: str):
+        """รัน task ของ key ทีละตัวจนคิวว่าง แล้วปล่อย lane"""
+        while True:
+            with self._lock:
+                lane = self._lanes.get(key)
+                if lane is None:
+                    return
+                if not lane:
+                    del self._lanes[key]
+                    return
+                fn, args = lane.popleft()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                print(f"❌ Error in command worker ({key}): {e}")
+                continue
+            if isinstance(result, DeferredTask):
+                with self._lock:
+                    if self._shutdown:
+                        return
+                    # ใส่ task ที่เหลือไว้หัวคิว แล้วพัก lane จนกว่า timer จะครบ
+                    lane.appendleft((result.fn, result.args))
+                    self._schedule_locked(key, result.delay)
+                return
+
+    def _schedule_locked(self, key: str, delay: float):
+        """ตั้ง timer ให้ drain lane อีกครั้งหลัง delay (ต้องถือ _lock อยู่)"""
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + max(0.0, delay), self._timer_seq, key))
+        if self._timer_thread is None:
+            self._timer_thread = threading.Thread(target=self._timer_loop, name="cmd-timer", daemon=True)
+            self._timer_thread.start()
+        self._timer_cv.notify()
+
+    def _timer_loop(self):
+        """ปล่อย lane ที่พักไว้กลับเข้า pool เมื่อถึงเวลา"""
+        with self._lock:
+            while not self._shutdown:
+                if not self._timers:
+                    self._timer_cv.wait()
+                    continue
+                due, _, key = self._timers[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._timer_cv.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._timers)
+                self._pool.submit(self._drain, key)
+
+    def pending(self) -> int:
+        """จำนวน task ที่ยังรออยู่ในคิวทุก lane (รวม task ที่พักรอ timer)"""
+        with self._lock:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def shutdown(self, wait: bool = True) -> int:
+        """
+        หยุดรับ task ใหม่ และรอ task ที่กำลังรันอยู่ (ถ้า wait=True)
+
+        Returns:
+            int: จำนวน task ที่ถูกพักรอ timer และถูกยกเลิก
+        """
+        with self._lock:
+            self._shutdown = True
+            deferred_keys = {key for _, _, key in self._timers}
+            cancelled = sum(len(self._lanes.pop(key, ())) for key in deferred_keys)
+            self._timers.clear()
+            self._timer_cv.notify_all()
+        self._pool.shutdown(wait=wait)
+        return cancelled
+
 class DeviceCommandSimulator:
     def __init__(self, device_id: str, broker_host: str = "localhost", broker_port: int = 1883, 
-                 failure_mode: str = "random"):
+                 failure_mode: str = "random", max_workers: int = 8, silent: bool = False):
         """
         Initialize Device Command Simulator
         
@@ -38,15 +309,37 @@ class DeviceCommandSimulator:
             broker_port: MQTT broker port
             failure_mode: Error simulation mode - "none" (always success), 
                          "random" (random failures), "always" (always fail)
+            max_workers: จำนวน worker thread ที่ใช้รัน command handler
+            silent: If True, don't print per-command messages (useful for fleet runs)
         """
         self.device_id = device_id
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.client: Optional[mqtt.Client] = None
         self.running = False
+        self.silent = silent
         self.commands_received = 0
         self.commands_acked = 0
         
+        # Handler ทำงานบน worker pool (FIFO ต่อ device, ขนานข้าม device)
+        self.executor = KeyedCommandExecutor(max_workers=max_workers)
+        self._publish_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        
+        # กันคำสั่งซ้ำจาก QoS 1 redelivery: key = (device_id, command_id)
+        self.command_cache = CommandResultCache()
+        self.ack_duplicates = True  # ส่ง ACK เดิมซ้ำให้คำสั่งที่ได้รับซ้ำ
+        self.duplicate_commands = 0
+        
+        # Firmware download (UPDATE_FIRMWARE) - connection pool ใช้ร่วมกันทุก worker
+        # ไม่ retry ใน pool เพราะ _download_firmware retry / resume ด้วย Range เอง
+        self.download_firmware = True
+        self.firmware_range_resume = True
+        self.firmware_max_retries = 3
+        self.http = ConnectionManager(pool_size=max(max_workers, 10), timeout=(5, 30), retries=0)
+        self._thread_local = threading.local()
+        self.download_stats = {"files": 0, "bytes": 0, "seconds": 0.0, "failures": 0, "resumes": 0}
+        
         # Error simulation configuration
         self.failure_mode = failure_mode  # "none", "random", "always"
         self.error_rates = {
@@ -58,10 +351,28 @@ class DeviceCommandSimulator:
             'MANUAL_PAYMENT': 0.05,   # 5% failure rate
         }
         
+        # ACK latency simulation (เวลาตั้งแต่รับคำสั่งจนส่ง ACK)
+        self.server_ack_timeout = 30.0  # ตรงกับ defaultTimeout ของ MqttCommandManagerService
+        # ค่า default ของแต่ละ command ใช้เมื่อไม่มีระดับไหนตั้งค่าไว้ (รวมถึง "*")
+        self.default_latency_models: Dict[str, LatencyModel] = {
+            'APPLY_CONFIG': LatencyModel('uniform', low=0.5, high=1.5),
+            'RESTART': LatencyModel('constant', seconds=0.5),
+            'UPDATE_FIRMWARE': LatencyModel('uniform', low=2.0, high=3.0),
+            'RESET_CONFIG': LatencyModel('uniform', low=0.5, high=1.5),
+            'PAYMENT': LatencyModel('constant', seconds=0.0),
+            'MANUAL_PAYMENT': LatencyModel('uniform', low=0.3, high=0.8),
+        }
+        self.latency_models: Dict[str, LatencyModel] = {}  # fleet (set_latency_model / profile default)
+        self.device_latency_models: Dict[str, Dict[str, LatencyModel]] = {}
+        self.latency_cohorts: List[tuple] = []  # [(ratio, {command: LatencyModel})]
+        self.late_acks: List[Dict] = []
+        self.acks_suppressed = 0
+        
         # Command topics
         self.command_topic = f"device/{device_id}/command"
         self.payment_topic = f"device/{device_id}/payment-status"
         self.ack_topic = f"server/{device_id}/ack"
+        self.subscribe_topics: List[str] = [self.command_topic, self.payment_topic]
         
         # Command handlers
         self.command_handlers: Dict[str, Callable] = {
@@ -91,10 +402,12 @@ class DeviceCommandSimulator:
         if rc == 0:
             print(f"✅ Device {self.device_id} เชื่อมต่อ MQTT broker สำเร็จ")
             # Subscribe to command topics
-            client.subscribe(self.command_topic, qos=1)
-            client.subscribe(self.payment_topic, qos=1)
-            print(f"📡 Subscribed to: {self.command_topic}")
-            print(f"📡 Subscribed to: {self.payment_topic}")
+            client.subscribe([(topic, 1) for topic in self.subscribe_topics])
+            if len(self.subscribe_topics) <= 10:
+                for topic in self.subscribe_topics:
+                    print(f"📡 Subscribed to: {topic}")
+            else:
+                print(f"📡 Subscribed to {len(self.subscribe_topics)} topics")
         else:
             print(f"❌ Device {self.device_id} เชื่อมต่อ MQTT broker ไม่สำเร็จ: {rc}")
     
@@ -104,73 +417,192 @@ class DeviceCommandSimulator:
             print(f"⚠️  Device {self.device_id} MQTT broker disconnected: {rc}")
     
     def _on_message(self, client, userdata, msg):
-        """MQTT message callback"""
+        """
+        MQTT message callback
+
+        รันบน paho network thread จึงทำแค่ parse แล้วส่ง handler ไปยัง worker pool
+        เพื่อไม่ให้ handler ที่ใช้เวลานานบล็อก keepalive / PUBACK
+        """
         try:
-            self.commands_received += 1
             payload_str = msg.payload.decode('utf-8')
             payload = json.loads(payload_str)
+            device_id = self._device_id_from_topic(msg.topic)
+            with self._stats_lock:
+                self.commands_received += 1
             
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            print(f"\n[{timestamp}] 📥 Received message on {msg.topic}")
-            print(f"   Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
-            
-            # Extract command info
-            command = payload.get('command', 'UNKNOWN')
-            command_id = payload.get('command_id', 'unknown')
-            require_ack = payload.get('require_ack', False)
+            if not self.silent:
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                print(f"\n[{timestamp}] 📥 Received message on {msg.topic}")
+                print(f"   Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
             
-            # Handle command
-            if command in self.command_handlers:
-                handler = self.command_handlers[command]
-                success, result_data, error_msg = handler(payload)
-                
-                # Send ACK if required
-                if require_ack:
-                    self._send_ack(
-                        command_id=command_id,
-                        command=command,
-                        status=CommandStatus.SUCCESS if success else CommandStatus.FAILED,
-                        result_data=result_data,
-                        error=error_msg
-                    )
-            else:
-                print(f"⚠️  Unknown command: {command}")
-                if require_ack:
-                    self._send_ack(
-                        command_id=command_id,
-                        command=command,
-                        status=CommandStatus.FAILED,
-                        result_data=None,
-                        error=f"Unknown command: {command}"
-                    )
+            if not self.executor.submit(device_id, self._process_command, device_id, payload, time.time()):
+                print(f"⚠️  Simulator is stopping, dropped message on {msg.topic}")
         
         except Exception as e:
             print(f"❌ Error processing message: {e}")
     
-    def _on_log(self, client, userdata, level, buf):
-        """MQTT log callback (optional)"""
-        # Uncomment for debug logging
-        # print(f"MQTT Log: {buf}")
-        pass
+    def _device_id_from_topic(self, topic: str) -> str:
+        """ดึง device_id จาก topic device/{device_id}/command"""
+        parts = topic.split('/')
+        if len(parts) == 3 and parts[0] == 'device' and parts[2] == 'command':
+            return parts[1]
+        return self.device_id
     
-    def _calculate_signature(self, payload: Dict) -> str:
+    def _process_command(self, device_id: str, payload: dict, received_at: float):
         """
-        คำนวณ signature สำหรับ ACK message
+        รัน command handler และส่ง ACK (ทำงานบน worker thread)
         
         Args:
-            payload: ACK payload
+            device_id: Device ที่รับคำสั่ง
+            payload: Command payload
+            received_at: เวลาที่ได้รับ message (epoch seconds)
             
         Returns:
-            str: SHA256 signature
+            DeferredTask ถ้า ACK ต้องรอตาม latency model, ไม่เช่นนั้น None
+        """
+        # Extract command info
+        command = payload.get('command', 'UNKNOWN')
+        command_id = payload.get('command_id', 'unknown')
+        require_ack = payload.get('require_ack', False)
+        
+        # คำสั่งซ้ำ (QoS 1 redelivery) → ตอบจากผลเดิม ไม่รัน handler ซ้ำ
+        cache_key = (device_id, payload['command_id']) if payload.get('command_id') else None
+        if cache_key is not None:
+            cached = self.command_cache.get(cache_key)
+            if cached is not None:
+                with self._stats_lock:
+                    self.duplicate_commands += 1
+                self._log(f"♻️  Duplicate {command} {command_id} - answered from cache")
+                if require_ack and self.ack_duplicates and cached['ack'] is not None:
+                    self._send_ack(*cached['ack'])
+                return None
+        
+        # Handle command
+        if command in self.command_handlers:
+            handler = self.command_handlers[command]
+            success, result_data, error_msg = handler(payload)
+        else:
+            self._log(f"⚠️  Unknown command: {command}")
+            success, result_data, error_msg = False, None, f"Unknown command: {command}"
+        
+        ack_args = (command_id, command,
+                    CommandStatus.SUCCESS if success else CommandStatus.FAILED,
+                    result_data, error_msg, device_id, payload.get('timestamp'))
+        if cache_key is not None:
+            self.command_cache.put(cache_key, {"command": command, "ack": ack_args if require_ack else None})
+        
+        if not require_ack:
+            return None
+        
+        # คำนวณเวลาที่ต้องรอก่อนส่ง ACK ตาม latency model
+        model = self._latency_model_for(device_id, command)
+        due = model.ack_due(received_at, payload.get('timestamp'))
+        if due is None:
+            with self._stats_lock:
+                self.acks_suppressed += 1
+            if cache_key is not None:
+                self.command_cache.put(cache_key, {"command": command, "ack": None})
+            self._log(f"🙊 ACK suppressed for {command_id} ({model.describe()})")
+            return None
+        
+        remaining = due - time.time()
+        if remaining > 0:
+            return DeferredTask(remaining, self._send_ack, *ack_args)
+        self._send_ack(*ack_args)
+        return None
+    
+    def _latency_model_for(self, device_id: str, command: str) -> LatencyModel:
+        """
+        เลือก latency model ตามลำดับ: device → cohort → fleet → ค่า default ของ command
+        (ในแต่ละระดับ command เฉพาะมาก่อน "*")
         """
-        # แปลง payload เป็น JSON string (ไม่มี whitespace)
-        payload_string = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+        candidates = []
+        if device_id in self.device_latency_models:
+            candidates.append(self.device_latency_models[device_id])
+        if self.latency_cohorts:
+            # แบ่ง device เข้า cohort แบบ deterministic ตาม hash ของ device_id
+            bucket = (zlib.crc32(device_id.encode('utf-8')) % 10000) / 10000
+            cumulative = 0.0
+            for ratio, models in self.latency_cohorts:
+                cumulative += ratio
+                if bucket < cumulative:
+                    candidates.append(models)
+                    break
+        candidates.append(self.latency_models)
+        candidates.append(self.default_latency_models)
         
-        # คำนวณ SHA256(payload + SECRET_KEY)
-        combined = payload_string + SECRET_KEY
-        signature = hashlib.sha256(combined.encode('utf-8')).hexdigest()
+        for models in candidates:
+            if command in models:
+                return models[command]
+            if '*' in models:
+                return models['*']
+        return LatencyModel('constant', seconds=0.0)
+    
+    def set_latency_model(self, command: str, model: LatencyModel, device_id: Optional[str] = None):
+        """
+        ตั้งค่า latency model ของ command ("*" = ทุก command)
         
-        return signature
+        Args:
+            command: Command name หรือ "*"
+            model: LatencyModel
+            device_id: ถ้าระบุ จะตั้งเฉพาะ device นั้น ไม่เช่นนั้นตั้งทั้ง fleet
+        """
+        if device_id:
+            self.device_latency_models.setdefault(device_id, {})[command] = model
+        else:
+            self.latency_models[command] = model
+        target = device_id or "fleet"
+        self._log(f"🔧 Latency for {command} ({target}) set to: {model.describe()}")
+    
+    def load_latency_profile(self, profile):
+        """
+        โหลด latency profile จาก dict หรือไฟล์ YAML/JSON
+
+        Profile format:
+            server_ack_timeout: 30
+            default:            # ทั้ง fleet
+              "*": {model: lognormal, median: 1.0, sigma: 0.6}
+              UPDATE_FIRMWARE: {model: bimodal, slow_ratio: 0.1,
+                                fast: {model: uniform, min: 2, max: 3},
+                                slow: {model: after, seconds: 35}}
+            cohorts:            # สัดส่วนของ fleet (เลือกตาม hash ของ device_id)
+              - ratio: 0.05
+                commands: {"*": {model: never}}
+            devices:            # override ราย device
+              D001: {APPLY_CONFIG: {model: constant, seconds: 45}}
+        
+        Args:
+            profile: dict หรือ path ของไฟล์ profile
+        """
+        if isinstance(profile, str):
+            with open(profile, 'r', encoding='utf-8') as f:
+                profile = yaml.safe_load(f) or {}
+        
+        def parse_models(section: Dict) -> Dict[str, LatencyModel]:
+            return {command: LatencyModel.from_dict(spec) for command, spec in (section or {}).items()}
+        
+        if 'server_ack_timeout' in profile:
+            self.server_ack_timeout = float(profile['server_ack_timeout'])
+        self.latency_models.update(parse_models(profile.get('default')))
+        self.latency_cohorts = [
+            (float(cohort.get('ratio', 0.0)), parse_models(cohort.get('commands')))
+            for cohort in profile.get('cohorts', [])
+        ]
+        for device_id, section in (profile.get('devices') or {}).items():
+            self.device_latency_models.setdefault(device_id, {}).update(parse_models(section))
+        print(f"🔧 Latency profile loaded: {len(self.latency_cohorts)} cohorts, "
+              f"{len(self.device_latency_models)} device overrides")
+    
+    def _log(self, message: str):
+        """Print message เว้นแต่อยู่ใน silent mode"""
+        if not self.silent:
+            print(message)
+    
+    def _on_log(self, client, userdata, level, buf):
+        """MQTT log callback (optional)"""
+        # Uncomment for debug logging
+        # print(f"MQTT Log: {buf}")
+        pass
     
     def _should_fail(self, command: str) -> bool:
         """
@@ -234,25 +666,22 @@ class DeviceCommandSimulator:
         Returns:
             tuple: (success: bool, result_data: dict, error: str)
         """
-        print("🔧 Handling APPLY_CONFIG command...")
+        self._log("🔧 Handling APPLY_CONFIG command...")
         
         config = payload.get('payload', {})
         
-        # Simulate processing time
-        time.sleep(random.uniform(0.5, 1.5))
-        
         # Check if should fail based on failure mode
         should_fail = self._should_fail('APPLY_CONFIG')
         
         if not should_fail:
-            print("✅ Configuration applied successfully")
+            self._log("✅ Configuration applied successfully")
             return True, {
                 "config_applied": config,
                 "timestamp": int(time.time() * 1000)
             }, None
         else:
             error = "Failed to apply configuration: Validation error"
-            print(f"❌ {error}")
+            self._log(f"❌ {error}")
             return False, None, error
     
     def _handle_restart(self, payload: dict) -> tuple:
@@ -262,28 +691,25 @@ class DeviceCommandSimulator:
         Returns:
             tuple: (success: bool, result_data: dict, error: str)
         """
-        print("🔄 Handling RESTART command...")
+        self._log("🔄 Handling RESTART command...")
         
         restart_payload = payload.get('payload', {})
         delay_seconds = restart_payload.get('delay_seconds', 5)
         
-        print(f"   Device will restart in {delay_seconds} seconds...")
-        
-        # Simulate processing time
-        time.sleep(0.5)
+        self._log(f"   Device will restart in {delay_seconds} seconds...")
         
         # Check if should fail based on failure mode
         should_fail = self._should_fail('RESTART')
         
         if not should_fail:
-            print("✅ Restart command accepted")
+            self._log("✅ Restart command accepted")
             return True, {
                 "delay_seconds": delay_seconds,
                 "restart_at": int(time.time() * 1000) + (delay_seconds * 1000)
             }, None
         else:
             error = "Failed to restart: System busy"
-            print(f"❌ {error}")
+            self._log(f"❌ {error}")
             return False, None, error
     
     def _handle_update_firmware(self, payload: dict) -> tuple:
@@ -293,7 +719,7 @@ class DeviceCommandSimulator:
         Returns:
             tuple: (success: bool, result_data: dict, error: str)
         """
-        print("📦 Handling UPDATE_FIRMWARE command...")
+        self._log("📦 Handling UPDATE_FIRMWARE command...")
 
         firmware = payload.get('payload', {})
         version = firmware.get('version', '')
@@ -303,40 +729,149 @@ class DeviceCommandSimulator:
         hw_firmware = firmware.get('HW', {})
         qr_firmware = firmware.get('QR', {})
 
-        print(f"   Version: {version}")
-        print(f"   Reboot After: {reboot_after}")
-        print(f"\n   📦 HW Firmware:")
-        print(f"      URL: {hw_firmware.get('url', '')}")
-        print(f"      SHA256: {hw_firmware.get('sha256', '')[:16]}...")
-        print(f"      Size: {hw_firmware.get('size', 0)} bytes")
-        print(f"\n   📦 QR Firmware:")
-        print(f"      URL: {qr_firmware.get('url', '')}")
-        print(f"      SHA256: {qr_firmware.get('sha256', '')[:16]}...")
-        print(f"      Size: {qr_firmware.get('size', 0)} bytes")
-
-        # Simulate download and verification time for both variants
-        print("\n   ⏳ Downloading HW firmware...")
-        time.sleep(random.uniform(1.0, 1.5))
-        print("   ⏳ Downloading QR firmware...")
-        time.sleep(random.uniform(1.0, 1.5))
+        self._log(f"   Version: {version}")
+        self._log(f"   Reboot After: {reboot_after}")
+        self._log(f"\n   📦 HW Firmware:")
+        self._log(f"      URL: {hw_firmware.get('url', '')}")
+        self._log(f"      SHA256: {hw_firmware.get('sha256', '')[:16]}...")
+        self._log(f"      Size: {hw_firmware.get('size', 0)} bytes")
+        self._log(f"\n   📦 QR Firmware:")
+        self._log(f"      URL: {qr_firmware.get('url', '')}")
+        self._log(f"      SHA256: {qr_firmware.get('sha256', '')[:16]}...")
+        self._log(f"      Size: {qr_firmware.get('size', 0)} bytes")
+
+        # Download และ verify ทั้ง HW และ QR image จาก URL ใน payload
+        downloads = {}
+        if self.download_firmware:
+            for variant, info in (('HW', hw_firmware), ('QR', qr_firmware)):
+                if not info.get('url'):
+                    continue
+                self._log(f"\n   ⏳ Downloading {variant} firmware...")
+                try:
+                    stats = self._download_firmware(info['url'], info.get('sha256', ''), info.get('size', 0))
+                except FirmwareDownloadError as e:
+                    error = f"Failed to update firmware: {variant} {e}"
+                    self._log(f"❌ {error}")
+                    return False, None, error
+                downloads[variant] = stats
+                self._log(f"   ✅ {variant}: {stats['bytes']} bytes in {stats['seconds']:.2f}s "
+                          f"({stats['mbps']:.2f} Mbit/s, resumes={stats['resumes']})")
 
         # Check if should fail based on failure mode
         should_fail = self._should_fail('UPDATE_FIRMWARE')
 
         if not should_fail:
-            print("✅ Firmware update started for both HW and QR variants")
+            self._log("✅ Firmware update started for both HW and QR variants")
             return True, {
                 "version": version,
                 "download_started": True,
                 "hw_firmware": hw_firmware.get('url', '').split('/')[-1],
                 "qr_firmware": qr_firmware.get('url', '').split('/')[-1],
+                "downloads": downloads,
                 "estimated_time": 600  # 10 minutes (longer for dual firmware)
             }, None
         else:
             error = "Failed to update firmware: Download failed"
-            print(f"❌ {error}")
+            self._log(f"❌ {error}")
             return False, None, error
     
+    def _download_buffer(self) -> bytearray:
+        """Buffer สำหรับอ่าน firmware ที่ reuse ภายใน worker thread เดียวกัน"""
+        buffer = getattr(self._thread_local, 'buffer', None)
+        if buffer is None:
+            buffer = bytearray(FIRMWARE_CHUNK_SIZE)
+            self._thread_local.buffer = buffer
+        return buffer
+    
+    def _download_firmware(self, url: str, expected_sha256: str, expected_size: int) -> Dict:
+        """
+        Stream firmware ทีละ chunk ลง buffer เดิม และคำนวณ SHA256 แบบ incremental
+        (ไม่เก็บทั้งไฟล์ใน memory) ถ้า connection หลุดจะ resume ด้วย HTTP Range
+        
+        Args:
+            url: Firmware URL
+            expected_sha256: SHA256 ที่คาดหวัง (hex)
+            expected_size: ขนาดไฟล์ที่คาดหวัง (bytes, 0 = ไม่ตรวจ)
+            
+        Returns:
+            Dict: {bytes, seconds, mbps, resumes}
+            
+        Raises:
+            FirmwareDownloadError: download ล้มเหลวหรือ size/sha256 ไม่ตรง
+        """
+        buffer = self._download_buffer()
+        view = memoryview(buffer)
+        hasher = hashlib.sha256()
+        received = 0
+        attempts = 0
+        resumes = 0
+        started = time.perf_counter()
+        
+        while True:
+            headers = {'Accept': '*/*', 'Accept-Encoding': 'identity'}
+            if received and self.firmware_range_resume:
+                headers['Range'] = f"bytes={received}-"
+            try:
+                with self.http.request("GET", url, headers=headers, stream=True) as response:
+                    if response.status_code == 200 and received:
+                        # Server ไม่รองรับ Range → เริ่มนับใหม่ทั้งไฟล์
+                        hasher = hashlib.sha256()
+                        received = 0
+                    elif response.status_code not in (200, 206):
+                        raise FirmwareDownloadError(f"HTTP {response.status_code} from {url}")
+                    
+                    while True:
+                        n = response.raw.readinto(buffer)
+                        if not n:
+                            break
+                        hasher.update(view[:n])
+                        received += n
+                        if expected_size and received > expected_size:
+                            raise FirmwareDownloadError(
+                                f"size mismatch: received more than {expected_size} bytes")
+                break
+            except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                attempts += 1
+                if attempts > self.firmware_max_retries:
+                    with self._stats_lock:
+                        self.download_stats["failures"] += 1
+                    raise FirmwareDownloadError(f"download failed after {attempts} attempts: {e}")
+                if self.firmware_range_resume and received:
+                    resumes += 1
+                else:
+                    hasher = hashlib.sha256()
+                    received = 0
+            except FirmwareDownloadError:
+                with self._stats_lock:
+                    self.download_stats["failures"] += 1
+                raise
+        
+        elapsed = time.perf_counter() - started
+        
+        error = None
+        if expected_size and received != expected_size:
+            error = f"size mismatch: expected {expected_size}, got {received}"
+        elif expected_sha256 and hasher.hexdigest() != expected_sha256.lower():
+            error = f"sha256 mismatch: expected {expected_sha256[:16]}..., got {hasher.hexdigest()[:16]}..."
+        
+        with self._stats_lock:
+            if error:
+                self.download_stats["failures"] += 1
+            else:
+                self.download_stats["files"] += 1
+                self.download_stats["bytes"] += received
+                self.download_stats["seconds"] += elapsed
+                self.download_stats["resumes"] += resumes
+        if error:
+            raise FirmwareDownloadError(error)
+        
+        return {
+            "bytes": received,
+            "seconds": round(elapsed, 4),
+            "mbps": (received * 8 / elapsed / 1_000_000) if elapsed > 0 else 0.0,
+            "resumes": resumes,
+        }
+    
     def _handle_reset_config(self, payload: dict) -> tuple:
         """
         Handle RESET_CONFIG command
@@ -344,25 +879,22 @@ class DeviceCommandSimulator:
         Returns:
             tuple: (success: bool, result_data: dict, error: str)
         """
-        print("♻️ Handling RESET_CONFIG command...")
+        self._log("♻️ Handling RESET_CONFIG command...")
         
         config = payload.get('payload', {})
         
-        # Simulate processing time
-        time.sleep(random.uniform(0.5, 1.5))
-        
         # Check if should fail based on failure mode
         should_fail = self._should_fail('RESET_CONFIG')
         
         if not should_fail:
-            print("✅ Configuration reset successfully")
+            self._log("✅ Configuration reset successfully")
             return True, {
                 "config_reset": config,
                 "timestamp": int(time.time() * 1000)
             }, None
         else:
             error = "Failed to reset configuration: Invalid config"
-            print(f"❌ {error}")
+            self._log(f"❌ {error}")
             return False, None, error
     
     def _handle_payment(self, payload: dict) -> tuple:
@@ -372,17 +904,17 @@ class DeviceCommandSimulator:
         Returns:
             tuple: (success: bool, result_data: dict, error: str)
         """
-        print("💳 Handling PAYMENT status...")
+        self._log("💳 Handling PAYMENT status...")
         
         payment_payload = payload.get('payload', {})
         charge_id = payment_payload.get('chargeId', '')
         status = payment_payload.get('status', '')
         
-        print(f"   Charge ID: {charge_id}")
-        print(f"   Status: {status}")
+        self._log(f"   Charge ID: {charge_id}")
+        self._log(f"   Status: {status}")
         
         # Payment notifications don't require ACK
-        print("✅ Payment status received")
+        self._log("✅ Payment status received")
         return True, {
             "charge_id": charge_id,
             "status": status,
@@ -396,23 +928,20 @@ class DeviceCommandSimulator:
         Returns:
             tuple: (success: bool, result_data: dict, error: str)
         """
-        print("💰 Handling MANUAL_PAYMENT command...")
+        self._log("💰 Handling MANUAL_PAYMENT command...")
         
         payment_payload = payload.get('payload', {})
         amount = payment_payload.get('amount', 0)
         expire_at = payment_payload.get('expire_at', 0)
         
-        print(f"   Amount: {amount} baht")
-        print(f"   Expire at: {expire_at}")
-        
-        # Simulate processing time
-        time.sleep(random.uniform(0.3, 0.8))
+        self._log(f"   Amount: {amount} baht")
+        self._log(f"   Expire at: {expire_at}")
         
         # Check if should fail based on failure mode
         should_fail = self._should_fail('MANUAL_PAYMENT')
         
         if not should_fail:
-            print("✅ Manual payment accepted")
+            self._log("✅ Manual payment accepted")
             return True, {
                 "amount": amount,
                 "expire_at": expire_at,
@@ -421,7 +950,7 @@ class DeviceCommandSimulator:
             }, None
         else:
             error = "Failed to process manual payment: Device busy"
-            print(f"❌ {error}")
+            self._log(f"❌ {error}")
             return False, None, error
     
     def _send_ack(
@@ -430,7 +959,9 @@ class DeviceCommandSimulator:
         command: str,
         status: CommandStatus,
         result_data: Optional[dict] = None,
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        device_id: Optional[str] = None,
+        sent_at_ms: Optional[int] = None
     ):
         """
         Send ACK response to server
@@ -441,10 +972,13 @@ class DeviceCommandSimulator:
             status: Command execution status
             result_data: Result data from command execution
             error: Error message if failed
+            device_id: Device ที่ตอบ ACK (default: self.device_id)
+            sent_at_ms: timestamp ที่ server ส่งคำสั่ง (ใช้ตรวจ ACK ที่มาหลัง server timeout)
         """
+        device_id = device_id or self.device_id
         ack_payload = {
             "command_id": command_id,
-            "device_id": self.device_id,
+            "device_id": device_id,
             "command": command,
             "status": status.value,
             "timestamp": int(time.time() * 1000)
@@ -456,18 +990,32 @@ class DeviceCommandSimulator:
             ack_payload["error"] = error
         
         # คำนวณ signature และเพิ่มเข้าไปใน payload
-        signature = self._calculate_signature(ack_payload)
+        signature = calculate_signature(ack_payload)
         ack_payload["sha256"] = signature
         
         try:
-            result = self.client.publish(self.ack_topic, json.dumps(ack_payload), qos=1)
+            # ACK ถูกส่งจากหลาย worker thread → publish ผ่าน client ภายใต้ lock
+            with self._publish_lock:
+                result = self.client.publish(f"server/{device_id}/ack", json.dumps(ack_payload), qos=1)
             
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                self.commands_acked += 1
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                status_emoji = "✅" if status == CommandStatus.SUCCESS else "❌"
-                print(f"[{timestamp}] 📤 {status_emoji} ACK sent: {command_id} - {status.value}")
-                print(f"   🔐 Signature: {signature[:16]}...")
+                with self._stats_lock:
+                    self.commands_acked += 1
+                    # ACK ที่มาหลัง server timeout แล้ว server จะ ignore (Late ACK)
+                    if sent_at_ms is not None:
+                        latency = ack_payload["timestamp"] / 1000 - sent_at_ms / 1000
+                        if latency > self.server_ack_timeout:
+                            self.late_acks.append({
+                                "command_id": command_id,
+                                "device_id": device_id,
+                                "command": command,
+                                "latency_seconds": round(latency, 3),
+                            })
+                if not self.silent:
+                    timestamp = datetime.now().strftime("%H:%M:%S")
+                    status_emoji = "✅" if status == CommandStatus.SUCCESS else "❌"
+                    print(f"[{timestamp}] 📤 {status_emoji} ACK sent: {command_id} - {status.value}")
+                    print(f"   🔐 Signature: {signature[:16]}...")
             else:
                 print(f"❌ Failed to send ACK: {result.rc}")
         
@@ -523,13 +1071,21 @@ class DeviceCommandSimulator:
         print(f"{'='*60}")
         print(f"📱 Device ID: {self.device_id}")
         print(f"🔗 MQTT Broker: {self.broker_host}:{self.broker_port}")
-        print(f"📡 Listening on: {self.command_topic}")
-        print(f"📡 Listening on: {self.payment_topic}")
+        for topic in self.subscribe_topics[:10]:
+            print(f"📡 Listening on: {topic}")
+        if len(self.subscribe_topics) > 10:
+            print(f"📡 ... and {len(self.subscribe_topics) - 10} more topics")
         print(f"⚙️  Failure Mode: {self.failure_mode}")
         if self.failure_mode == "random":
             print(f"📊 Error Rates:")
             for cmd, rate in self.error_rates.items():
                 print(f"   - {cmd}: {rate*100:.0f}%")
+        print(f"⏱️  ACK Latency (server timeout {self.server_ack_timeout:.0f}s):")
+        for cmd, default in self.default_latency_models.items():
+            model = self.latency_models.get(cmd) or self.latency_models.get('*') or default
+            print(f"   - {cmd}: {model.describe()}")
+        if self.latency_cohorts or self.device_latency_models:
+            print(f"   + {len(self.latency_cohorts)} cohorts, {len(self.device_latency_models)} device overrides")
         print(f"{'='*60}")
         print("✅ Waiting for commands... (Press Ctrl+C to stop)")
         
@@ -547,16 +1103,65 @@ class DeviceCommandSimulator:
             return
         
         self.running = False
+        # รอ handler ที่ค้างอยู่ส่ง ACK ให้เสร็จก่อนตัดการเชื่อมต่อ
+        cancelled_acks = self.executor.shutdown(wait=True)
         self.disconnect()
+        self.http.close()
         
         print(f"\n{'='*60}")
         print("📊 Simulator Statistics")
         print(f"{'='*60}")
         print(f"📥 Commands received: {self.commands_received}")
         print(f"📤 Commands acknowledged: {self.commands_acked}")
+        print(f"🙊 ACKs suppressed (never): {self.acks_suppressed}")
+        print(f"♻️  Duplicate commands (answered from cache): {self.duplicate_commands}")
+        print(f"🐢 Late ACKs (> {self.server_ack_timeout:.0f}s server timeout): {len(self.late_acks)}")
+        for late in self.late_acks[:10]:
+            print(f"   - {late['device_id']} {late['command']} {late['command_id']}: {late['latency_seconds']:.1f}s")
+        if cancelled_acks:
+            print(f"⏹️  Pending delayed ACKs cancelled on stop: {cancelled_acks}")
+        stats = self.download_stats
+        if stats["files"] or stats["failures"]:
+            # Throughput รวม = bytes ทั้งหมด / เวลา download รวมของทุกไฟล์ (ต่อ stream)
+            mbps = stats["bytes"] * 8 / stats["seconds"] / 1_000_000 if stats["seconds"] else 0.0
+            print(f"📦 Firmware downloads: {stats['files']} files, {stats['bytes']} bytes, "
+                  f"{stats['failures']} failed, {stats['resumes']} resumes, avg {mbps:.2f} Mbit/s per stream")
         print(f"{'='*60}")
         print("✅ Simulator stopped")
 
+class FleetCommandSimulator(DeviceCommandSimulator):
+    """
+    Fleet responder mode: ใช้ MQTT client เดียวตอบคำสั่งแทนหลาย device
+
+    - ระบุ device_ids → subscribe device/{id}/command ของแต่ละตัว
+    - ไม่ระบุ → subscribe wildcard device/+/command (ตอบทุก device)
+    Handler ของแต่ละ device เรียงลำดับ FIFO แต่ต่าง device รันขนานกัน
+    """
+
+    def __init__(self, device_ids: Optional[List[str]] = None, broker_host: str = "localhost",
+                 broker_port: int = 1883, failure_mode: str = "random", max_workers: int = 32,
+                 silent: bool = True):
+        """
+        Initialize Fleet Command Simulator
+        
+        Args:
+            device_ids: Device ที่ต้องการจำลอง (None = ทุก device ผ่าน wildcard)
+            broker_host: MQTT broker host
+            broker_port: MQTT broker port
+            failure_mode: "none", "random", หรือ "always"
+            max_workers: จำนวน worker thread ที่ใช้ร่วมกันทุก device
+            silent: If True, don't print per-command messages
+        """
+        super().__init__("fleet", broker_host, broker_port, failure_mode,
+                         max_workers=max_workers, silent=silent)
+        self.device_ids = list(device_ids) if device_ids else []
+        # cache ใช้ร่วมกันทุก device จึงต้องใหญ่กว่าแบบ device เดียว
+        self.command_cache = CommandResultCache(max_entries=100000)
+        if self.device_ids:
+            self.subscribe_topics = [f"device/{device_id}/command" for device_id in self.device_ids]
+        else:
+            self.subscribe_topics = ["device/+/command"]
+
 def load_docker_compose_config() -> tuple:
     """
     Load MQTT configuration from docker-compose.develop.yml
@@ -599,6 +1204,7 @@ def main():
     print("="*60)
     
     # Get device ID from user
+    print("💡 ใส่หลาย Device ID คั่นด้วย comma หรือ * เพื่อตอบทุก device (fleet mode)")
     device_id = input("🆔 Enter Device ID (e.g., D001): ").strip()
     
     if not device_id:
@@ -624,7 +1230,20 @@ def main():
     print(f"🔗 MQTT Broker: {broker_host}:{broker_port}")
     
     # Initialize and start simulator
-    simulator = DeviceCommandSimulator(device_id, broker_host, broker_port, failure_mode)
+    if device_id == "*" or "," in device_id:
+        device_ids = None if device_id == "*" else [d.strip() for d in device_id.split(",") if d.strip()]
+        simulator = FleetCommandSimulator(device_ids, broker_host, broker_port, failure_mode)
+    else:
+        simulator = DeviceCommandSimulator(device_id, broker_host, broker_port, failure_mode)
+    
+    # Optional latency profile
+    profile_path = input("⏱️  Latency profile (YAML/JSON, Enter = default): ").strip()
+    if profile_path:
+        try:
+            simulator.load_latency_profile(profile_path)
+        except Exception as e:
+            print(f"⚠️  ไม่สามารถโหลด latency profile ได้: {e} ใช้ค่า default")
+    
     simulator.start()
 
 if __name__ == "__main__":
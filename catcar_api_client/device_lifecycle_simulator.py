@@ -5,10 +5,8 @@ Simulator สำหรับจำลอง device lifecycle แบบสมบ
 1. Register → 2. Sync Configs → 3. Stream State ผ่าน MQTT
 """
 
-import requests
 import paho.mqtt.client as mqtt
 import json
-import hashlib
 import time
 import random
 import string
@@ -19,8 +17,7 @@ from typing import Dict, List, Optional
 from datetime import datetime
 from enum import Enum
 
-# Secret key สำหรับ signature verification
-SECRET_KEY = "modernchabackdoor"
+from catcar_sdk import CatCarApi, CatCarApiError
 
 class DeviceType(Enum):
     WASH = "WASH"
@@ -51,12 +48,8 @@ class DeviceLifecycleSimulator:
         # Device registry
         self.devices: Dict[str, Dict] = {}
         
-        # HTTP Session
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        })
+        # HTTP ผ่าน connection pool กลางของ catcar_sdk
+        self.api = CatCarApi(self.api_base_url)
         
         # Streaming control
         self.running = False
@@ -73,26 +66,6 @@ class DeviceLifecycleSimulator:
         self.stop_all_streaming()
         sys.exit(0)
     
-    def _calculate_signature(self, payload: Dict) -> str:
-        """
-        คำนวณ signature สำหรับ HTTP request
-        SHA256(payload_string + SECRET_KEY)
-        
-        Args:
-            payload: Request payload
-            
-        Returns:
-            str: SHA256 signature
-        """
-        # แปลง payload เป็น JSON string (ไม่มี whitespace)
-        payload_string = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
-        
-        # คำนวณ SHA256(payload + SECRET_KEY)
-        combined = payload_string + SECRET_KEY
-        signature = hashlib.sha256(combined.encode('utf-8')).hexdigest()
-        
-        return signature
-    
     def _generate_random_device_info(self, device_type: DeviceType) -> Dict:
         """
         สร้าง random device information
@@ -230,48 +203,43 @@ class DeviceLifecycleSimulator:
             if chip_id:
                 device_info['chip_id'] = chip_id
             
-            url = f"{self.api_base_url}/devices/need-register"
-            
             if not silent:
                 print(f"\n📡 กำลัง Register Device ({device_type.value})...")
                 print(f"   Chip ID: {device_info['chip_id']}")
                 print(f"   MAC: {device_info['mac_address']}")
                 print(f"   Firmware: {device_info['firmware_version']}")
             
-            response = self.session.post(url, json=device_info)
+            data = self.api.request("POST", "/devices/need-register", device_info)['data']
+            device_id = data['device_id']
+            pin = data['pin']
             
-            if 200 <= response.status_code <= 299:
-                result = response.json()
-                device_id = result['data']['device_id']
-                pin = result['data']['pin']
-                
-                if not silent:
-                    print(f"✅ Register สำเร็จ!")
-                    print(f"   Device ID: {device_id}")
-                    print(f"   PIN: {pin}")
-                
-                # เก็บข้อมูล device
-                self.devices[device_id] = {
-                    "type": device_type,
-                    "info": device_info,
-                    "pin": pin,
-                    "status": DeviceStatus.NORMAL,
-                    "uptime": 0,
-                    "message_count": 0,
-                    "start_time": time.time(),
-                    "last_rssi": random.randint(-90, -40),
-                    "client": None,
-                    "registered": True,
-                    "synced": False
-                }
-                
-                return device_id
-            else:
-                if not silent:
-                    print(f"❌ Register ไม่สำเร็จ: {response.status_code}")
-                    print(f"   Response: {response.text}")
-                return None
+            if not silent:
+                print(f"✅ Register สำเร็จ!")
+                print(f"   Device ID: {device_id}")
+                print(f"   PIN: {pin}")
+            
+            # เก็บข้อมูล device
+            self.devices[device_id] = {
+                "type": device_type,
+                "info": device_info,
+                "pin": pin,
+                "status": DeviceStatus.NORMAL,
+                "uptime": 0,
+                "message_count": 0,
+                "start_time": time.time(),
+                "last_rssi": random.randint(-90, -40),
+                "client": None,
+                "registered": True,
+                "synced": False
+            }
+            
+            return device_id
                 
+        except CatCarApiError as e:
+            if not silent:
+                print(f"❌ Register ไม่สำเร็จ: {e.status_code}")
+                print(f"   Response: {e}")
+            return None
         except Exception as e:
             if not silent:
                 print(f"❌ เกิดข้อผิดพลาดในการ register: {e}")
@@ -304,35 +272,26 @@ class DeviceLifecycleSimulator:
             else:  # DRYING
                 config_payload = self._generate_random_drying_config()
             
-            # คำนวณ signature
-            signature = self._calculate_signature(config_payload)
-            
-            url = f"{self.api_base_url}/devices/sync-configs/{device_id}"
-            headers = {
-                'x-signature': signature
-            }
-            
             if not silent:
                 print(f"\n🔄 กำลัง Sync Configs สำหรับ {device_id}...")
                 print(f"   Device Type: {device_type.value}")
             
-            response = self.session.post(url, json=config_payload, headers=headers)
+            self.api.sync_configs(device_id, config_payload)
             
-            if 200 <= response.status_code <= 299:
-                if not silent:
-                    print(f"✅ Sync Configs สำเร็จ!")
-                
-                # อัพเดทสถานะ
-                device['synced'] = True
-                device['config'] = config_payload
-                
-                return True
-            else:
-                if not silent:
-                    print(f"❌ Sync Configs ไม่สำเร็จ: {response.status_code}")
-                    print(f"   Response: {response.text}")
-                return False
+            if not silent:
+                print(f"✅ Sync Configs สำเร็จ!")
+            
+            # อัพเดทสถานะ
+            device['synced'] = True
+            device['config'] = config_payload
+            
+            return True
                 
+        except CatCarApiError as e:
+            if not silent:
+                print(f"❌ Sync Configs ไม่สำเร็จ: {e.status_code}")
+                print(f"   Response: {e}")
+            return False
         except Exception as e:
             if not silent:
                 print(f"❌ เกิดข้อผิดพลาดในการ sync configs: {e}")
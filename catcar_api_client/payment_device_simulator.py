@@ -8,18 +8,35 @@ Simulator สำหรับจำลองการจ่ายเงินผ
 import requests
 import paho.mqtt.client as mqtt
 import json
-import hashlib
+import heapq
+import os
+import random
 import time
 import threading
 import sys
 import qrcode
-from typing import Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
 from enum import Enum
 from datetime import datetime
 
+from benchmark_results import load_device_ids, percentile, prompt_save_run
+from catcar_sdk import CatCarApi, CatCarApiError, ConnectionManager, calculate_signature
+
 # Secret key สำหรับ signature verification
 SECRET_KEY = "modernchabackdoor"
 
+# สัดส่วน arrival rate ต่อชั่วโมง (00:00-23:00) ของร้านล้างรถ ใช้กับ diurnal load
+# 1.0 = peak rate (ช่วงเย็นหลังเลิกงาน)
+DIURNAL_PROFILE = [
+    0.05, 0.03, 0.02, 0.02, 0.03, 0.08, 0.20, 0.35, 0.45, 0.50, 0.55, 0.60,
+    0.65, 0.60, 0.55, 0.60, 0.75, 0.95, 1.00, 0.90, 0.70, 0.45, 0.25, 0.10,
+]
+
+# จำนวนเงินที่สุ่มใช้ใน load test (satang)
+LOAD_TEST_AMOUNTS = [2000, 4000, 6000, 8000, 10000]
+
 class PaymentMethod(Enum):
     QR_PROMPT_PAY = "QR_PROMPT_PAY"
 
@@ -29,12 +46,115 @@ class PaymentStatus(Enum):
     FAILED = "FAILED"
     CANCELLED = "CANCELLED"
 
+FINAL_PAYMENT_STATUSES = (PaymentStatus.SUCCEEDED.value, PaymentStatus.FAILED.value,
+                          PaymentStatus.CANCELLED.value)
+
+class PendingPaymentStatus:
+    """Charge ที่รอ PAYMENT status (complete ทันทีที่ได้รับ final status)"""
+    
+    def __init__(self, charge_id: str, callback: Optional[Callable] = None):
+        self.charge_id = charge_id
+        self.callback = callback
+        self.registered_at = time.perf_counter()
+        self.received_at: Optional[float] = None
+        self.status: Optional[str] = None
+        self.event = threading.Event()
+    
+    def wait(self, timeout: Optional[float] = None) -> Optional[str]:
+        """รอ final status คืน status หรือ None ถ้า timeout"""
+        return self.status if self.event.wait(timeout) else None
+    
+    @property
+    def elapsed_ms(self) -> Optional[float]:
+        """เวลาตั้งแต่ register จนได้รับ status (ms)"""
+        if self.received_at is None:
+            return None
+        return (self.received_at - self.registered_at) * 1000
+
+class PaymentStatusDispatcher:
+    """
+    กระจาย PAYMENT status จาก wildcard subscription เดียว (device/+/payment-status)
+    ไปยัง charge ที่รออยู่ โดยแต่ละ charge มี threading.Event ของตัวเอง
+    
+    status ที่มาถึงก่อน register (server ตอบเร็วกว่าที่ client ได้ chargeId)
+    จะถูกเก็บไว้ใน buffer แล้ว complete ทันทีตอน register
+    """
+    
+    TOPIC = "device/+/payment-status"
+    
+    def __init__(self, max_early: int = 10000):
+        self.max_early = max_early
+        self._lock = threading.Lock()
+        self._pending: Dict[str, PendingPaymentStatus] = {}
+        self._early: OrderedDict = OrderedDict()  # charge_id -> (status, received_at)
+        self.unmatched = 0
+    
+    def register(self, charge_id: str, callback: Optional[Callable] = None) -> PendingPaymentStatus:
+        """
+        เริ่มรอ status ของ charge
+        
+        Args:
+            charge_id: Charge ID
+            callback: เรียก callback(pending) เมื่อได้รับ final status (บน MQTT thread)
+        """
+        pending = PendingPaymentStatus(charge_id, callback)
+        with self._lock:
+            early = self._early.pop(charge_id, None)
+            if early is None:
+                self._pending[charge_id] = pending
+        if early is not None:
+            self._complete(pending, *early)
+        return pending
+    
+    def cancel(self, charge_id: str) -> Optional[PendingPaymentStatus]:
+        """เลิกรอ status ของ charge (เช่น timeout แล้ว fallback HTTP)"""
+        with self._lock:
+            return self._pending.pop(charge_id, None)
+    
+    def is_pending(self, charge_id: str) -> bool:
+        with self._lock:
+            return charge_id in self._pending
+    
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+    
+    def dispatch(self, charge_id: str, status: str, received_at: Optional[float] = None) -> bool:
+        """
+        ส่ง status ให้ charge ที่รออยู่ (เรียกจาก MQTT on_message หลัง verify signature)
+        
+        Returns:
+            bool: True ถ้ามี charge รอ status นี้อยู่
+        """
+        received_at = received_at if received_at is not None else time.perf_counter()
+        if status not in FINAL_PAYMENT_STATUSES:
+            return self.is_pending(charge_id)
+        with self._lock:
+            pending = self._pending.pop(charge_id, None)
+            if pending is None:
+                self.unmatched += 1
+                self._early[charge_id] = (status, received_at)
+                while len(self._early) > self.max_early:
+                    self._early.popitem(last=False)
+                return False
+        self._complete(pending, status, received_at)
+        return True
+    
+    @staticmethod
+    def _complete(pending: PendingPaymentStatus, status: str, received_at: float):
+        pending.status = status
+        pending.received_at = max(received_at, pending.registered_at)
+        pending.event.set()
+        if pending.callback:
+            pending.callback(pending)
+
 class PaymentDeviceSimulator:
     def __init__(self, 
                  device_id: str,
                  api_base_url: str = "http://localhost:3000/api/v1",
                  mqtt_broker: str = "localhost",
-                 mqtt_port: int = 1883):
+                 mqtt_port: int = 1883,
+                 silent: bool = False):
         """
         Initialize Payment Device Simulator
         
@@ -43,74 +163,56 @@ class PaymentDeviceSimulator:
             api_base_url: Base URL ของ API server
             mqtt_broker: MQTT broker host
             mqtt_port: MQTT broker port
+            silent: If True, don't print per-message MQTT output (useful for load runs)
         """
         self.device_id = device_id
         self.api_base_url = api_base_url.rstrip('/')
         self.mqtt_broker = mqtt_broker
         self.mqtt_port = mqtt_port
+        self.silent = silent
         
-        # HTTP Session
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        })
+        # HTTP ผ่าน connection pool กลางของ catcar_sdk
+        self.api = CatCarApi(self.api_base_url)
         
         # MQTT Client
         self.mqtt_client = None
         self.mqtt_connected = False
         self.payment_status_received = False
         self.current_payment_status = None
-        self.listening_charge_id = None
+        
+        # PAYMENT status ทุก charge มาทาง wildcard subscription เดียว
+        self.status_dispatcher = PaymentStatusDispatcher()
         
         # Payment data
         self.last_charge_id = None
         self.last_payment_data = None
         
-    def _calculate_signature(self, payload: Dict) -> str:
-        """
-        คำนวณ signature สำหรับ HTTP request
-        
-        Args:
-            payload: Request payload
-            
-        Returns:
-            str: SHA256 signature
-        """
-        # แปลง payload เป็น JSON string (ไม่มี whitespace)
-        payload_string = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
-        
-        # คำนวณ SHA256(payload + SECRET_KEY)
-        combined = payload_string + SECRET_KEY
-        signature = hashlib.sha256(combined.encode('utf-8')).hexdigest()
-        
-        return signature
-    
-    def _verify_mqtt_signature(self, mqtt_payload: Dict) -> bool:
+    def _verify_mqtt_signature(self, mqtt_payload: Dict, quiet: bool = False) -> bool:
         """
         ตรวจสอบ signature จาก MQTT message
         
         Args:
             mqtt_payload: MQTT message payload (มี field sha256)
+            quiet: ไม่แสดงรายละเอียดเมื่อ signature ไม่ถูกต้อง
             
         Returns:
             bool: True ถ้า signature ถูกต้อง
         """
         if 'sha256' not in mqtt_payload:
-            print("⚠️  MQTT message ไม่มี signature")
+            if not quiet:
+                print("⚠️  MQTT message ไม่มี signature")
             return False
         
         received_signature = mqtt_payload.pop('sha256')
         
-        # คำนวณ signature ที่คาดหวัง
-        payload_string = json.dumps(mqtt_payload, separators=(',', ':'), ensure_ascii=False)
-        combined = payload_string + SECRET_KEY
-        expected_signature = hashlib.sha256(combined.encode('utf-8')).hexdigest()
+        # คำนวณ signature ที่คาดหวัง (สูตรเดียวกับ x-signature ของ HTTP)
+        expected_signature = calculate_signature(mqtt_payload, SECRET_KEY)
         
         if received_signature != expected_signature:
-            print(f"⚠️  MQTT signature ไม่ถูกต้อง")
-            print(f"   Expected: {expected_signature}")
-            print(f"   Received: {received_signature}")
+            if not quiet:
+                print(f"⚠️  MQTT signature ไม่ถูกต้อง")
+                print(f"   Expected: {expected_signature}")
+                print(f"   Received: {received_signature}")
             return False
         
         return True
@@ -120,6 +222,8 @@ class PaymentDeviceSimulator:
         if rc == 0:
             self.mqtt_connected = True
             print(f"✅ เชื่อมต่อ MQTT broker สำเร็จ")
+            # Subscribe ตอน connect เพื่อให้ subscribe ใหม่อัตโนมัติหลัง reconnect
+            client.subscribe(PaymentStatusDispatcher.TOPIC, qos=1)
         else:
             self.mqtt_connected = False
             print(f"❌ เชื่อมต่อ MQTT broker ไม่สำเร็จ: {rc}")
@@ -133,41 +237,41 @@ class PaymentDeviceSimulator:
     def _on_mqtt_message(self, client, userdata, msg):
         """MQTT message callback"""
         try:
+            received_at = time.perf_counter()
             # Parse JSON message
             payload = json.loads(msg.payload.decode('utf-8'))
             
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            print(f"\n[{timestamp}] 📨 ได้รับ MQTT message จาก topic: {msg.topic}")
-            print(f"📋 Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
+            payment_payload = payload.get('payload', {}) if payload.get('command') == 'PAYMENT' else {}
+            charge_id = payment_payload.get('chargeId')
+            status = payment_payload.get('status')
+            # wildcard subscription ได้ status ของทุก charge แสดงเฉพาะ charge ที่รออยู่
+            verbose = not self.silent and bool(charge_id) and self.status_dispatcher.is_pending(charge_id)
+            
+            if verbose:
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                print(f"\n[{timestamp}] 📨 ได้รับ MQTT message จาก topic: {msg.topic}")
+                print(f"📋 Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
             
             # ตรวจสอบ signature
             payload_copy = payload.copy()
-            if not self._verify_mqtt_signature(payload_copy):
-                print("❌ Signature verification ล้มเหลว - ปฏิเสธ message")
+            if not self._verify_mqtt_signature(payload_copy, quiet=not verbose):
+                if verbose:
+                    print("❌ Signature verification ล้มเหลว - ปฏิเสธ message")
                 return
             
-            print("✅ Signature verification สำเร็จ")
-            
             # ตรวจสอบว่าเป็น payment status message หรือไม่
-            if 'command' in payload and payload['command'] == 'PAYMENT':
-                payment_payload = payload.get('payload', {})
-                charge_id = payment_payload.get('chargeId')
-                status = payment_payload.get('status')
-                
-                if charge_id and status:
+            if charge_id and status:
+                if verbose:
+                    print("✅ Signature verification สำเร็จ")
                     print(f"💳 Payment Status Update:")
                     print(f"   Charge ID: {charge_id}")
                     print(f"   Status: {status}")
-                    
+                    if status in FINAL_PAYMENT_STATUSES:
+                        print(f"🏁 Payment {status}")
+                
+                if self.status_dispatcher.dispatch(charge_id, status, received_at):
                     self.current_payment_status = status
                     self.payment_status_received = True
-                    
-                    # ถ้าเป็น final status ให้ unsubscribe
-                    if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                        print(f"🏁 Payment {status} - หยุด listening")
-                        if self.listening_charge_id:
-                            self.mqtt_client.unsubscribe(f"device/{self.listening_charge_id}/payment-status")
-                            self.listening_charge_id = None
             
         except json.JSONDecodeError as e:
             print(f"❌ ไม่สามารถ parse MQTT message ได้: {e}")
@@ -238,13 +342,8 @@ class PaymentDeviceSimulator:
             "description": description
         }
         
-        # คำนวณ signature
-        signature = self._calculate_signature(payload)
-        
-        # เพิ่ม signature ใน header
-        headers = {
-            'x-signature': signature
-        }
+        # signature ที่ CatCarApi ใส่ใน x-signature (แสดงเพื่อ debug)
+        signature = calculate_signature(payload, SECRET_KEY)
         
         try:
             print(f"\n📡 กำลังส่ง payment request ไปยัง: {url}")
@@ -254,65 +353,60 @@ class PaymentDeviceSimulator:
             print(f"📝 Description: {description}")
             print(f"🔐 Signature: {signature}")
             
-            response = self.session.post(url, json=payload, headers=headers)
+            result = self.api.request("POST", "/payment-gateway/payments", payload, signed=True)
             
-            print(f"📊 Status Code: {response.status_code}")
+            print("✅ สร้าง payment สำเร็จ!")
             
-            if 200 <= response.status_code <= 299:
-                result = response.json()
-                
-                print("✅ สร้าง payment สำเร็จ!")
-                
-                # เก็บข้อมูล payment
-                self.last_payment_data = result['data']
-                self.last_charge_id = result['data'].get('id')
-                
-                payment_results = result['data'].get('payment_results', {})
-                charge_id = payment_results.get('chargeId')
-                encoded_image = payment_results.get('encodedImage', {})
-                
-                print(f"\n💳 Payment Information:")
-                print(f"   Payment ID: {result['data'].get('id')}")
-                print(f"   Charge ID: {charge_id}")
-                print(f"   Reference ID: {result['data'].get('reference_id')}")
-                print(f"   Status: {result['data'].get('status')}")
-                print(f"   Amount: {result['data'].get('amount')}")
-                
-                if encoded_image:
-                    print(f"\n📱 QR Code Information:")
-                    print(f"   Expiry: {encoded_image.get('expiry')}")
-                    raw_data = encoded_image.get('rawData')
-                    if raw_data:
-                        print(f"   Raw Data: {raw_data[:50]}...")
-                        # แสดง QR Code
-                        self._display_qr_code(raw_data)
+            # เก็บข้อมูล payment
+            self.last_payment_data = result['data']
+            self.last_charge_id = result['data'].get('id')
+            
+            payment_results = result['data'].get('payment_results', {})
+            charge_id = payment_results.get('chargeId')
+            encoded_image = payment_results.get('encodedImage', {})
+            
+            print(f"\n💳 Payment Information:")
+            print(f"   Payment ID: {result['data'].get('id')}")
+            print(f"   Charge ID: {charge_id}")
+            print(f"   Reference ID: {result['data'].get('reference_id')}")
+            print(f"   Status: {result['data'].get('status')}")
+            print(f"   Amount: {result['data'].get('amount')}")
+            
+            if encoded_image:
+                print(f"\n📱 QR Code Information:")
+                print(f"   Expiry: {encoded_image.get('expiry')}")
+                raw_data = encoded_image.get('rawData')
+                if raw_data:
+                    print(f"   Raw Data: {raw_data[:50]}...")
+                    # แสดง QR Code
+                    self._display_qr_code(raw_data)
+            
+            # Auto listen payment status
+            if auto_listen and charge_id:
+                print(f"\n🔄 Auto listening payment status...")
+                status = self.listen_payment_status(charge_id, timeout)
                 
-                # Auto listen payment status
-                if auto_listen and charge_id:
-                    print(f"\n🔄 Auto listening payment status...")
-                    status = self.listen_payment_status(charge_id, timeout)
-                    
-                    if status:
-                        print(f"\n✅ Payment {status}")
-                        if status == PaymentStatus.SUCCEEDED.value:
-                            print("🎉 การชำระเงินสำเร็จ!")
-                        elif status == PaymentStatus.FAILED.value:
-                            print("❌ การชำระเงินล้มเหลว")
-                        elif status == PaymentStatus.CANCELLED.value:
-                            print("🚫 การชำระเงินถูกยกเลิก")
-                    else:
-                        # Timeout - Fallback to HTTP
-                        print("\n⏰ Timeout - Fallback ไปตรวจสอบผ่าน HTTP...")
-                        self.check_payment_status(charge_id)
-                    
-                    print("\n✅ Payment session จบแล้ว")
+                if status:
+                    print(f"\n✅ Payment {status}")
+                    if status == PaymentStatus.SUCCEEDED.value:
+                        print("🎉 การชำระเงินสำเร็จ!")
+                    elif status == PaymentStatus.FAILED.value:
+                        print("❌ การชำระเงินล้มเหลว")
+                    elif status == PaymentStatus.CANCELLED.value:
+                        print("🚫 การชำระเงินถูกยกเลิก")
+                else:
+                    # Timeout - Fallback to HTTP
+                    print("\n⏰ Timeout - Fallback ไปตรวจสอบผ่าน HTTP...")
+                    self.check_payment_status(charge_id)
                 
-                return result
-            else:
-                print(f"❌ เกิดข้อผิดพลาด: {response.status_code}")
-                print(f"📝 Response: {response.text}")
-                return None
+                print("\n✅ Payment session จบแล้ว")
+            
+            return result
                 
+        except CatCarApiError as e:
+            print(f"❌ เกิดข้อผิดพลาด: {e.status_code}")
+            print(f"📝 Response: {e}")
+            return None
         except requests.exceptions.ConnectionError:
             print("❌ ไม่สามารถเชื่อมต่อกับ server ได้")
             print(f"🔗 ตรวจสอบว่า server ทำงานอยู่ที่: {self.api_base_url}")
@@ -359,6 +453,8 @@ class PaymentDeviceSimulator:
         """
         Listen payment status จาก MQTT
         
+        รอบน Event ของ charge ใน status_dispatcher (complete ทันทีที่ message มาถึง)
+        
         Args:
             charge_id: Charge ID จาก payment response
             timeout: Timeout ในหน่วยวินาที
@@ -371,40 +467,32 @@ class PaymentDeviceSimulator:
             if not self.connect_mqtt():
                 return None
         
-        topic = f"device/{charge_id}/payment-status"
-        
         print(f"\n📡 กำลัง listen payment status จาก MQTT")
-        print(f"📋 Topic: {topic}")
+        print(f"📋 Topic: device/{charge_id}/payment-status")
         print(f"⏱️  Timeout: {timeout} วินาที")
         
         # Reset status
         self.payment_status_received = False
         self.current_payment_status = None
-        self.listening_charge_id = charge_id
-        
-        # Subscribe to topic
-        self.mqtt_client.subscribe(topic)
-        print(f"✅ Subscribe topic สำเร็จ")
         
-        # รอรับ message
-        start_time = time.time()
-        while not self.payment_status_received and (time.time() - start_time) < timeout:
-            elapsed = int(time.time() - start_time)
-            remaining = timeout - elapsed
-            
-            if elapsed % 10 == 0 and elapsed > 0:
-                print(f"⏳ กำลังรอ payment status... (เหลือ {remaining} วินาที)")
-            
-            time.sleep(1)
+        pending = self.status_dispatcher.register(charge_id)
         
-        # Unsubscribe
-        self.mqtt_client.unsubscribe(topic)
-        self.listening_charge_id = None
+        # รอรับ message (แจ้งเวลาที่เหลือทุก 10 วินาที)
+        deadline = pending.registered_at + timeout
+        status = None
+        while status is None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            status = pending.wait(min(10.0, remaining))
+            if status is None and deadline - time.perf_counter() > 0:
+                print(f"⏳ กำลังรอ payment status... (เหลือ {int(deadline - time.perf_counter())} วินาที)")
         
-        if self.payment_status_received:
-            print(f"\n✅ ได้รับ payment status: {self.current_payment_status}")
-            return self.current_payment_status
+        if status is not None:
+            print(f"\n✅ ได้รับ payment status: {status} ({pending.elapsed_ms:.0f} ms)")
+            return status
         else:
+            self.status_dispatcher.cancel(charge_id)
             print(f"\n⏰ Timeout - ไม่ได้รับ payment status ภายใน {timeout} วินาที")
             return None
     
@@ -420,46 +508,471 @@ class PaymentDeviceSimulator:
         """
         url = f"{self.api_base_url}/payment-gateway/payments/{charge_id}/status"
         
-        # คำนวณ signature (empty payload สำหรับ GET request)
-        payload = {}
-        signature = self._calculate_signature(payload)
-        
-        headers = {
-            'x-signature': signature
-        }
+        # GET ใช้ signature ของ empty payload
+        signature = calculate_signature({}, SECRET_KEY)
         
         try:
             print(f"\n📡 กำลังตรวจสอบ payment status ผ่าน HTTP")
             print(f"📋 URL: {url}")
             print(f"🔐 Signature: {signature}")
             
-            response = self.session.get(url, headers=headers)
+            result = self.api.request("GET", f"/payment-gateway/payments/{charge_id}/status", signed=True)
             
-            print(f"📊 Status Code: {response.status_code}")
+            print("✅ ตรวจสอบ payment status สำเร็จ!")
             
-            if 200 <= response.status_code <= 299:
-                result = response.json()
-                
-                print("✅ ตรวจสอบ payment status สำเร็จ!")
-                
-                charge_id = result['data'].get('chargeId')
-                status = result['data'].get('status')
-                
-                print(f"\n💳 Payment Status:")
-                print(f"   Charge ID: {charge_id}")
-                print(f"   Status: {status}")
-                
-                return result
-            else:
-                print(f"❌ เกิดข้อผิดพลาด: {response.status_code}")
-                print(f"📝 Response: {response.text}")
-                return None
+            charge_id = result['data'].get('chargeId')
+            status = result['data'].get('status')
+            
+            print(f"\n💳 Payment Status:")
+            print(f"   Charge ID: {charge_id}")
+            print(f"   Status: {status}")
+            
+            return result
                 
+        except CatCarApiError as e:
+            print(f"❌ เกิดข้อผิดพลาด: {e.status_code}")
+            print(f"📝 Response: {e}")
+            return None
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาด: {e}")
             return None
 
 
+def poisson_arrivals(rate: float, duration: float) -> Iterator[float]:
+    """
+    เวลา arrival (วินาทีนับจากเริ่ม) ของ Poisson process ที่ rate คงที่
+    
+    Args:
+        rate: จำนวน payment ต่อวินาทีโดยเฉลี่ย
+        duration: ระยะเวลาทั้งหมด (วินาที)
+    """
+    t = random.expovariate(rate)
+    while t < duration:
+        yield t
+        t += random.expovariate(rate)
+
+
+def diurnal_arrivals(peak_rate: float, duration: float, profile: Optional[List[float]] = None) -> Iterator[float]:
+    """
+    เวลา arrival ของ non-homogeneous Poisson process ตาม diurnal curve (thinning)
+    
+    ย่อหนึ่งวัน (len(profile) ชั่วโมง) ให้อยู่ใน duration วินาที
+    
+    Args:
+        peak_rate: จำนวน payment ต่อวินาทีในชั่วโมงที่ profile = 1.0
+        duration: ระยะเวลาทั้งหมด (วินาที) ที่แทนหนึ่งวัน
+        profile: สัดส่วน rate ต่อชั่วโมง (default: DIURNAL_PROFILE)
+    """
+    profile = profile or DIURNAL_PROFILE
+    peak = max(profile)
+    slot = duration / len(profile)
+    for t in poisson_arrivals(peak_rate, duration):
+        if random.random() < profile[min(int(t / slot), len(profile) - 1)] / peak:
+            yield t
+
+
+class PaymentStatusPoller:
+    """
+    HTTP fallback สำหรับ charge จำนวนมากที่ยังไม่ได้รับ status ทาง MQTT
+    
+    - แต่ละ charge poll ด้วย exponential backoff + jitter (ไม่ poll พร้อมกันเป็นจังหวะเดียว)
+    - จำกัดจำนวน poll ที่ in-flight พร้อมกันทั้งระบบ (max_in_flight)
+    - หยุด poll ทันทีเมื่อ charge ถูก resolve ทาง MQTT (เช็ค is_open ก่อนทุก poll)
+    - นับจำนวน poll ต่อ charge
+    
+    Server ไม่มี batch status endpoint การ batch จึงทำที่ scheduler: poll ที่ถึงเวลา
+    พร้อมกันจะถูกปล่อยออกไปตาม slot ที่ว่างภายใต้ max_in_flight
+    """
+    
+    def __init__(self,
+                 poll_fn: Callable[[str], Optional[str]],
+                 on_resolved: Callable[[str, Optional[str]], None],
+                 is_open: Callable[[str], bool],
+                 max_in_flight: int = 10,
+                 initial_interval: float = 1.0,
+                 max_interval: float = 30.0,
+                 multiplier: float = 2.0,
+                 jitter: float = 0.5,
+                 give_up_after: float = 120.0):
+        """
+        Initialize Payment Status Poller
+        
+        Args:
+            poll_fn: poll_fn(charge_id) → final status หรือ None (ยัง PENDING / error)
+            on_resolved: on_resolved(charge_id, status) เมื่อได้ final status (status=None ถ้า give up)
+            is_open: is_open(charge_id) → False ถ้า charge ถูก resolve แล้ว (เช่นทาง MQTT)
+            max_in_flight: จำนวน poll ที่ส่งพร้อมกันสูงสุดทั้งระบบ
+            initial_interval: ช่วงห่างก่อน poll ครั้งที่ 2 (วินาที)
+            max_interval: ช่วงห่างสูงสุดระหว่าง poll (วินาที)
+            multiplier: ตัวคูณ backoff
+            jitter: สัดส่วน jitter (0.5 = สุ่ม ±50% ของ interval)
+            give_up_after: เลิก poll หลังเริ่ม fallback นานเท่านี้ (วินาที)
+        """
+        self.poll_fn = poll_fn
+        self.on_resolved = on_resolved
+        self.is_open = is_open
+        self.max_in_flight = max_in_flight
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.give_up_after = give_up_after
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="status-poll")
+        self._lock = threading.Lock()
+        self._cv = threading.Condition(self._lock)
+        self._queue: List[tuple] = []  # heap ของ (due_time, seq, charge_id)
+        self._seq = 0
+        self._started_at: Dict[str, float] = {}
+        self._in_flight = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        
+        self.polls: Dict[str, int] = {}
+        self.total_polls = 0
+        self.max_in_flight_seen = 0
+        self.gave_up = 0
+        self.stopped_by_mqtt = 0
+    
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._scheduler_loop, name="status-poll-scheduler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._cv.notify_all()
+        if self._thread:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+    
+    def add(self, charge_id: str):
+        """เริ่ม fallback ของ charge (poll ครั้งแรกทันที)"""
+        with self._lock:
+            self._started_at[charge_id] = time.perf_counter()
+            self.polls.setdefault(charge_id, 0)
+            self._push(time.perf_counter(), charge_id)
+    
+    def active(self) -> int:
+        """จำนวน charge ที่ยังอยู่ใน fallback"""
+        with self._lock:
+            return len(self._started_at)
+    
+    def _push(self, due: float, charge_id: str):
+        """เพิ่ม poll เข้าคิว (ต้องถือ self._lock)"""
+        self._seq += 1
+        heapq.heappush(self._queue, (due, self._seq, charge_id))
+        self._cv.notify()
+    
+    def _next_interval(self, attempts: int) -> float:
+        base = min(self.max_interval, self.initial_interval * self.multiplier ** max(attempts - 1, 0))
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+    
+    def _scheduler_loop(self):
+        with self._lock:
+            while self._running:
+                if not self._queue or self._in_flight >= self.max_in_flight:
+                    self._cv.wait()
+                    continue
+                due, _, charge_id = self._queue[0]
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    self._cv.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+                if not self.is_open(charge_id):
+                    self._started_at.pop(charge_id, None)
+                    self.stopped_by_mqtt += 1
+                    continue
+                self._in_flight += 1
+                self.max_in_flight_seen = max(self.max_in_flight_seen, self._in_flight)
+                self._executor.submit(self._poll, charge_id)
+    
+    def _poll(self, charge_id: str):
+        status = None
+        try:
+            status = self.poll_fn(charge_id)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.total_polls += 1
+                self.polls[charge_id] = self.polls.get(charge_id, 0) + 1
+                attempts = self.polls[charge_id]
+                started_at = self._started_at.get(charge_id, time.perf_counter())
+                done = status is not None or time.perf_counter() - started_at >= self.give_up_after
+                if done:
+                    self._started_at.pop(charge_id, None)
+                    if status is None:
+                        self.gave_up += 1
+                else:
+                    self._push(time.perf_counter() + self._next_interval(attempts), charge_id)
+                self._cv.notify()
+        if done:
+            self.on_resolved(charge_id, status)
+
+
+class PaymentLoadGenerator(PaymentDeviceSimulator):
+    """
+    Multi-device payment load: สร้าง payment จากหลาย device ตาม arrival process
+    
+    เปิด charge ค้างไว้พร้อมกันได้หลายรายการ แล้ววัด
+    - create latency (POST /payment-gateway/payments)
+    - เวลาจนได้รับ PAYMENT status ทาง MQTT (นับจากตอนส่ง create)
+      ผ่าน status_dispatcher (wildcard subscription เดียวสำหรับทุก charge)
+    - สัดส่วน charge ที่ต้อง fallback ไปเช็ค status ผ่าน HTTP และจำนวน poll ต่อ payment
+      (PaymentStatusPoller: backoff + jitter, จำกัด in-flight, หยุดเมื่อ MQTT มาถึง)
+    """
+    
+    def __init__(self,
+                 device_ids: List[str],
+                 api_base_url: str = "http://localhost:3000/api/v1",
+                 mqtt_broker: str = "localhost",
+                 mqtt_port: int = 1883,
+                 max_workers: int = 50,
+                 max_polls_in_flight: int = 10):
+        """
+        Initialize Payment Load Generator
+        
+        Args:
+            device_ids: Device ที่ใช้สร้าง payment (สุ่มเลือกต่อ payment)
+            api_base_url: Base URL ของ API server
+            mqtt_broker: MQTT broker host
+            mqtt_port: MQTT broker port
+            max_workers: จำนวน create payment ที่ส่งพร้อมกันสูงสุด
+            max_polls_in_flight: จำนวน fallback status poll ที่ส่งพร้อมกันสูงสุด
+            
+        Raises:
+            ValueError: device_ids ว่าง (เช่นไฟล์ไม่มี ID หรือใส่แค่ ",")
+        """
+        if not device_ids:
+            raise ValueError("ไม่มี Device ID สำหรับ load test (ไฟล์ว่างหรือรายการว่าง)")
+        super().__init__(device_ids[0], api_base_url, mqtt_broker, mqtt_port, silent=True)
+        self.device_ids = list(device_ids)
+        self.max_workers = max_workers
+        self.max_polls_in_flight = max_polls_in_flight
+        # create / poll ใช้ pool เดียวกัน; ไม่ retry เพื่อให้ latency และ error ที่วัดได้ตรงกับ server
+        self.api = CatCarApi(api_base_url, manager=ConnectionManager(
+            pool_size=max_workers + max_polls_in_flight, timeout=30, retries=0))
+        
+        # Backoff ของ HTTP fallback (ส่งต่อให้ PaymentStatusPoller)
+        self.poll_initial_interval = 1.0
+        self.poll_max_interval = 30.0
+        self.poll_jitter = 0.5
+        self.poll_give_up_after = 120.0
+        
+        self._lock = threading.Lock()
+        self._open: Dict[str, Dict] = {}  # charge_id -> payment record ที่ยังไม่ได้ status
+        self._deadlines: List[tuple] = []  # heap ของ (deadline, charge_id) ก่อนเริ่ม fallback
+        self.poller: Optional[PaymentStatusPoller] = None
+        self.records: List[Dict] = []
+    
+    def _resolve(self, charge_id: str, status: Optional[str], source: str,
+                 received_at: Optional[float] = None) -> bool:
+        """บันทึกผลของ charge ครั้งแรกที่ได้ (MQTT หรือ HTTP) คืน False ถ้า resolve ไปแล้ว"""
+        with self._lock:
+            record = self._open.pop(charge_id, None)
+        if record is None:
+            return False
+        record['status'] = status
+        record['status_source'] = source
+        record['time_to_status'] = (received_at or time.perf_counter()) - record['started']
+        if status is None:
+            record['error'] = "No final status (fallback gave up)"
+        record['done'].set()
+        return True
+    
+    def _on_status(self, pending: PendingPaymentStatus):
+        """Callback จาก status_dispatcher เมื่อได้รับ PAYMENT status ทาง MQTT"""
+        self._resolve(pending.charge_id, pending.status, 'mqtt', pending.received_at)
+    
+    def _is_open(self, charge_id: str) -> bool:
+        with self._lock:
+            return charge_id in self._open
+    
+    def _poll_status(self, charge_id: str) -> Optional[str]:
+        """GET status หนึ่งครั้ง คืน final status หรือ None ถ้ายัง PENDING / error"""
+        try:
+            status = self.api.get_payment_status(charge_id).get('status')
+            return status if status in FINAL_PAYMENT_STATUSES else None
+        except Exception:
+            return None
+    
+    def _on_poll_resolved(self, charge_id: str, status: Optional[str]):
+        """Callback จาก poller เมื่อได้ final status ทาง HTTP (หรือ give up)"""
+        if self._resolve(charge_id, status, 'http'):
+            self.status_dispatcher.cancel(charge_id)
+    
+    def _start_payment(self, device_id: str, amount: int, status_timeout: float) -> Dict:
+        """ส่ง create payment หนึ่งรายการ แล้วลงทะเบียน charge ไว้รอ status"""
+        record = {"device_id": device_id, "amount": amount, "charge_id": None, "status": None,
+                  "status_source": None, "create_latency": None, "time_to_status": None,
+                  "error": None, "done": threading.Event()}
+        record['started'] = time.perf_counter()
+        try:
+            data = self.api.create_payment(device_id, amount, PaymentMethod.QR_PROMPT_PAY.value,
+                                           "Car wash payment (load test)")
+            record['create_latency'] = time.perf_counter() - record['started']
+            charge_id = (data.get('payment_results') or {}).get('chargeId')
+        except Exception as e:
+            if isinstance(e, CatCarApiError):
+                record['create_latency'] = time.perf_counter() - record['started']
+            record['error'] = str(e)
+            record['done'].set()
+            return record
+        
+        if not charge_id:
+            record['error'] = "No chargeId in response"
+            record['done'].set()
+            return record
+        record['charge_id'] = charge_id
+        with self._lock:
+            self._open[charge_id] = record
+            heapq.heappush(self._deadlines, (time.perf_counter() + status_timeout, charge_id))
+        self.status_dispatcher.register(charge_id, callback=self._on_status)
+        return record
+    
+    def _expire_pending(self):
+        """charge ที่เลย MQTT timeout และยังไม่ได้ status → ส่งเข้า HTTP fallback (MQTT ยังรอต่อ)"""
+        now = time.perf_counter()
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, charge_id = heapq.heappop(self._deadlines)
+                if charge_id in self._open:
+                    expired.append(charge_id)
+        for charge_id in expired:
+            self.poller.add(charge_id)
+    
+    def run_load(self, rate: float, duration: float, arrival: str = "poisson",
+                 status_timeout: float = 15.0, amounts: Optional[List[int]] = None) -> Dict:
+        """
+        รัน payment load test
+        
+        Args:
+            rate: payment ต่อวินาที (poisson = ค่าเฉลี่ย, diurnal = peak rate)
+            duration: ระยะเวลาสร้าง payment (วินาที)
+            arrival: "poisson" หรือ "diurnal"
+            status_timeout: เวลารอ PAYMENT status ทาง MQTT ก่อนเริ่ม HTTP fallback (วินาที)
+            amounts: จำนวนเงินที่สุ่มใช้ (satang, default: LOAD_TEST_AMOUNTS)
+            
+        Returns:
+            Dict: สรุปผล load test
+        """
+        if not self.mqtt_connected and not self.connect_mqtt():
+            raise RuntimeError("ไม่สามารถเชื่อมต่อ MQTT broker ได้")
+        amounts = amounts or LOAD_TEST_AMOUNTS
+        arrivals = diurnal_arrivals(rate, duration) if arrival == "diurnal" else poisson_arrivals(rate, duration)
+        
+        print("\n" + "=" * 60)
+        print("📈 Payment Load Test")
+        print("=" * 60)
+        print(f"Devices: {len(self.device_ids)} | Arrival: {arrival} @ {rate}/s | Duration: {duration}s")
+        print(f"MQTT status timeout: {status_timeout}s | Max create workers: {self.max_workers}")
+        print(f"HTTP fallback: backoff {self.poll_initial_interval}s → {self.poll_max_interval}s "
+              f"(±{self.poll_jitter:.0%} jitter), max {self.max_polls_in_flight} polls in flight")
+        
+        self.poller = PaymentStatusPoller(self._poll_status, self._on_poll_resolved, self._is_open,
+                                          max_in_flight=self.max_polls_in_flight,
+                                          initial_interval=self.poll_initial_interval,
+                                          max_interval=self.poll_max_interval,
+                                          jitter=self.poll_jitter,
+                                          give_up_after=self.poll_give_up_after)
+        self.poller.start()
+        futures = []
+        max_open = 0
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for offset in arrivals:
+                    # รอจนถึงเวลา arrival ถัดไป แล้วเช็ค charge ที่หมดเวลาระหว่างรอ
+                    while True:
+                        self._expire_pending()
+                        wait = started + offset - time.perf_counter()
+                        if wait <= 0:
+                            break
+                        time.sleep(min(wait, 0.1))
+                    futures.append(executor.submit(self._start_payment, random.choice(self.device_ids),
+                                                   random.choice(amounts), status_timeout))
+                    with self._lock:
+                        max_open = max(max_open, len(self._open))
+                
+                print(f"⏳ ส่ง create ครบ {len(futures)} รายการ รอ status ที่เหลือ...")
+                records = [f.result() for f in futures]
+            while True:
+                self._expire_pending()
+                with self._lock:
+                    if not self._open:
+                        break
+                time.sleep(0.1)
+        finally:
+            self.poller.stop()
+        total_time = time.perf_counter() - started
+        self.records = records
+        return self._summarize(records, total_time, max_open)
+    
+    def _summarize(self, records: List[Dict], total_time: float, max_open: int) -> Dict:
+        """สรุปและแสดงผล load test"""
+        created = [r for r in records if r['charge_id']]
+        create_latencies = [r['create_latency'] for r in records if r['create_latency'] is not None]
+        mqtt_times = [r['time_to_status'] for r in created if r['status_source'] == 'mqtt']
+        polls = self.poller.polls if self.poller else {}
+        fallbacks = [r for r in created if r['charge_id'] in polls]
+        resolved_by_http = sum(1 for r in created if r['status_source'] == 'http' and r['status'])
+        resolved = [r for r in created if r['status']]
+        polls_per_fallback = [polls[r['charge_id']] for r in fallbacks]
+        statuses: Dict[str, int] = {}
+        for r in created:
+            statuses[r['status'] or 'UNKNOWN'] = statuses.get(r['status'] or 'UNKNOWN', 0) + 1
+        
+        summary = {
+            "payments": len(records),
+            "created": len(created),
+            "create_errors": len(records) - len(created),
+            "create_p50": percentile(create_latencies, 50),
+            "create_p95": percentile(create_latencies, 95),
+            "create_p99": percentile(create_latencies, 99),
+            "mqtt_status_p50": percentile(mqtt_times, 50),
+            "mqtt_status_p95": percentile(mqtt_times, 95),
+            "mqtt_status_p99": percentile(mqtt_times, 99),
+            "http_fallbacks": len(fallbacks),
+            "fallback_ratio": len(fallbacks) / len(created) if created else 0.0,
+            "resolved_by_http": resolved_by_http,
+            "fallback_requests": self.poller.total_polls if self.poller else 0,
+            "polls_per_resolved_payment": (self.poller.total_polls / len(resolved)) if self.poller and resolved else 0.0,
+            "polls_per_fallback_p50": percentile(polls_per_fallback, 50),
+            "polls_per_fallback_max": max(polls_per_fallback) if polls_per_fallback else None,
+            "max_polls_in_flight": self.poller.max_in_flight_seen if self.poller else 0,
+            "fallback_gave_up": self.poller.gave_up if self.poller else 0,
+            "max_open_charges": max_open,
+            "statuses": statuses,
+            "total_time": total_time,
+            "throughput": len(created) / total_time if total_time else 0.0,
+        }
+        
+        def fmt(value: Optional[float]) -> str:
+            return f"{value * 1000:.0f}ms" if value is not None else "-"
+        
+        print("\n" + "=" * 60)
+        print("📊 Payment Load Test Summary")
+        print("=" * 60)
+        print(f"Payments: {summary['payments']} | Created: {summary['created']} | Errors: {summary['create_errors']}")
+        print(f"Create latency   p50={fmt(summary['create_p50'])} p95={fmt(summary['create_p95'])} "
+              f"p99={fmt(summary['create_p99'])}")
+        print(f"MQTT status time p50={fmt(summary['mqtt_status_p50'])} p95={fmt(summary['mqtt_status_p95'])} "
+              f"p99={fmt(summary['mqtt_status_p99'])}")
+        print(f"HTTP fallback: {len(fallbacks)} ({summary['fallback_ratio']:.1%}), resolved by HTTP "
+              f"{resolved_by_http}, gave up {summary['fallback_gave_up']}")
+        print(f"Fallback requests: {summary['fallback_requests']} "
+              f"({summary['polls_per_resolved_payment']:.2f} per resolved payment, "
+              f"p50 {summary['polls_per_fallback_p50'] or 0} / max {summary['polls_per_fallback_max'] or 0} "
+              f"per fallback charge, max in flight {summary['max_polls_in_flight']})")
+        print(f"Max open charges: {max_open} | Throughput: {summary['throughput']:.2f} payments/s")
+        print(f"Statuses: {', '.join(f'{k}={v}' for k, v in sorted(statuses.items())) or '-'}")
+        print("=" * 60)
+        return summary
+
+
 def show_menu(device_id: str):
     """แสดงเมนูหลัก"""
     print("\n" + "=" * 60)
@@ -476,7 +989,8 @@ def show_menu(device_id: str):
     print("6. 🔗 Connect MQTT - เชื่อมต่อ MQTT broker")
     print("7. 🔌 Disconnect MQTT - ตัดการเชื่อมต่อ MQTT")
     print("8. ⚙️  Change Settings - เปลี่ยนการตั้งค่า")
-    print("9. ❌ Exit - ออกจากโปรแกรม")
+    print("9. 📈 Payment Load Test - จำลอง payment จากหลาย device พร้อมกัน")
+    print("10. ❌ Exit - ออกจากโปรแกรม")
     print("=" * 60)
 
 
@@ -678,6 +1192,42 @@ def handle_disconnect_mqtt(simulator: PaymentDeviceSimulator):
     simulator.disconnect_mqtt()
 
 
+def handle_load_test(simulator: PaymentDeviceSimulator):
+    """จัดการ command payment load test"""
+    print("\n📈 Payment Load Test")
+    print("-" * 40)
+    
+    try:
+        ids_input = input("📄 ไฟล์ Device IDs หรือ ID คั่นด้วย , (Enter = device ปัจจุบัน): ").strip()
+        if not ids_input:
+            device_ids = [simulator.device_id]
+        elif os.path.exists(ids_input):
+            device_ids = load_device_ids(ids_input)
+        else:
+            device_ids = [d.strip() for d in ids_input.split(',') if d.strip()]
+        
+        arrival = input("📊 Arrival process (poisson/diurnal, default: poisson): ").strip().lower() or "poisson"
+        rate = float(input("⚡ Payments ต่อวินาที (default: 5): ").strip() or "5")
+        duration = float(input("⏱️  Duration (วินาที, default: 60): ").strip() or "60")
+        status_timeout = float(input("⏳ MQTT status timeout (วินาที, default: 15): ").strip() or "15")
+        
+        generator = PaymentLoadGenerator(device_ids, simulator.api_base_url,
+                                         simulator.mqtt_broker, simulator.mqtt_port)
+        try:
+            summary = generator.run_load(rate, duration, arrival=arrival, status_timeout=status_timeout)
+        finally:
+            generator.disconnect_mqtt()
+            generator.api.manager.close()
+        prompt_save_run(summary, config={"devices": len(device_ids), "arrival": arrival, "rate": rate,
+                                         "duration": duration, "status_timeout": status_timeout},
+                        default_scenario=f"payment-load-{arrival}-{rate:g}ps")
+    
+    except ValueError as e:
+        print(f"❌ ค่าที่ใส่ไม่ถูกต้อง: {e}")
+    except Exception as e:
+        print(f"❌ เกิดข้อผิดพลาด: {e}")
+
+
 def handle_change_settings():
     """จัดการ command change settings"""
     print("\n⚙️  Change Settings")
@@ -729,7 +1279,7 @@ def main():
     try:
         while True:
             show_menu(device_id)
-            choice = input("👉 เลือกคำสั่ง (1-9): ").strip()
+            choice = input("👉 เลือกคำสั่ง (1-10): ").strip()
             
             if choice == "1":
                 handle_create_payment(simulator)
@@ -750,13 +1300,15 @@ def main():
                 if any(new_settings.values()):
                     print("💡 กรุณาเริ่มโปรแกรมใหม่เพื่อใช้การตั้งค่าใหม่")
             elif choice == "9":
+                handle_load_test(simulator)
+            elif choice == "10":
                 print("👋 ออกจากโปรแกรม")
                 break
             else:
-                print("❌ กรุณาเลือกหมายเลข 1-9")
+                print("❌ กรุณาเลือกหมายเลข 1-10")
             
             # Pause
-            if choice not in ["9"]:
+            if choice not in ["10"]:
                 input("\n⏸️  กด Enter เพื่อกลับไปเมนูหลัก...")
     
     except KeyboardInterrupt:
@@ -6,10 +6,70 @@ Script สำหรับทดสอบส่งคำสั่งไปยั
 
 import requests
 import json
+import math
+import random
+import threading
 import time
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
 
+from benchmark_results import load_device_ids, percentile, prompt_save_run
+from catcar_sdk import CatCarApi, CatCarApiError, ConnectionManager
+
+# ขนาด bulk ที่ใช้ใน benchmark (จำนวน device ต่อรอบ)
+BULK_BENCHMARK_SIZES = [10, 50, 100, 500, 1000, 2000, 5000]
+
+# ขนาดของแต่ละ wave ใน OTA rollout ("5%" = 5% ของ fleet, 100 = 100 เครื่อง)
+# device ที่เหลือหลัง wave สุดท้ายจะถูกรวมเป็น wave สุดท้ายอีกหนึ่ง wave
+ROLLOUT_WAVES = ["1%", "5%", "25%", "100%"]
+
+# endpoint และ body ของคำสั่งที่ใช้ใน command benchmark
+COMMAND_REQUESTS = {
+    "APPLY_CONFIG": ("apply-config", None),
+    "RESTART": ("restart", {"delay_seconds": 5}),
+    "RESET_CONFIG": ("reset-config", None),
+    "MANUAL_PAYMENT": ("manual-payment", {"amount": 50}),
+}
+
+# สัดส่วนคำสั่งเริ่มต้นของ command benchmark
+DEFAULT_COMMAND_MIX = {"APPLY_CONFIG": 0.4, "RESTART": 0.2, "RESET_CONFIG": 0.1, "MANUAL_PAYMENT": 0.3}
+
+# rate (request/s) ที่ใช้ใน sweep ของ command benchmark
+COMMAND_BENCHMARK_RATES = [1, 5, 10, 20, 50, 100]
+
+# สถานะที่ถือว่าเป็น error ของคำสั่ง (SUCCESS / SENT ไม่นับ)
+COMMAND_ERROR_STATUSES = ("FAILED", "TIMEOUT", "ERROR")
+
+
+def plan_rollout_waves(total: int, waves: List[Union[int, str]]) -> List[int]:
+    """
+    แปลง wave spec ("10%" หรือจำนวนเครื่อง) เป็นขนาดของแต่ละ wave
+    
+    Args:
+        total: จำนวน device ทั้งหมด
+        waves: ขนาดของแต่ละ wave เป็น % ของ fleet หรือจำนวนเครื่อง
+        
+    Returns:
+        List[int]: จำนวน device ในแต่ละ wave (รวมกันเท่ากับ total)
+    """
+    sizes = []
+    remaining = total
+    for spec in waves:
+        if remaining <= 0:
+            break
+        if isinstance(spec, str) and spec.strip().endswith('%'):
+            size = math.ceil(total * float(spec.strip()[:-1]) / 100)
+        else:
+            size = int(spec)
+        size = min(max(size, 1), remaining)
+        sizes.append(size)
+        remaining -= size
+    if remaining > 0:
+        sizes.append(remaining)
+    return sizes
+
+
 class DeviceCommandsTester:
     def __init__(self, api_base_url: str = "http://localhost:3000"):
         """
@@ -20,6 +80,9 @@ class DeviceCommandsTester:
         """
         self.api_base_url = api_base_url
         self.api_endpoint = f"{api_base_url}/api/v1/device-commands"
+        self.devices_endpoint = f"{api_base_url}/api/v1/devices"
+        # bulk / rollout / benchmark ใช้ catcar_sdk (คำสั่งเดี่ยวแสดง raw response จึงใช้ requests ตรงๆ)
+        self.api = CatCarApi(f"{api_base_url}/api/v1")
         
     def _print_response(self, response: requests.Response, command_name: str):
         """Print formatted response"""
@@ -233,6 +296,518 @@ class DeviceCommandsTester:
         print(f"❌ Failed: {failed}")
         print("="*70)
 
+    @staticmethod
+    def _iter_sse_events(response: requests.Response) -> Iterator[Tuple[str, Dict, float]]:
+        """
+        Parse SSE stream เป็น (event, data, received_at)
+        received_at เป็นเวลา time.perf_counter() ตอนได้รับ event ครบ
+        """
+        event_type = "message"
+        data_lines: List[str] = []
+        for raw_line in response.iter_lines(decode_unicode=True):
+            if raw_line is None:
+                continue
+            line = raw_line.rstrip('\r')
+            if line == "":
+                # บรรทัดว่าง = จบ event
+                if data_lines:
+                    received_at = time.perf_counter()
+                    data_str = "\n".join(data_lines)
+                    try:
+                        data = json.loads(data_str)
+                    except json.JSONDecodeError:
+                        data = {"raw": data_str}
+                    yield event_type, data, received_at
+                event_type = "message"
+                data_lines = []
+            elif line.startswith(':'):
+                continue  # comment / keepalive
+            elif line.startswith('event:'):
+                event_type = line[len('event:'):].strip()
+            elif line.startswith('data:'):
+                data_lines.append(line[len('data:'):].lstrip())
+    
+    def run_bulk_apply_config(self, device_ids: List[str], auth_token: Optional[str] = None,
+                              stream_timeout: float = 90.0) -> Dict:
+        """
+        Bulk APPLY_CONFIG หนึ่งรอบ แล้ววัดผลจาก SSE bulk-events stream
+        
+        POST /api/v1/devices/apply-config → setup_id
+        GET  /api/v1/devices/bulk-events/{setup_id} (text/event-stream)
+        
+        Args:
+            device_ids: Device ที่จะ apply config
+            auth_token: JWT token (ถ้า server ต้องการ)
+            stream_timeout: read timeout ของ SSE stream (ควรมากกว่า ACK timeout 30s)
+            
+        Returns:
+            Dict: ผลการวัดของรอบนี้
+        """
+        headers = {}
+        if auth_token:
+            headers['Authorization'] = f"Bearer {auth_token}"
+        
+        total = len(device_ids)
+        started = time.perf_counter()
+        body = self.api.request("POST", "/devices/apply-config", {"device_ids": device_ids, "configs": {}},
+                                headers=headers, timeout=35)
+        accepted_at = time.perf_counter()
+        setup_id = (body.get('data') or {}).get('setup_id')
+        if not setup_id:
+            raise RuntimeError(f"No setup_id in response: {json.dumps(body)[:200]}")
+        
+        # เวลาของแต่ละ device event (วินาทีนับจากตอนส่ง POST)
+        events: Dict[str, List[Tuple[str, float]]] = {"device-success": [], "device-failed": [], "device-timeout": []}
+        completed_at = None
+        sse_headers = dict(headers, Accept='text/event-stream')
+        with self.api.manager.request("GET", f"{self.devices_endpoint}/bulk-events/{setup_id}",
+                                      headers=sse_headers, stream=True,
+                                      timeout=(10, stream_timeout)) as stream:
+            stream.raise_for_status()
+            seen = 0
+            for event_type, data, received_at in self._iter_sse_events(stream):
+                if event_type in events:
+                    events[event_type].append((data.get('device_id', ''), received_at - started))
+                    seen += 1
+                elif event_type == 'complete':
+                    completed_at = received_at
+                    break
+                if seen >= total:
+                    # server อาจส่ง complete ช้า ถือว่าจบเมื่อได้ครบทุก device
+                    completed_at = received_at
+                    break
+        
+        ack_times = [t for _, t in events["device-success"]] + [t for _, t in events["device-failed"]]
+        time_to_complete = (completed_at - started) if completed_at else None
+        acked = len(ack_times)
+        return {
+            "devices": total,
+            "setup_id": setup_id,
+            "post_latency": accepted_at - started,
+            "success": len(events["device-success"]),
+            "failed": len(events["device-failed"]),
+            "timeout": len(events["device-timeout"]),
+            "missing": total - acked - len(events["device-timeout"]),
+            "time_to_first_ack": min(ack_times) if ack_times else None,
+            "ack_p50": percentile(ack_times, 50),
+            "ack_p95": percentile(ack_times, 95),
+            "time_to_complete": time_to_complete,
+            "throughput": (acked / time_to_complete) if time_to_complete else None,
+            "events": events,
+        }
+    
+    def benchmark_bulk_apply_config(self, device_ids: List[str], sizes: Optional[List[int]] = None,
+                                    auth_token: Optional[str] = None, pause_between: float = 5.0) -> List[Dict]:
+        """
+        Benchmark bulk APPLY_CONFIG โดยเพิ่มจำนวน device ทีละขั้น (10 → 5,000)
+        
+        ต้องมี device simulator ตอบคำสั่ง เช่น FleetCommandSimulator ใน
+        device_command_simulator.py (ใส่ * เป็น Device ID)
+        
+        Args:
+            device_ids: Device ทั้งหมดที่ใช้ได้ (ต้องมีอยู่ในฐานข้อมูล)
+            sizes: จำนวน device ต่อรอบ (default: BULK_BENCHMARK_SIZES)
+            auth_token: JWT token (ถ้า server ต้องการ)
+            pause_between: เวลาพักระหว่างรอบ (วินาที)
+            
+        Returns:
+            List[Dict]: ผลการวัดของแต่ละรอบ
+        """
+        sizes = [n for n in (sizes or BULK_BENCHMARK_SIZES) if n <= len(device_ids)]
+        if not sizes:
+            print(f"❌ ต้องมี device อย่างน้อย {min(BULK_BENCHMARK_SIZES)} ตัว (มี {len(device_ids)})")
+            return []
+        
+        print("\n" + "="*70)
+        print("📈 Bulk APPLY_CONFIG Benchmark (SSE bulk-events)")
+        print("="*70)
+        print(f"API Base URL: {self.api_base_url}")
+        print(f"Sizes: {', '.join(str(n) for n in sizes)}")
+        
+        results = []
+        for i, n in enumerate(sizes):
+            print(f"\n🚀 Round {i + 1}/{len(sizes)}: {n} devices")
+            try:
+                result = self.run_bulk_apply_config(device_ids[:n], auth_token=auth_token)
+                results.append(result)
+                print(f"   ✅ success={result['success']} failed={result['failed']} "
+                      f"timeout={result['timeout']} missing={result['missing']}")
+            except (CatCarApiError, requests.exceptions.HTTPError) as e:
+                status = e.status_code if isinstance(e, CatCarApiError) else e.response.status_code
+                if status != 404:
+                    print(f"   ❌ Round failed: {e}")
+                    results.append({"devices": n, "error": str(e)})
+                else:
+                    # bulk apply-config / bulk-events เป็น endpoint ที่วางแผนไว้ใน PLAN-COMUNICATION.md
+                    print(f"   ❌ {e}")
+                    print("   ⚠️  Server ยังไม่มี bulk apply-config / bulk-events (planned) - หยุด benchmark")
+                    results.append({"devices": n, "error": f"endpoint not implemented: {e}"})
+                    break
+            except Exception as e:
+                print(f"   ❌ Round failed: {e}")
+                results.append({"devices": n, "error": str(e)})
+            if i < len(sizes) - 1:
+                time.sleep(pause_between)
+        
+        def fmt(value: Optional[float], unit: str = "s") -> str:
+            return f"{value:.3f}{unit}" if value is not None else "-"
+        
+        print("\n" + "="*70)
+        print("📊 Benchmark Summary")
+        print("="*70)
+        print(f"{'Devices':>8} {'First ACK':>11} {'ACK p50':>10} {'ACK p95':>10} {'Complete':>10} {'Dev/s':>9} {'Timeout':>8}")
+        for r in results:
+            if 'error' in r:
+                print(f"{r['devices']:>8}  ❌ {r['error'][:50]}")
+                continue
+            throughput = f"{r['throughput']:.1f}" if r['throughput'] else "-"
+            print(f"{r['devices']:>8} {fmt(r['time_to_first_ack']):>11} {fmt(r['ack_p50']):>10} "
+                  f"{fmt(r['ack_p95']):>10} {fmt(r['time_to_complete']):>10} {throughput:>9} {r['timeout']:>8}")
+        print("="*70)
+        return results
+
+    def load_firmware_manifest(self, version: Optional[str] = None, firmware_type: str = "carwash") -> Dict:
+        """
+        อ่าน firmware manifest (public/firmwares/vX/manifest.json) ผ่าน /api/v1/firmwares/latest
+        
+        Args:
+            version: Firmware version (None = latest)
+            firmware_type: carwash หรือ helmet
+            
+        Returns:
+            Dict: {version, files: {hw, qr}}
+        """
+        return self.api.get_latest_firmware(firmware_type, version)
+    
+    def _send_update_firmware(self, api: CatCarApi, device_id: str, version: str,
+                              request_timeout: float) -> Dict:
+        """ส่ง update-firmware หนึ่งเครื่อง แล้วคืน status ที่ server ได้จาก ACK พร้อม latency"""
+        return self._post_command(api, device_id, "update-firmware", {"version": version}, request_timeout)
+    
+    def _post_command(self, api: CatCarApi, device_id: str, path: str, body: Optional[Dict],
+                      request_timeout: float) -> Dict:
+        """
+        ส่งคำสั่งหนึ่งครั้งแบบเงียบ แล้วจัดกลุ่มผลตาม status ที่ server ตอบ
+        
+        Returns:
+            Dict: {device_id, status (SUCCESS/SENT/FAILED/TIMEOUT/ERROR), latency, error}
+        """
+        started = time.perf_counter()
+        try:
+            result = api.request("POST", f"/device-commands/{device_id}/{path}", body,
+                                 timeout=request_timeout).get('data') or {}
+            return {"device_id": device_id, "status": result.get('status', 'UNKNOWN'),
+                    "latency": time.perf_counter() - started, "error": result.get('error')}
+        except CatCarApiError as e:
+            # non-2xx มี "HTTP <code>:" อยู่แล้ว, success = false ยังไม่มี
+            error = str(e) if e.status_code >= 300 else f"HTTP {e.status_code}: {e}"
+            return {"device_id": device_id, "status": "ERROR", "latency": time.perf_counter() - started,
+                    "error": error}
+        except requests.exceptions.Timeout:
+            return {"device_id": device_id, "status": "TIMEOUT", "latency": time.perf_counter() - started,
+                    "error": f"Request timeout ({request_timeout}s)"}
+        except Exception as e:
+            return {"device_id": device_id, "status": "ERROR", "latency": time.perf_counter() - started,
+                    "error": str(e)}
+    
+    def run_firmware_rollout(self, device_ids: List[str], version: Optional[str] = None,
+                             waves: Optional[List[Union[int, str]]] = None, max_in_flight: int = 20,
+                             failure_threshold: float = 0.1, min_samples: int = 10,
+                             pause_between_waves: float = 0.0, request_timeout: float = 35.0) -> Dict:
+        """
+        OTA rollout แบบ staged waves ไปยังทั้ง fleet
+        
+        ส่ง update-firmware ทีละ wave โดยจำกัดจำนวน request ที่รอ ACK พร้อมกันไม่เกิน
+        max_in_flight ถ้าสัดส่วน FAILED/TIMEOUT/ERROR ใน wave เกิน failure_threshold
+        (หลังได้ผลอย่างน้อย min_samples เครื่อง) จะหยุดส่งทันทีและคืน device ที่ยังไม่ได้อัพเดท
+        ไว้ใน remaining เพื่อสั่ง rollout ต่อภายหลัง
+        
+        Args:
+            device_ids: Device ทั้งหมดใน fleet
+            version: Firmware version (None = latest จาก manifest)
+            waves: ขนาดของแต่ละ wave (default: ROLLOUT_WAVES)
+            max_in_flight: จำนวน update ที่ส่งพร้อมกันสูงสุด
+            failure_threshold: สัดส่วน failure ที่ทำให้ rollout หยุดอัตโนมัติ (0-1)
+            min_samples: จำนวนผลขั้นต่ำก่อนเริ่มตรวจ failure ratio
+            pause_between_waves: เวลาพักระหว่าง wave (วินาที)
+            request_timeout: HTTP timeout ต่อ request (ควรมากกว่า ACK timeout 30s)
+            
+        Returns:
+            Dict: version, waves, paused, paused_at_wave, remaining, total_time
+        """
+        manifest = self.load_firmware_manifest(version)
+        version = manifest.get('version', version)
+        wave_sizes = plan_rollout_waves(len(device_ids), waves or ROLLOUT_WAVES)
+        
+        print("\n" + "="*70)
+        print("📦 Fleet OTA Rollout")
+        print("="*70)
+        print(f"Firmware Version: {version}")
+        for variant, info in manifest.get('files', {}).items():
+            print(f"   {variant.upper()}: {info.get('filename', '')} ({info.get('size', 0)} bytes)")
+        print(f"Devices: {len(device_ids)} | Waves: {', '.join(str(n) for n in wave_sizes)}")
+        print(f"Max in-flight: {max_in_flight} | Failure threshold: {failure_threshold:.0%}")
+        
+        # pool ของ rollout นี้ ไม่ retry (update-firmware ไม่ idempotent และต้องการ latency จริง)
+        manager = ConnectionManager(pool_size=max_in_flight, timeout=request_timeout, retries=0)
+        api = CatCarApi(f"{self.api_base_url}/api/v1", manager=manager)
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        
+        wave_results = []
+        paused_at_wave = None
+        offset = 0
+        rollout_started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for index, size in enumerate(wave_sizes):
+                wave_devices = device_ids[offset:offset + size]
+                results: List[Dict] = []
+                lock = threading.Lock()
+                halted = threading.Event()
+                required = min(min_samples, len(wave_devices))
+                
+                def on_done(future, results=results, lock=lock, halted=halted, required=required):
+                    result = future.result()
+                    with lock:
+                        results.append(result)
+                        failures = sum(1 for r in results if r['status'] in ('FAILED', 'TIMEOUT', 'ERROR'))
+                        if len(results) >= required and failures / len(results) > failure_threshold:
+                            halted.set()
+                    in_flight.release()
+                
+                print(f"\n🚀 Wave {index + 1}/{len(wave_sizes)}: {len(wave_devices)} devices")
+                wave_started = time.perf_counter()
+                sent = 0
+                for device_id in wave_devices:
+                    in_flight.acquire()
+                    if halted.is_set():
+                        in_flight.release()
+                        break
+                    executor.submit(self._send_update_firmware, api, device_id, version,
+                                    request_timeout).add_done_callback(on_done)
+                    sent += 1
+                # รอให้ update ที่ยัง in-flight ของ wave นี้จบก่อนตัดสินใจ
+                for _ in range(max_in_flight):
+                    in_flight.acquire()
+                for _ in range(max_in_flight):
+                    in_flight.release()
+                wave_time = time.perf_counter() - wave_started
+                
+                latencies = [r['latency'] for r in results]
+                counts = {status: sum(1 for r in results if r['status'] == status)
+                          for status in ('SUCCESS', 'SENT', 'FAILED', 'TIMEOUT', 'ERROR')}
+                failures = counts['FAILED'] + counts['TIMEOUT'] + counts['ERROR']
+                wave = {
+                    "wave": index + 1,
+                    "devices": len(wave_devices),
+                    "sent": sent,
+                    **{status.lower(): count for status, count in counts.items()},
+                    "failure_ratio": failures / len(results) if results else 0.0,
+                    "latency_p50": percentile(latencies, 50),
+                    "latency_p95": percentile(latencies, 95),
+                    "latency_max": max(latencies) if latencies else None,
+                    "wave_time": wave_time,
+                    "results": results,
+                }
+                wave_results.append(wave)
+                offset += sent
+                print(f"   ✅ success={counts['SUCCESS']} sent={counts['SENT']} failed={counts['FAILED']} "
+                      f"timeout={counts['TIMEOUT']} error={counts['ERROR']} ({wave_time:.2f}s)")
+                
+                if halted.is_set():
+                    paused_at_wave = index + 1
+                    print(f"   ⏸️  Failure ratio {wave['failure_ratio']:.1%} > {failure_threshold:.0%}"
+                          f" - rollout paused")
+                    failed = [r for r in results if r['status'] in ('FAILED', 'TIMEOUT', 'ERROR')]
+                    for r in failed[:5]:
+                        print(f"      {r['device_id']}: {r['status']} {r.get('error') or ''}")
+                    break
+                if index < len(wave_sizes) - 1 and pause_between_waves > 0:
+                    time.sleep(pause_between_waves)
+        manager.close()
+        total_time = time.perf_counter() - rollout_started
+        
+        def fmt(value: Optional[float]) -> str:
+            return f"{value:.3f}s" if value is not None else "-"
+        
+        print("\n" + "="*70)
+        print("📊 Rollout Summary")
+        print("="*70)
+        print(f"{'Wave':>5} {'Devices':>8} {'Success':>8} {'Failed':>7} {'Timeout':>8} {'p50':>9} {'p95':>9} {'Time':>9}")
+        for w in wave_results:
+            print(f"{w['wave']:>5} {w['devices']:>8} {w['success']:>8} {w['failed'] + w['error']:>7} "
+                  f"{w['timeout']:>8} {fmt(w['latency_p50']):>9} {fmt(w['latency_p95']):>9} {fmt(w['wave_time']):>9}")
+        updated = sum(w['success'] for w in wave_results)
+        print(f"\nTotal rollout time: {total_time:.2f}s | Updated: {updated}/{len(device_ids)}"
+              f" | {updated / total_time:.1f} devices/s")
+        if paused_at_wave:
+            print(f"⏸️  Paused at wave {paused_at_wave}, {len(device_ids) - offset} devices remaining")
+        print("="*70)
+        
+        return {
+            "version": version,
+            "waves": wave_results,
+            "paused": paused_at_wave is not None,
+            "paused_at_wave": paused_at_wave,
+            "remaining": device_ids[offset:],
+            "total_time": total_time,
+        }
+
+    def run_command_benchmark(self, device_ids: List[str], rate: float, duration: float,
+                              mix: Optional[Dict[str, float]] = None, max_in_flight: int = 200,
+                              request_timeout: float = 35.0, quiet: bool = False) -> Dict:
+        """
+        ส่งคำสั่งแบบ concurrent ไปยังหลาย device ที่ request rate คงที่ (open loop)
+        
+        คำสั่งถูกส่งตามเวลาที่กำหนดไว้ไม่ว่า request ก่อนหน้าจะตอบหรือยัง
+        เพื่อให้เห็นจุดที่ endpoint ที่รอ ACK เริ่ม TIMEOUT เมื่อ rate สูงขึ้น
+        
+        Args:
+            device_ids: Device ที่ใช้ (วนส่งทีละเครื่อง)
+            rate: จำนวน request ต่อวินาที
+            duration: ระยะเวลาส่ง (วินาที)
+            mix: สัดส่วนคำสั่ง (default: DEFAULT_COMMAND_MIX)
+            max_in_flight: จำนวน request ที่รอผลพร้อมกันสูงสุดฝั่ง client
+            request_timeout: HTTP timeout ต่อ request (ควรมากกว่า ACK timeout 30s)
+            quiet: ไม่แสดงตารางสรุป (ใช้ใน sweep)
+            
+        Returns:
+            Dict: สรุปผลแยกตามคำสั่ง และภาพรวม
+        """
+        mix = mix or DEFAULT_COMMAND_MIX
+        commands = [c for c in mix if c in COMMAND_REQUESTS and mix[c] > 0]
+        weights = [mix[c] for c in commands]
+        total = max(1, int(rate * duration))
+        
+        manager = ConnectionManager(pool_size=max_in_flight, timeout=request_timeout, retries=0)
+        api = CatCarApi(f"{self.api_base_url}/api/v1", manager=manager)
+        
+        results: List[Dict] = []
+        lock = threading.Lock()
+        
+        def send(command: str, device_id: str, scheduled: float):
+            queue_delay = time.perf_counter() - scheduled
+            path, body = COMMAND_REQUESTS[command]
+            result = self._post_command(api, device_id, path, body, request_timeout)
+            result["command"] = command
+            result["queue_delay"] = queue_delay
+            with lock:
+                results.append(result)
+        
+        if not quiet:
+            print("\n" + "="*70)
+            print("🏁 Device Commands Benchmark")
+            print("="*70)
+            print(f"Devices: {len(device_ids)} | Rate: {rate}/s | Duration: {duration}s | Requests: {total}")
+            print(f"Mix: {', '.join(f'{c}={mix[c]:.0%}' for c in commands)}")
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for i in range(total):
+                scheduled = started + i / rate
+                wait = scheduled - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                command = random.choices(commands, weights=weights)[0]
+                executor.submit(send, command, device_ids[i % len(device_ids)], scheduled)
+            send_time = time.perf_counter() - started
+        total_time = time.perf_counter() - started
+        manager.close()
+        
+        def summarize(rows: List[Dict]) -> Dict:
+            latencies = [r["latency"] for r in rows]
+            counts = {status: sum(1 for r in rows if r["status"] == status)
+                      for status in ("SUCCESS", "SENT", "FAILED", "TIMEOUT", "ERROR")}
+            errors = sum(counts[s] for s in COMMAND_ERROR_STATUSES)
+            return {
+                "requests": len(rows),
+                **{status.lower(): count for status, count in counts.items()},
+                "error_ratio": errors / len(rows) if rows else 0.0,
+                "timeout_ratio": counts["TIMEOUT"] / len(rows) if rows else 0.0,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": max(latencies) if latencies else None,
+            }
+        
+        per_command = {c: summarize([r for r in results if r["command"] == c]) for c in commands}
+        overall = summarize(results)
+        overall["target_rate"] = rate
+        overall["achieved_rate"] = total / (send_time + 1 / rate)
+        overall["max_queue_delay"] = max((r["queue_delay"] for r in results), default=0.0)
+        overall["total_time"] = total_time
+        
+        if not quiet:
+            def fmt(value: Optional[float]) -> str:
+                return f"{value:.3f}s" if value is not None else "-"
+            
+            print("\n" + "="*70)
+            print("📊 Benchmark Summary")
+            print("="*70)
+            print(f"{'Command':<15} {'Req':>5} {'OK':>5} {'Sent':>5} {'Fail':>5} {'T/O':>5} {'Err':>5} "
+                  f"{'p50':>8} {'p95':>8} {'p99':>8} {'Err%':>6}")
+            for name, row in list(per_command.items()) + [("ALL", overall)]:
+                print(f"{name:<15} {row['requests']:>5} {row['success']:>5} {row['sent']:>5} {row['failed']:>5} "
+                      f"{row['timeout']:>5} {row['error']:>5} {fmt(row['p50']):>8} {fmt(row['p95']):>8} "
+                      f"{fmt(row['p99']):>8} {row['error_ratio']:>6.1%}")
+            print(f"\nAchieved rate: {overall['achieved_rate']:.1f}/s (target {rate}/s) | "
+                  f"Max client queue delay: {overall['max_queue_delay']:.3f}s | Total: {total_time:.1f}s")
+            if overall["max_queue_delay"] > 1.0:
+                print("⚠️  Client เริ่มส่งช้ากว่ากำหนด ควรเพิ่ม max_in_flight")
+            print("="*70)
+        
+        return {"overall": overall, "commands": per_command, "results": results}
+    
+    def sweep_command_benchmark(self, device_ids: List[str], rates: Optional[List[float]] = None,
+                                duration: float = 30.0, mix: Optional[Dict[str, float]] = None,
+                                max_in_flight: int = 200, timeout_threshold: float = 0.05,
+                                pause_between: float = 35.0) -> List[Dict]:
+        """
+        เพิ่ม request rate ทีละขั้นจนสัดส่วน TIMEOUT เกิน timeout_threshold
+        
+        Args:
+            device_ids: Device ที่ใช้
+            rates: rate ของแต่ละขั้น (default: COMMAND_BENCHMARK_RATES)
+            duration: ระยะเวลาต่อขั้น (วินาที)
+            mix: สัดส่วนคำสั่ง (default: DEFAULT_COMMAND_MIX)
+            max_in_flight: จำนวน request ที่รอผลพร้อมกันสูงสุดฝั่ง client
+            timeout_threshold: สัดส่วน TIMEOUT ที่ถือว่า server เริ่มรับไม่ไหว (หยุด sweep)
+            pause_between: เวลาพักระหว่างขั้น ให้คำสั่งค้างของขั้นก่อนหมดอายุ (วินาที)
+            
+        Returns:
+            List[Dict]: overall summary ของแต่ละ rate
+        """
+        rates = rates or COMMAND_BENCHMARK_RATES
+        print("\n" + "="*70)
+        print("🏁 Device Commands Rate Sweep")
+        print("="*70)
+        print(f"Rates: {', '.join(str(r) for r in rates)} req/s | {duration}s per step | "
+              f"stop at TIMEOUT > {timeout_threshold:.0%}")
+        
+        steps = []
+        for i, rate in enumerate(rates):
+            print(f"\n🚀 Step {i + 1}/{len(rates)}: {rate} req/s")
+            overall = self.run_command_benchmark(device_ids, rate, duration, mix=mix,
+                                                 max_in_flight=max_in_flight, quiet=True)["overall"]
+            steps.append(overall)
+            print(f"   p95={overall['p95'] or 0:.3f}s timeout={overall['timeout_ratio']:.1%} "
+                  f"error={overall['error_ratio']:.1%}")
+            if overall["timeout_ratio"] > timeout_threshold:
+                print(f"   ⛔ TIMEOUT เกิน {timeout_threshold:.0%} ที่ {rate} req/s - หยุด sweep")
+                break
+            if i < len(rates) - 1:
+                time.sleep(pause_between)
+        
+        print("\n" + "="*70)
+        print("📊 Sweep Summary")
+        print("="*70)
+        print(f"{'Rate':>7} {'Achieved':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'T/O%':>6} {'Err%':>6}")
+        for step in steps:
+            print(f"{step['target_rate']:>7} {step['achieved_rate']:>9.1f} {step['p50'] or 0:>7.3f}s "
+                  f"{step['p95'] or 0:>7.3f}s {step['p99'] or 0:>7.3f}s {step['timeout_ratio']:>6.1%} "
+                  f"{step['error_ratio']:>6.1%}")
+        print("="*70)
+        return steps
+
 def show_menu():
     """Display main menu"""
     print("\n" + "="*60)
@@ -246,8 +821,11 @@ def show_menu():
     print("5. 💰 MANUAL_PAYMENT - ส่งคำสั่งชำระเงินแบบ manual")
     print("6. ⚙️  CUSTOM - ส่งคำสั่งกำหนดเอง")
     print("7. 🚀 TEST ALL - ทดสอบทุกคำสั่ง")
-    print("8. ⚙️  SETTINGS - ตั้งค่า API URL")
-    print("9. ❌ EXIT - ออกจากโปรแกรม")
+    print("8. 📈 BULK BENCHMARK - วัดผล bulk APPLY_CONFIG ผ่าน SSE")
+    print("9. 📦 OTA ROLLOUT - อัพเดท firmware ทั้ง fleet แบบ waves")
+    print("10. 🏁 COMMAND BENCHMARK - ส่งคำสั่งพร้อมกันหลาย device ตาม request rate")
+    print("11. ⚙️  SETTINGS - ตั้งค่า API URL")
+    print("12. ❌ EXIT - ออกจากโปรแกรม")
     print("="*60)
 
 def main():
@@ -271,7 +849,7 @@ def main():
     
     while True:
         show_menu()
-        choice = input("👉 เลือกคำสั่ง (1-9): ").strip()
+        choice = input("👉 เลือกคำสั่ง (1-12): ").strip()
         
         try:
             if choice == "1":
@@ -295,19 +873,71 @@ def main():
                 delay = float(delay_input) if delay_input else 2.0
                 tester.test_all_commands(device_id, delay)
             elif choice == "8":
+                ids_path = input("📄 ไฟล์ Device IDs (หนึ่งบรรทัดต่อ device): ").strip()
+                device_ids = load_device_ids(ids_path)
+                token = input("🔑 JWT token (Enter = ไม่ใช้): ").strip() or None
+                rounds = tester.benchmark_bulk_apply_config(device_ids, auth_token=token)
+                if any('error' not in r for r in rounds):
+                    prompt_save_run(rounds, config={"devices": len(device_ids)},
+                                    default_scenario="bulk-apply-config")
+            elif choice == "9":
+                ids_path = input("📄 ไฟล์ Device IDs (หนึ่งบรรทัดต่อ device): ").strip()
+                device_ids = load_device_ids(ids_path)
+                version = input("📦 Firmware version (Enter = latest): ").strip() or None
+                waves_input = input(f"🌊 Waves (default: {','.join(ROLLOUT_WAVES)}): ").strip()
+                waves = [w.strip() for w in waves_input.split(',') if w.strip()] if waves_input else None
+                limit_input = input("🔀 Max in-flight updates (default: 20): ").strip()
+                max_in_flight = int(limit_input) if limit_input else 20
+                threshold_input = input("⚠️  Failure threshold % (default: 10): ").strip()
+                threshold = float(threshold_input) / 100 if threshold_input else 0.1
+                while device_ids:
+                    rollout = tester.run_firmware_rollout(device_ids, version=version, waves=waves,
+                                                          max_in_flight=max_in_flight,
+                                                          failure_threshold=threshold)
+                    if not rollout['paused'] or not rollout['remaining']:
+                        break
+                    if input("▶️  Resume rollout? (y/N): ").strip().lower() != 'y':
+                        break
+                    device_ids = rollout['remaining']
+                    version = rollout['version']
+            elif choice == "10":
+                ids_path = input("📄 ไฟล์ Device IDs (หนึ่งบรรทัดต่อ device): ").strip()
+                device_ids = load_device_ids(ids_path)
+                mix_input = input("🎛️  Mix เช่น APPLY_CONFIG=40,RESTART=20 (Enter = default): ").strip()
+                mix = None
+                if mix_input:
+                    mix = {}
+                    for item in mix_input.split(','):
+                        name, _, weight = item.partition('=')
+                        mix[name.strip().upper()] = float(weight or 1)
+                rates_input = input(f"⚡ Request rate ต่อวินาที หรือหลายค่าสำหรับ sweep "
+                                    f"(default: {','.join(str(r) for r in COMMAND_BENCHMARK_RATES)}): ").strip()
+                rates = [float(r) for r in rates_input.split(',')] if rates_input else COMMAND_BENCHMARK_RATES
+                duration_input = input("⏱️  Duration ต่อขั้น (วินาที, default: 30): ").strip()
+                duration = float(duration_input) if duration_input else 30.0
+                config = {"devices": len(device_ids), "rates": rates, "duration": duration,
+                          "mix": mix or DEFAULT_COMMAND_MIX}
+                if len(rates) == 1:
+                    benchmark = tester.run_command_benchmark(device_ids, rates[0], duration, mix=mix)
+                    prompt_save_run({"overall": benchmark["overall"], "commands": benchmark["commands"]},
+                                    config=config, default_scenario=f"command-benchmark-{rates[0]:g}rps")
+                else:
+                    steps = tester.sweep_command_benchmark(device_ids, rates, duration, mix=mix)
+                    prompt_save_run(steps, config=config, default_scenario="command-benchmark-sweep")
+            elif choice == "11":
                 new_url = input(f"🔗 Enter API URL (current: {api_url}): ").strip()
                 if new_url:
                     api_url = new_url
                     tester = DeviceCommandsTester(api_url)
                     print(f"✅ API URL updated to: {api_url}")
-            elif choice == "9":
+            elif choice == "12":
                 print("👋 ออกจากโปรแกรม")
                 break
             else:
-                print("❌ กรุณาเลือกหมายเลข 1-9")
+                print("❌ กรุณาเลือกหมายเลข 1-12")
             
             # Pause before showing menu again
-            if choice not in ["8", "9"]:
+            if choice not in ["11", "12"]:
                 input("\n⏸️  กด Enter เพื่อกลับไปเมนูหลัก...")
         
         except KeyboardInterrupt:
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Hourly device health rollups of public.tbl_devices_state.
+
+tbl_devices_state gets one row per device per minute; long-range health charts should
+read one row per device per hour from:
+
+  rollup_device_state_hour (device_id, hour_start, ...)
+    messages          state rows received in the hour (including OFFLINE markers)
+    rssi_samples      rows with a real RSSI (OFFLINE markers carry rssi 0 / uptime 0)
+    rssi_min / rssi_avg / rssi_max
+    last_uptime       uptime (minutes) of the last non-OFFLINE row in the hour
+    normal_seconds / error_seconds / offline_seconds   (sum to 3600)
+
+hour_start is the local Asia/Bangkok hour, like the payment rollups.
+
+- Time in state: the status of a row holds until the next row of the device, at most
+  STALE_SECONDS (the server's offline timeout); time not covered by a NORMAL / ERROR
+  row counts as OFFLINE. One hour therefore only needs the rows of the hour and the
+  STALE_SECONDS before it, so hours are independent of each other
+- Only closed hours are rolled up (hour end older than CLOSE_DELAY_SECONDS, created_at
+  is the insert time); a watermark in rollup_watermarks marks the last closed hour done
+- Pending hours are split per partition of tbl_devices_state (plain time batches when
+  the table is not partitioned) into batches that run in parallel worker connections;
+  each batch replaces its hours (delete + insert) in one transaction, so re-running or
+  re-processing a range is idempotent. Hours no partition covers are logged and skipped
+- The watermark only moves once every batch succeeded
+- Devices without any row in the hour or the STALE_SECONDS before it get no row
+
+Usage:
+  python3 device_state_rollup.py                        # roll up closed hours since the watermark
+  python3 device_state_rollup.py run --workers 8        # catch up faster (first run: all history)
+  python3 device_state_rollup.py run --since 2026-10-01 # re-process from a local date
+  python3 device_state_rollup.py status
+"""
+
+import argparse
+import datetime as dt
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from psycopg2 import sql
+
+from partition_60d_cron import get_conn
+from partition_catalog import get_partitions, range_partitions
+from payment_rollup import TIME_ZONE, ensure_watermark_table, floor_hour, get_watermark, set_watermark
+
+ADVISORY_LOCK_KEY = 85123458  # arbitrary unique int for this job
+WATERMARK_NAME = "device_state_hour"
+PARENT_TABLE = "tbl_devices_state"
+ROLLUP_TABLE = "rollup_device_state_hour"
+
+STALE_SECONDS = 30 * 60  # device-state-processor OFFLINE_TIMEOUT
+CLOSE_DELAY_SECONDS = 120  # rows are batch inserted a few seconds after they arrive
+BATCH_HOURS = 24  # hours per transaction
+DEFAULT_WORKERS = 4
+
+HOUR_INSERT_SQL = """
+    INSERT INTO rollup_device_state_hour
+      (device_id, hour_start, messages, rssi_samples, rssi_min, rssi_avg, rssi_max, last_uptime,
+       normal_seconds, error_seconds, offline_seconds)
+    WITH msgs AS (
+      SELECT
+        s.device_id,
+        s.created_at,
+        s.state_data->>'status' AS status,
+        (s.state_data->>'rssi')::int AS rssi,
+        (s.state_data->>'uptime')::bigint AS uptime,
+        lead(s.created_at) OVER (PARTITION BY s.device_id ORDER BY s.created_at) AS next_at
+      FROM tbl_devices_state s
+      WHERE s.created_at >= %(lo)s::timestamptz - %(stale)s * interval '1 second'
+        AND s.created_at < %(hi)s
+    ),
+    spans AS (
+      -- status of each row until the next row, at most STALE_SECONDS
+      SELECT device_id, status, created_at AS from_at,
+             LEAST(COALESCE(next_at, %(hi)s), created_at + %(stale)s * interval '1 second') AS to_at
+      FROM msgs
+      WHERE status IN ('NORMAL', 'ERROR')
+    ),
+    hours AS (
+      SELECT h FROM generate_series(%(lo)s::timestamptz, %(hi)s::timestamptz - interval '1 hour', interval '1 hour') h
+    ),
+    in_state AS (
+      SELECT
+        sp.device_id,
+        hr.h,
+        SUM(extract(epoch FROM LEAST(sp.to_at, hr.h + interval '1 hour') - GREATEST(sp.from_at, hr.h)))
+          FILTER (WHERE sp.status = 'NORMAL') AS normal_seconds,
+        SUM(extract(epoch FROM LEAST(sp.to_at, hr.h + interval '1 hour') - GREATEST(sp.from_at, hr.h)))
+          FILTER (WHERE sp.status = 'ERROR') AS error_seconds
+      FROM spans sp
+      JOIN hours hr ON sp.from_at < hr.h + interval '1 hour' AND sp.to_at > hr.h
+      GROUP BY sp.device_id, hr.h
+    ),
+    stats AS (
+      SELECT
+        device_id,
+        date_trunc('hour', created_at) AS h,
+        count(*) AS messages,
+        count(rssi) FILTER (WHERE status <> 'OFFLINE') AS rssi_samples,
+        min(rssi) FILTER (WHERE status <> 'OFFLINE') AS rssi_min,
+        round(avg(rssi) FILTER (WHERE status <> 'OFFLINE'), 2) AS rssi_avg,
+        max(rssi) FILTER (WHERE status <> 'OFFLINE') AS rssi_max,
+        (array_agg(uptime ORDER BY created_at DESC) FILTER (WHERE status <> 'OFFLINE' AND uptime IS NOT NULL))[1]
+          AS last_uptime
+      FROM msgs
+      WHERE created_at >= %(lo)s
+      GROUP BY device_id, date_trunc('hour', created_at)
+    ),
+    merged AS (
+      SELECT
+        COALESCE(st.device_id, i.device_id) AS device_id,
+        COALESCE(st.h, i.h) AS h,
+        st.messages, st.rssi_samples, st.rssi_min, st.rssi_avg, st.rssi_max, st.last_uptime,
+        round(COALESCE(i.normal_seconds, 0))::int AS normal_seconds,
+        round(COALESCE(i.error_seconds, 0))::int AS error_seconds
+      FROM stats st
+      FULL JOIN in_state i ON i.device_id = st.device_id AND i.h = st.h
+    )
+    SELECT
+      device_id,
+      h AT TIME ZONE %(tz)s,
+      COALESCE(messages, 0),
+      COALESCE(rssi_samples, 0),
+      rssi_min, rssi_avg, rssi_max, last_uptime,
+      normal_seconds,
+      error_seconds,
+      3600 - normal_seconds - error_seconds
+    FROM merged;
+"""
+
+
+def ensure_schema(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "public".rollup_device_state_hour (
+          device_id       text      NOT NULL,
+          hour_start      timestamp NOT NULL,
+          messages        integer   NOT NULL,
+          rssi_samples    integer   NOT NULL,
+          rssi_min        integer,
+          rssi_avg        numeric(6,2),
+          rssi_max        integer,
+          last_uptime     bigint,
+          normal_seconds  integer   NOT NULL,
+          error_seconds   integer   NOT NULL,
+          offline_seconds integer   NOT NULL,
+          PRIMARY KEY (device_id, hour_start)
+        );
+        CREATE INDEX IF NOT EXISTS rollup_device_state_hour_hour_start_idx
+          ON "public".rollup_device_state_hour (hour_start);
+        """
+    )
+    ensure_watermark_table(cur)
+
+
+def rollup_hours(cur, lo: dt.datetime, hi: dt.datetime) -> int:
+    """Replace the rollup rows of the hours [lo, hi) (both hour aligned). Caller commits."""
+    params = {"lo": lo, "hi": hi, "tz": TIME_ZONE, "stale": STALE_SECONDS}
+    cur.execute(
+        """
+        DELETE FROM rollup_device_state_hour
+        WHERE hour_start >= %(lo)s::timestamptz AT TIME ZONE %(tz)s
+          AND hour_start < %(hi)s::timestamptz AT TIME ZONE %(tz)s;
+        """,
+        params
+    )
+    cur.execute(HOUR_INSERT_SQL, params)
+    return cur.rowcount
+
+
+def plan_batches(cur, lo: dt.datetime, hi: dt.datetime, batch_hours: int
+                 ) -> tuple[list[dict], list[tuple[dt.datetime, dt.datetime]]]:
+    """
+    Split the hours [lo, hi) along partition bounds of tbl_devices_state, then into
+    batches of at most batch_hours.
+
+    - Not partitioned (or no partitions yet): plain time batches over [lo, hi)
+    - Hours outside every range partition go to the DEFAULT partition if there is one,
+      otherwise they are returned as skipped (no row can exist there)
+
+    Returns (batches, skipped ranges).
+    """
+    partitions = get_partitions(cur, PARENT_TABLE)
+    default = next((p["name"] for p in partitions if p["is_default"]), None)
+    segments, skipped = [], []
+
+    def uncovered(start, end):
+        if default:
+            segments.append((default, start, end))
+        else:
+            skipped.append((start, end))
+
+    if not partitions:
+        segments.append((PARENT_TABLE, lo, hi))
+    else:
+        cursor = lo
+        for p in range_partitions(partitions):
+            start = lo if p["lower"] is None else max(lo, p["lower"])
+            end = hi if p["upper"] is None else min(hi, p["upper"])
+            if start >= end:
+                continue
+            if cursor < start:
+                uncovered(cursor, start)
+            segments.append((p["name"], start, end))
+            cursor = max(cursor, end)
+        if cursor < hi:
+            uncovered(cursor, hi)
+
+    batches = []
+    for name, start, end in segments:
+        while start < end:
+            batch_end = min(start + dt.timedelta(hours=batch_hours), end)
+            batches.append({"partition": name, "lo": start, "hi": batch_end})
+            start = batch_end
+    return batches, skipped
+
+
+def run_batch(batch: dict) -> dict:
+    """One batch in its own connection and transaction (runs in a worker thread)."""
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE 'UTC';")
+            t0 = time.perf_counter()
+            rows = rollup_hours(cur, batch["lo"], batch["hi"])
+            conn.commit()
+            return {**batch, "rows": rows, "seconds": time.perf_counter() - t0}
+    finally:
+        conn.close()
+
+
+def run_rollup(conn, cur, args):
+    cur.execute("SELECT date_trunc('hour', now() - %s * interval '1 second');", (CLOSE_DELAY_SECONDS,))
+    hi = cur.fetchone()[0]  # end of the last closed hour
+    watermark = get_watermark(cur, WATERMARK_NAME)
+    if args.since:
+        cur.execute("SELECT %s::timestamp AT TIME ZONE %s;", (args.since, TIME_ZONE))
+        lo = cur.fetchone()[0]
+    elif watermark is not None:
+        lo = watermark
+    else:
+        cur.execute("SELECT min(created_at) FROM tbl_devices_state;")
+        lo = cur.fetchone()[0]
+        if lo is None:
+            print("tbl_devices_state is empty, nothing to roll up")
+            return
+    lo = floor_hour(cur, lo)
+    if lo >= hi:
+        print(f"Up to date (watermark {watermark})")
+        return
+    batches, skipped = plan_batches(cur, lo, hi, args.batch_hours)
+    conn.commit()
+    for start, end in skipped:
+        print(f"  WARNING: skipping {int((end - start).total_seconds() // 3600)} hour(s) {start} .. {end}: "
+              f"no partition of {PARENT_TABLE} covers them", file=sys.stderr)
+
+    hours = int((hi - lo).total_seconds() // 3600)
+    partitions = sorted({b["partition"] for b in batches})
+    print(f"Rolling up {hours} closed hour(s) {lo} .. {hi}: {len(batches)} batch(es) over "
+          f"{len(partitions)} partition(s), {args.workers} worker(s)")
+    started = time.perf_counter()
+    rows = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_batch, b): b for b in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                done = future.result()
+            except Exception as e:
+                failed.append(batch)
+                print(f"  FAILED {batch['partition']} {batch['lo']} .. {batch['hi']}: {e}", file=sys.stderr)
+                continue
+            rows += done["rows"]
+            print(f"  {done['partition']} {done['lo']} .. {done['hi']}: {done['rows']} row(s) in {done['seconds']:.2f}s")
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} batch(es) failed, watermark stays at {watermark}")
+    if watermark is None or hi > watermark:
+        set_watermark(cur, WATERMARK_NAME, hi)
+    conn.commit()
+    print(f"Rolled up {rows} device-hour row(s) in {time.perf_counter() - started:.2f}s; "
+          f"watermark {max(hi, watermark or hi)}")
+
+
+def run_status(conn, cur, args):
+    watermark = get_watermark(cur, WATERMARK_NAME)
+    cur.execute("SELECT date_trunc('hour', now() - %s * interval '1 second');", (CLOSE_DELAY_SECONDS,))
+    closed = cur.fetchone()[0]
+    print(f"Watermark: {watermark or 'none (never run)'}")
+    if watermark and closed > watermark:
+        print(f"  {int((closed - watermark).total_seconds() // 3600)} closed hour(s) pending")
+    cur.execute(sql.SQL('SELECT count(*), count(DISTINCT device_id), min(hour_start), max(hour_start) FROM {};')
+                .format(sql.Identifier(ROLLUP_TABLE)))
+    rows, devices, first, last = cur.fetchone()
+    print(f"  {ROLLUP_TABLE}: {rows} rows, {devices} device(s), {first} .. {last}")
+
+
+COMMANDS = {
+    "run": run_rollup,
+    "status": run_status,
+}
+
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0].startswith("-"):
+        argv.insert(0, "run")  # default command keeps the plain cron invocation working
+
+    parser = argparse.ArgumentParser(description="Hourly device health rollups of tbl_devices_state")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="roll up closed hours since the watermark (default)")
+    run.add_argument("--since", type=dt.date.fromisoformat,
+                     help="re-process from this local (Asia/Bangkok) date")
+    run.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                     help=f"parallel connections (default: {DEFAULT_WORKERS})")
+    run.add_argument("--batch-hours", type=int, default=BATCH_HOURS,
+                     help=f"hours per transaction (default: {BATCH_HOURS})")
+
+    sub.add_parser("status", help="show the watermark and rollup table size")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = None
+    try:
+        conn = get_conn()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE 'UTC';")
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (ADVISORY_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                print("Another device state rollup is running. Exiting.")
+                return
+            try:
+                ensure_schema(cur)
+                conn.autocommit = False
+                COMMANDS[args.command](conn, cur, args)
+                conn.commit()
+            finally:
+                conn.rollback()
+                conn.autocommit = True
+                cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_KEY,))
+    except Exception as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,140 @@
 #!/usr/bin/env python3
 """
-Create next 60-day partitions for:
+Ensure partition coverage (60-day windows by default) for:
   - public.tbl_devices_state
   - public.tbl_devices_events
 
 Idempotent & safe:
 - Uses an advisory lock to avoid concurrent runs
-- Derives the next partition window from the latest existing one
-  (fallback to 60-day bucket aligned around "today" if none exist)
-- Creates per-partition indexes and a per-partition primary key on (id)
+- Reads the real partition bounds from the catalog (partition_catalog.py), not from
+  child table names
+- Plans every missing window inside a coverage target
+  (today - retention_days .. today + ahead_days) and creates them all in one run,
+  continuing the chain after existing partitions (bucket aligned when none exist)
+- Window length per table: daily, weekly (Monday aligned), 30d or 60d, or "adaptive":
+  picks the granularity whose expected partition size stays under target_bytes /
+  target_rows, based on the size and row count of recent partitions
+- Creates each window as a standalone table with its indexes, primary key on (id) and a
+  CHECK constraint matching the bounds, then ATTACH PARTITION (no validation scan,
+  SHARE UPDATE EXCLUSIVE on the parent, so inserts keep flowing)
+- Every DDL step runs in its own short transaction with lock_timeout; on a lock timeout
+  it is retried with jittered exponential backoff, and the lock wait and retries are
+  reported, so a long dashboard query or MV refresh never queues inserts behind the job
+- Index policy: hot (current and future) partitions get "indexes", sealed ones
+  (upper bound older than seal_after_days) get "sealed_indexes"; `seal` builds the cheaper
+  sealed indexes online, drops the heavier hot-only ones and reports disk/cache saved
+- --online: also checks every existing partition and builds missing indexes with
+  CREATE INDEX CONCURRENTLY and the PK with USING INDEX; invalid indexes left by an
+  interrupted build are dropped and rebuilt, build time is reported per index
+- Lifecycle hooks (`maintain`): ANALYZE a hot partition once it holds analyze_after_rows
+  rows and was never analyzed, VACUUM (FREEZE, ANALYZE) a partition once it is sealed
+  (again if it changed afterwards), and with --prewarm pg_prewarm the indexes of the hot
+  partitions once after every server restart; each action is timed and recorded in
+  partition_maintenance_log
+- Retention: partitions whose upper bound is older than today - retention_days are
+  detached with DETACH PARTITION ... CONCURRENTLY (inserts keep flowing), then dropped
+  or kept as standalone tables according to retention_policy
+
+Usage:
+  python3 partition_60d_cron.py                     # ensure coverage (default 180 days ahead)
+  python3 partition_60d_cron.py --dry-run           # print the plan only
+  python3 partition_60d_cron.py --ahead-days 365 --table tbl_devices_state
+  python3 partition_60d_cron.py --granularity weekly --table tbl_devices_state --dry-run
+  python3 partition_60d_cron.py --online            # build indexes with CREATE INDEX CONCURRENTLY
+  python3 partition_60d_cron.py seal --dry-run      # swap sealed partitions to their cheaper indexes
+  python3 partition_60d_cron.py maintain --prewarm  # ANALYZE / VACUUM FREEZE / pg_prewarm hooks
+  python3 partition_60d_cron.py retention --dry-run # list expired partitions and bytes to reclaim
+  python3 partition_60d_cron.py retention
+  python3 partition_60d_cron.py report --sizes      # partitions, row estimates, sizes, gaps
 """
 
+import argparse
 import os
+import random
 import sys
+import time
 import datetime as dt
 import psycopg2
-from urllib.parse import urlparse
+import psycopg2.errors
+from psycopg2 import sql
+
+from partition_catalog import (
+    describe,
+    find_overlaps,
+    format_bytes,
+    get_partition_indexes,
+    get_partition_stats,
+    get_partitions,
+    range_partitions,
+)
 
 PARENT_TABLES = [
     {
         "name": "tbl_devices_state",
-        "index_sqls": [
-            'CREATE INDEX IF NOT EXISTS {part}_created_at_idx ON "public"."{part}"("created_at");',
-            'CREATE INDEX IF NOT EXISTS {part}_dev_created_idx ON "public"."{part}"("device_id","created_at");',
+        "retention_days": 180,
+        "retention_policy": "drop",  # drop | keep (detach only, e.g. to archive first)
+        # one row per device per minute: size windows from observed volume
+        "granularity": "adaptive",  # daily | weekly | 30d | 60d | adaptive
+        "target_bytes": 16 * 1024 ** 3,  # adaptive: keep a partition (table + indexes) under this
+        # hot (current / future) partitions
+        "indexes": [
+            {"name": "{part}_created_at_idx", "columns": ["created_at"]},
+            {"name": "{part}_dev_created_idx", "columns": ["device_id", "created_at"]},
+        ],
+        # sealed partitions are only scanned by time range (and per device):
+        # rows arrive in created_at order, so a BRIN replaces the created_at btree
+        "sealed_indexes": [
+            {"name": "{part}_created_at_brin", "columns": ["created_at"], "using": "brin",
+             "with": {"pages_per_range": 32}},
+            {"name": "{part}_dev_created_idx", "columns": ["device_id", "created_at"]},
         ],
     },
     {
         "name": "tbl_devices_events",
-        "index_sqls": [
-            'CREATE INDEX IF NOT EXISTS {part}_created_at_idx ON "public"."{part}"("created_at");',
-            'CREATE INDEX IF NOT EXISTS {part}_dev_created_idx ON "public"."{part}"("device_id","created_at");',
+        "retention_days": 730,
+        "retention_policy": "keep",  # PAYMENT history: archive detached partitions before dropping
+        "granularity": "60d",
+        # hot (current / future) partitions
+        "indexes": [
+            {"name": "{part}_created_at_idx", "columns": ["created_at"]},
+            {"name": "{part}_dev_created_idx", "columns": ["device_id", "created_at"]},
+        ],
+        # sealed partitions are only scanned by time range (and per device):
+        # rows arrive in created_at order, so a BRIN replaces the created_at btree
+        "sealed_indexes": [
+            {"name": "{part}_created_at_brin", "columns": ["created_at"], "using": "brin",
+             "with": {"pages_per_range": 32}},
+            {"name": "{part}_dev_created_idx", "columns": ["device_id", "created_at"]},
         ],
     },
 ]
 
 ADVISORY_LOCK_KEY = 85123456  # arbitrary unique int for this job
 
+PARTITION_DAYS = 60
+DEFAULT_AHEAD_DAYS = 180
+
+EPOCH = dt.date(1970, 1, 1)
+GRANULARITIES = {
+    # name: window length and the date bucket boundaries are counted from
+    "daily": {"days": 1, "anchor": EPOCH},
+    "weekly": {"days": 7, "anchor": dt.date(1970, 1, 5)},  # Monday
+    "30d": {"days": 30, "anchor": EPOCH},
+    "60d": {"days": PARTITION_DAYS, "anchor": EPOCH},
+}
+DEFAULT_GRANULARITY = "60d"
+ADAPTIVE_SAMPLE_PARTITIONS = 3  # recent partitions used to measure volume per day
+
+INDEX_BUILD_ATTEMPTS = 3
+SEAL_AFTER_DAYS = 1  # grace for late rows before a partition counts as sealed
+ANALYZE_AFTER_ROWS = 100_000  # first ANALYZE of a new partition (autoanalyze waits far longer)
+MAINTENANCE_LOG_TABLE = "partition_maintenance_log"
+DDL_LOCK_TIMEOUT_MS = 2000  # per DDL statement; give up the lock queue quickly
+DDL_MAX_ATTEMPTS = 8
+DDL_RETRY_BASE_SECONDS = 1.0  # jittered exponential backoff: uniform(0, base * 2^attempt)
+DDL_RETRY_MAX_SECONDS = 30.0
+INDEX_RETRY_DELAY_SECONDS = 5
+
 
 def get_conn():
     """
@@ -53,153 +152,866 @@ def get_conn():
     return psycopg2.connect(host=host, port=port, user=user, password=password, dbname=dbname)
 
 
-def floor_to_60day_bucket(date_: dt.date) -> dt.date:
+def floor_to_bucket(date_: dt.date, days: int, anchor: dt.date = EPOCH) -> dt.date:
     """
-    Align a date to the start of its 60-day bucket, anchored at 1970-01-01.
+    Align a date to the start of its bucket of `days` days, counted from anchor.
     """
-    epoch = dt.date(1970, 1, 1)
-    days = (date_ - epoch).days
-    offset = days % 60
+    offset = (date_ - anchor).days % days
     return date_ - dt.timedelta(days=offset)
 
 
-def get_latest_partition_end(cur, parent_table: str) -> dt.date | None:
+def partition_name(parent_table: str, start: dt.date, end: dt.date) -> str:
+    """parent_YYYYMMDD_to_YYYYMMDD"""
+    return f'{parent_table}_{start.strftime("%Y%m%d")}_to_{end.strftime("%Y%m%d")}'
+
+
+def get_partition_windows(cur, parent_table: str) -> list[tuple[dt.date, dt.date, str]]:
     """
-    Read the latest partition end date by parsing child table names:
-      parent_YYYYMMDD_to_YYYYMMDD
-    Returns a date or None when there are no partitions.
+    List the attached range partitions of a parent as (start, end, name), sorted by start.
+    Windows are the real bounds from the catalog (the DEFAULT partition is skipped with a warning).
     """
-    sql = """
-    SELECT to_date(substring(c.relname from '.*_to_(\\d{8})$'), 'YYYYMMDD') AS end_date
-    FROM pg_class c
-    JOIN pg_namespace n ON n.oid = c.relnamespace
-    WHERE n.nspname = 'public'
-      AND c.relname LIKE %s
-    ORDER BY end_date DESC
-    LIMIT 1;
+    windows = []
+    for p in get_partitions(cur, parent_table):
+        if p["is_default"]:
+            print(f"WARNING: {parent_table} has a DEFAULT partition: {p['name']}", file=sys.stderr)
+            continue
+        windows.append((p["start"], p["end"], p["name"]))
+    return windows
+
+
+def plan_missing_windows(existing: list[tuple[dt.date, dt.date]], coverage_start: dt.date,
+                         coverage_end: dt.date, granularity: str = DEFAULT_GRANULARITY
+                         ) -> list[tuple[dt.date, dt.date]]:
     """
-    like_pat = f"{parent_table}_%_to_%"
-    cur.execute(sql, (like_pat,))
-    row = cur.fetchone()
-    return row[0] if row and row[0] is not None else None
+    Plan the windows of one granularity needed so that [coverage_start, coverage_end)
+    is fully covered.
+
+    - A gap right after an existing partition of the same length continues the chain
+      from its end (same behaviour as the old "next partition" run). So does a gap right
+      after a partition whose length is no granularity at all (a migration partition).
+    - A gap that runs into an existing partition is tiled backwards from that partition's
+      start, so e.g. a migration partition starting mid-bucket does not leave a sliver.
+    - Otherwise windows follow the granularity's buckets: the first one may be shortened
+      to end on a bucket boundary (e.g. when switching from 60d to weekly), and never
+      starts before the end of an earlier partition.
+    - The last window before an existing partition is shortened so windows never overlap.
+    """
+    days = GRANULARITIES[granularity]["days"]
+    anchor = GRANULARITIES[granularity]["anchor"]
+    existing = sorted(existing)
+    planned = []
+    cursor = coverage_start
+    for start, end in existing + [(None, None)]:
+        gap_end = coverage_end if start is None else min(start, coverage_end)
+        if cursor < gap_end:
+            prev = max(((e, s) for s, e in existing if e <= cursor), default=None)
+            prev_end = prev[0] if prev else None
+            # Chain from a same-length partition, and from an irregular one (a migration
+            # partition), so the window after it is not cut short at the next bucket.
+            prev_days = (prev[0] - prev[1]).days if prev else None
+            chain = prev_end == cursor and (
+                prev_days == days or prev_days not in {g["days"] for g in GRANULARITIES.values()})
+            if prev_end == cursor:
+                window_start = cursor
+            elif gap_end == start:
+                # The gap runs into an existing partition (e.g. a migration partition that
+                # starts on the first data day): tile backwards from its start so the only
+                # short window, if any, is the first one.
+                steps = -(-(gap_end - cursor).days // days)
+                for i in range(steps, 0, -1):
+                    window_start = gap_end - dt.timedelta(days=i * days)
+                    if prev_end is not None:
+                        window_start = max(window_start, prev_end)
+                    planned.append((window_start, gap_end - dt.timedelta(days=(i - 1) * days)))
+                window_start = gap_end
+            else:
+                window_start = floor_to_bucket(cursor, days, anchor)
+                if prev_end is not None:
+                    window_start = max(window_start, prev_end)
+            while window_start < gap_end:
+                if chain:
+                    window_end = window_start + dt.timedelta(days=days)
+                else:
+                    window_end = floor_to_bucket(window_start, days, anchor) + dt.timedelta(days=days)
+                if start is not None:
+                    window_end = min(window_end, start)
+                planned.append((window_start, window_end))
+                window_start = window_end
+        if end is not None:
+            cursor = max(cursor, end)
+        if cursor >= coverage_end:
+            break
+    return planned
 
 
-def create_next_partition(cur, parent_table: str, index_sqls: list[str]) -> str:
+def index_statement(part_name: str, index: dict, concurrently: bool = False) -> sql.Composed:
     """
-    Create the next 60-day partition after the latest existing partition.
-    If none exists, start from today's 60-day bucket.
-    Returns the created partition name (or existing one if already present).
+    CREATE [UNIQUE] INDEX [CONCURRENTLY] IF NOT EXISTS for one index spec of PARENT_TABLES:
+    {"name": "{part}_..._idx", "columns": [...], "unique": bool, "using": "btree", "with": {...}}.
     """
-    latest_end = get_latest_partition_end(cur, parent_table)
+    params = index.get("with") or {}
+    with_clause = sql.SQL(" WITH ({})").format(sql.SQL(", ").join(
+        sql.SQL("{} = {}").format(sql.Identifier(k), sql.Literal(v)) for k, v in params.items()
+    )) if params else sql.SQL("")
+    return sql.SQL('CREATE {unique}INDEX {concurrently}IF NOT EXISTS {name} ON "public".{part} '
+                   'USING {using} ({cols}){with_clause};').format(
+        unique=sql.SQL("UNIQUE " if index.get("unique") else ""),
+        concurrently=sql.SQL("CONCURRENTLY " if concurrently else ""),
+        name=sql.Identifier(index["name"].format(part=part_name)),
+        part=sql.Identifier(part_name),
+        using=sql.SQL(index.get("using", "btree")),
+        cols=sql.SQL(", ").join(sql.Identifier(c) for c in index["columns"]),
+        with_clause=with_clause,
+    )
 
-    if latest_end is None:
-        # No partitions yet → start from the current bucket start
-        today = dt.date.today()
-        start = floor_to_60day_bucket(today)
-        end = start + dt.timedelta(days=60)
-    else:
-        # Continue right after the latest end
-        start = latest_end
-        end = start + dt.timedelta(days=60)
 
-    part_name = f'{parent_table}_{start.strftime("%Y%m%d")}_to_{end.strftime("%Y%m%d")}'
+def is_sealed(table: dict, partition_end: dt.date, today: dt.date) -> bool:
+    """A partition is sealed once its upper bound is seal_after_days in the past."""
+    return partition_end <= today - dt.timedelta(days=table.get("seal_after_days", SEAL_AFTER_DAYS))
+
 
-    # Create partition if not exists
+def wanted_indexes(table: dict, sealed: bool) -> list[dict]:
+    """Index specs of the hot or the sealed policy of one table."""
+    if sealed:
+        return table.get("sealed_indexes", table["indexes"])
+    return table["indexes"]
+
+
+def parent_key_constraints(cur, parent_table: str) -> list[dict]:
+    """
+    PRIMARY KEY / UNIQUE constraints of a parent, as {"type": "p"|"u", "columns": [...]}.
+    A partition attached to the parent must carry the same constraints (not just a
+    unique index) for ATTACH PARTITION to adopt them.
+    """
     cur.execute(
-        f'''
-        DO $$
-        BEGIN
-          IF NOT EXISTS (
-            SELECT 1
-            FROM   pg_class c
-            JOIN   pg_namespace n ON n.oid = c.relnamespace
-            WHERE  n.nspname = 'public'
-            AND    c.relname = %s
-          ) THEN
-            EXECUTE format($f$
-              CREATE TABLE "public"."%I"
-              PARTITION OF "public"."{parent_table}"
-              FOR VALUES FROM (%L) TO (%L)
-            $f$, %s, %s::date, %s::date);
-          END IF;
-        END $$;
-        ''',
-        (part_name, part_name, start.isoformat(), end.isoformat())
+        """
+        SELECT c.contype, array_agg(a.attname ORDER BY k.ord)
+        FROM pg_constraint c
+        CROSS JOIN LATERAL unnest(c.conkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+        WHERE c.conrelid = format('public.%%I', %s::text)::regclass AND c.contype IN ('p', 'u')
+        GROUP BY c.oid, c.contype
+        ORDER BY c.contype;
+        """,
+        (parent_table,)
     )
+    return [{"type": contype, "columns": list(columns)} for contype, columns in cur.fetchall()]
+
+
+def key_constraint_statements(part_name: str, keys: list[dict]) -> list[sql.Composed]:
+    """
+    ADD CONSTRAINT statements giving a standalone table the parent's PRIMARY KEY / UNIQUE
+    constraints (see parent_key_constraints); a PRIMARY KEY on (id) when the parent has none.
+    """
+    if not any(k["type"] == "p" for k in keys):
+        keys = [{"type": "p", "columns": ["id"]}] + keys
+    statements = []
+    for key in keys:
+        name = f"{part_name}_pkey" if key["type"] == "p" else f"{part_name}_{'_'.join(key['columns'])}_key"
+        statements.append(sql.SQL('ALTER TABLE "public".{} ADD CONSTRAINT {} {} ({});').format(
+            sql.Identifier(part_name),
+            sql.Identifier(name),
+            sql.SQL("PRIMARY KEY" if key["type"] == "p" else "UNIQUE"),
+            sql.SQL(", ").join(sql.Identifier(c) for c in key["columns"]),
+        ))
+    return statements
+
+
+def new_ddl_stats() -> dict:
+    return {"statements": 0, "retries": 0, "lock_wait_seconds": 0.0, "seconds": 0.0}
+
+
+def run_ddl(cur, label: str, statements: list, stats: dict):
+    """
+    Run statements in one short transaction with SET LOCAL lock_timeout.
+    The cursor's connection must be in autocommit mode (BEGIN/COMMIT are explicit).
+
+    When a lock is not granted within DDL_LOCK_TIMEOUT_MS the transaction is rolled
+    back, so nothing queues behind it, and retried after a jittered exponential
+    backoff. stats collects retries, time lost waiting (timeouts + backoff) and total time.
+    """
+    for attempt in range(1, DDL_MAX_ATTEMPTS + 1):
+        started = time.monotonic()
+        try:
+            cur.execute("BEGIN;")
+            cur.execute("SELECT set_config('lock_timeout', %s, true);", (f"{DDL_LOCK_TIMEOUT_MS}ms",))
+            for stmt in statements:
+                if isinstance(stmt, tuple):
+                    cur.execute(*stmt)
+                else:
+                    cur.execute(stmt)
+            cur.execute("COMMIT;")
+            elapsed = time.monotonic() - started
+            stats["statements"] += len(statements)
+            stats["seconds"] += elapsed
+            return
+        except psycopg2.errors.LockNotAvailable:
+            cur.execute("ROLLBACK;")
+            waited = time.monotonic() - started
+            if attempt == DDL_MAX_ATTEMPTS:
+                stats["lock_wait_seconds"] += waited
+                raise RuntimeError(f"{label}: lock not acquired after {DDL_MAX_ATTEMPTS} attempts")
+            delay = random.uniform(0, min(DDL_RETRY_MAX_SECONDS, DDL_RETRY_BASE_SECONDS * 2 ** attempt))
+            print(f"    {label}: lock_timeout after {waited:.1f}s, retry {attempt} in {delay:.1f}s")
+            time.sleep(delay)
+            stats["retries"] += 1
+            stats["lock_wait_seconds"] += waited + delay
+            stats["seconds"] += waited + delay
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+
+
+def create_partition(cur, parent_table: str, start: dt.date, end: dt.date, indexes: list[dict],
+                     stats: dict | None = None) -> str:
+    """
+    Create one partition FOR VALUES FROM (start) TO (end) with its indexes and keys:
+
+    1. standalone table LIKE the parent + indexes + CHECK on the bounds (nobody writes
+       to it yet, so plain CREATE INDEX is fine), then the parent's PRIMARY KEY / UNIQUE
+       constraints (PRIMARY KEY (id) when the parent has none) so ATTACH adopts them
+    2. ALTER TABLE parent ATTACH PARTITION: the CHECK constraint proves the bounds,
+       so there is no validation scan, and only SHARE UPDATE EXCLUSIVE is taken on the parent
+    3. drop the now redundant CHECK constraint (best effort)
 
-    # Per-partition indexes
-    for stmt in index_sqls:
-        cur.execute(stmt.format(part=part_name))
+    Each step is a separate lock_timeout-guarded transaction (run_ddl).
+    A leftover empty standalone table from an interrupted run is dropped and recreated.
+    Returns the partition name.
+    """
+    stats = stats if stats is not None else new_ddl_stats()
+    part_name = partition_name(parent_table, start, end)
+    part = sql.Identifier(part_name)
+    parent = sql.Identifier(parent_table)
+    check_name = sql.Identifier(f"{part_name}_bounds_check")
 
-    # Best-effort add per-partition PK on (id)
     cur.execute(
-        f'''
-        DO $$
-        DECLARE
-          conname text := %s || '_pkey';
-          rel regclass := format('public.%s', %s)::regclass;
-        BEGIN
-          IF NOT EXISTS (
-            SELECT 1 FROM pg_constraint
-            WHERE conname = conname
-              AND conrelid = rel
-          ) THEN
-            EXECUTE format('ALTER TABLE "public"."%s" ADD CONSTRAINT %s PRIMARY KEY ("id");', %s, conname);
-          END IF;
-        END $$;
-        ''',
-        (part_name, part_name, part_name)
+        "SELECT c.relispartition FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = 'public' AND c.relname = %s;",
+        (part_name,)
     )
+    row = cur.fetchone()
+    if row and row[0]:
+        return part_name  # already attached
+    if row:
+        cur.execute(sql.SQL('SELECT EXISTS (SELECT 1 FROM "public".{});').format(part))
+        if cur.fetchone()[0]:
+            raise RuntimeError(f'Standalone table "public.{part_name}" already exists and holds rows '
+                               f'(a detached partition?); archive or drop it first')
+        # empty leftover of an interrupted run: its keys may not match the parent
+        run_ddl(cur, f"drop leftover {part_name}", [
+            sql.SQL('DROP TABLE "public".{};').format(part)
+        ], stats)
+
+    bounds = (start.isoformat(), end.isoformat())
+    steps = [
+        sql.SQL('CREATE TABLE "public".{} (LIKE "public".{} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);')
+        .format(part, parent),
+        (sql.SQL('ALTER TABLE "public".{} ADD CONSTRAINT {} '
+                 'CHECK ("created_at" IS NOT NULL AND "created_at" >= %s AND "created_at" < %s);')
+         .format(part, check_name), bounds),
+    ]
+    steps += [index_statement(part_name, index) for index in indexes]
+    steps += key_constraint_statements(part_name, parent_key_constraints(cur, parent_table))
+    run_ddl(cur, f"create {part_name}", steps, stats)
+
+    run_ddl(cur, f"attach {part_name}", [
+        (sql.SQL('ALTER TABLE "public".{} ATTACH PARTITION "public".{} FOR VALUES FROM (%s) TO (%s);')
+         .format(parent, part), bounds)
+    ], stats)
+
+    try:
+        run_ddl(cur, f"drop check {part_name}", [
+            sql.SQL('ALTER TABLE "public".{} DROP CONSTRAINT IF EXISTS {};').format(part, check_name)
+        ], stats)
+    except RuntimeError as e:
+        print(f"WARNING: {e}; leaving the redundant CHECK constraint in place", file=sys.stderr)
 
     return part_name
 
 
-def main():
+def build_index_online(cur, part_name: str, index: dict) -> tuple[float, int]:
+    """
+    Build one index with CREATE INDEX CONCURRENTLY (autocommit connection).
+    A failed concurrent build leaves an INVALID index behind: it is dropped with
+    DROP INDEX CONCURRENTLY and the build retried up to INDEX_BUILD_ATTEMPTS times.
+    Returns (seconds, attempts).
+    """
+    name = index["name"].format(part=part_name)
+    for attempt in range(1, INDEX_BUILD_ATTEMPTS + 1):
+        started = time.monotonic()
+        try:
+            cur.execute(index_statement(part_name, index, concurrently=True))
+            return time.monotonic() - started, attempt
+        except psycopg2.Error as e:
+            print(f"    {name}: attempt {attempt} failed: {str(e).strip()}", file=sys.stderr)
+            cur.execute(sql.SQL('DROP INDEX CONCURRENTLY IF EXISTS "public".{};').format(sql.Identifier(name)))
+            if attempt == INDEX_BUILD_ATTEMPTS:
+                raise
+            time.sleep(INDEX_RETRY_DELAY_SECONDS * attempt)
+
+
+def add_primary_key_using_index(cur, part_name: str, index_name: str):
+    """Promote a valid unique index on (id) to the partition's PK (brief metadata lock only)."""
+    cur.execute(
+        sql.SQL('ALTER TABLE "public".{} ADD CONSTRAINT {} PRIMARY KEY USING INDEX {};')
+        .format(sql.Identifier(part_name), sql.Identifier(index_name), sql.Identifier(index_name))
+    )
+
+
+def ensure_indexes_online(cur, table: dict, today: dt.date, dry_run: bool = False) -> list[dict]:
+    """
+    Make every partition of one parent carry valid copies of the indexes of its policy
+    (hot or sealed, see wanted_indexes) and PK, building what is missing online. Invalid indexes (interrupted concurrent builds) are dropped and
+    rebuilt. The PK is added with ADD CONSTRAINT ... PRIMARY KEY USING INDEX on a unique
+    index built concurrently, so only a brief metadata lock is taken.
+    The cursor's connection must be in autocommit mode.
+    Returns one {"partition", "index", "seconds", "attempts"} entry per built index.
+    """
+    parent = table["name"]
+    pk = {"name": "{part}_pkey", "columns": ["id"], "unique": True}
+    ends = {p["name"]: p["end"] for p in range_partitions(get_partitions(cur, parent))}
+    built = []
+    for part_name, indexes in get_partition_indexes(cur, parent).items():
+        if part_name not in ends:
+            continue  # DEFAULT partition
+        has_pk = any(i["primary"] for i in indexes.values())
+        sealed = is_sealed(table, ends[part_name], today)
+        wanted = list(wanted_indexes(table, sealed)) + ([] if has_pk else [pk])
+        for index in wanted:
+            name = index["name"].format(part=part_name)
+            state = indexes.get(name)
+            if state is not None and state["valid"]:
+                if index is pk and not dry_run:
+                    # unique index built by an interrupted run, PK constraint not added yet
+                    add_primary_key_using_index(cur, part_name, name)
+                    print(f"  added {name} using existing index")
+                continue
+            if dry_run:
+                action = "rebuild invalid" if state is not None else "build"
+                print(f"  [dry-run] {action} {name} CONCURRENTLY on {part_name}")
+                continue
+            if state is not None:
+                print(f"  dropping invalid index {name}")
+                cur.execute(sql.SQL('DROP INDEX CONCURRENTLY IF EXISTS "public".{};').format(sql.Identifier(name)))
+            seconds, attempts = build_index_online(cur, part_name, index)
+            if index is pk:
+                add_primary_key_using_index(cur, part_name, name)
+            retries = f", {attempts} attempts" if attempts > 1 else ""
+            print(f"  built {name} in {seconds:.2f}s{retries}")
+            built.append({"partition": part_name, "index": name, "seconds": seconds, "attempts": attempts})
+    return built
+
+
+def cached_bytes(cur, index_name: str) -> int | None:
+    """Bytes of an index currently in shared_buffers (None without the pg_buffercache extension)."""
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_buffercache');")
+    if not cur.fetchone()[0]:
+        return None
+    cur.execute(
+        """
+        SELECT count(*) * current_setting('block_size')::bigint
+        FROM pg_buffercache b
+        WHERE b.relfilenode = pg_relation_filenode(format('public.%%I', %s::text)::regclass)
+          AND b.reldatabase = (SELECT oid FROM pg_database WHERE datname = current_database());
+        """,
+        (index_name,)
+    )
+    return cur.fetchone()[0]
+
+
+def apply_index_policy(cur, table: dict, today: dt.date, dry_run: bool = False) -> dict:
+    """
+    Move sealed partitions of one parent from the hot index set to the sealed one:
+    build the missing sealed indexes with CREATE INDEX CONCURRENTLY first, then drop the
+    hot-only indexes with DROP INDEX CONCURRENTLY (never the PK or indexes inherited from
+    a parent index, never indexes this policy does not manage).
+    The cursor's connection must be in autocommit mode.
+    Returns {"partitions", "dropped_bytes", "built_bytes", "cache_bytes"}.
+    """
+    parent = table["name"]
+    hot_names = {i["name"] for i in table["indexes"]}
+    sealed_names = {i["name"] for i in wanted_indexes(table, sealed=True)}
+    result = {"partitions": 0, "dropped_bytes": 0, "built_bytes": 0, "cache_bytes": 0}
+    if hot_names == sealed_names:
+        print(f"{parent}: no separate sealed index policy")
+        return result
+
+    index_state = get_partition_indexes(cur, parent)
+    sealed = [p for p in range_partitions(get_partitions(cur, parent)) if is_sealed(table, p["end"], today)]
+    print(f"{parent}: {len(sealed)} sealed partition(s)")
+    for p in sealed:
+        part_name = p["name"]
+        indexes = index_state.get(part_name, {})
+        build = [i for i in wanted_indexes(table, sealed=True)
+                 if not indexes.get(i["name"].format(part=part_name), {}).get("valid")]
+        drop = [
+            name for name, st in indexes.items()
+            if any(name == n.format(part=part_name) for n in hot_names - sealed_names)
+            and not st["primary"] and not st["inherited"]
+        ]
+        if not build and not drop:
+            continue
+        result["partitions"] += 1
+        drop_bytes = sum(indexes[name]["bytes"] for name in drop)
+        if dry_run:
+            for index in build:
+                print(f"  [dry-run] build {index['name'].format(part=part_name)} "
+                      f"({index.get('using', 'btree')}) CONCURRENTLY")
+            for name in drop:
+                print(f"  [dry-run] drop {name} ({format_bytes(indexes[name]['bytes'])})")
+            result["dropped_bytes"] += drop_bytes
+            continue
+
+        for index in build:
+            name = index["name"].format(part=part_name)
+            if name in indexes:  # invalid leftover
+                cur.execute(sql.SQL('DROP INDEX CONCURRENTLY IF EXISTS "public".{};').format(sql.Identifier(name)))
+            seconds, attempts = build_index_online(cur, part_name, index)
+            cur.execute("SELECT pg_relation_size(format('public.%%I', %s::text)::regclass);", (name,))
+            size = cur.fetchone()[0]
+            result["built_bytes"] += size
+            print(f"  built {name} ({index.get('using', 'btree')}, {format_bytes(size)}) in {seconds:.2f}s")
+        for name in drop:
+            cache = cached_bytes(cur, name)
+            cur.execute(sql.SQL('DROP INDEX CONCURRENTLY IF EXISTS "public".{};').format(sql.Identifier(name)))
+            result["dropped_bytes"] += indexes[name]["bytes"]
+            result["cache_bytes"] += cache or 0
+            cached = f", {format_bytes(cache)} was cached" if cache is not None else ""
+            print(f"  dropped {name} ({format_bytes(indexes[name]['bytes'])}{cached})")
+    return result
+
+
+def ensure_maintenance_log(cur):
+    cur.execute(sql.SQL(
+        """
+        CREATE TABLE IF NOT EXISTS "public".{table} (
+          id         bigserial   PRIMARY KEY,
+          action     text        NOT NULL,
+          relation   text        NOT NULL,
+          started_at timestamptz NOT NULL,
+          seconds    numeric     NOT NULL,
+          detail     text
+        );
+        CREATE INDEX IF NOT EXISTS {index} ON "public".{table} (relation, action, started_at);
+        """
+    ).format(table=sql.Identifier(MAINTENANCE_LOG_TABLE),
+             index=sql.Identifier(f"{MAINTENANCE_LOG_TABLE}_relation_idx")))
+
+
+def last_maintenance(cur, action: str, relations: list[str]) -> dict:
+    """{relation: started_at of the latest logged action} for the given relations ({} before the first run)."""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f'"public".{MAINTENANCE_LOG_TABLE}',))
+    if not cur.fetchone()[0]:
+        return {}
+    cur.execute(sql.SQL(
+        'SELECT relation, max(started_at) FROM "public".{} WHERE action = %s AND relation = ANY(%s) GROUP BY 1;'
+    ).format(sql.Identifier(MAINTENANCE_LOG_TABLE)), (action, relations))
+    return dict(cur.fetchall())
+
+
+def run_maintenance(cur, action: str, relation: str, statement, detail: str = "") -> float:
+    """Run one maintenance statement (autocommit), time it, print and log it."""
+    started_at = dt.datetime.now(dt.timezone.utc)
+    t0 = time.perf_counter()
+    cur.execute(statement)
+    if cur.description is not None:
+        detail = " ".join(filter(None, [detail, f"{cur.fetchone()[0]} blocks"]))
+    seconds = time.perf_counter() - t0
+    cur.execute(sql.SQL(
+        'INSERT INTO "public".{} (action, relation, started_at, seconds, detail) VALUES (%s, %s, %s, %s, %s);'
+    ).format(sql.Identifier(MAINTENANCE_LOG_TABLE)), (action, relation, started_at, round(seconds, 3), detail))
+    print(f"  {action} {relation} in {seconds:.2f}s{f' ({detail})' if detail else ''}")
+    return seconds
+
+
+def plan_maintenance(cur, table: dict, today: dt.date, analyze_after_rows: int,
+                     prewarm: bool) -> list[tuple[str, str, str]]:
+    """
+    Lifecycle actions due for the partitions of one parent, as (action, partition, detail):
+    - "analyze": hot partition (receiving rows) never analyzed, with >= analyze_after_rows rows
+    - "freeze": sealed partition never frozen, or modified since its last freeze
+    - "prewarm": indexes of the hot partitions, when not prewarmed since the server started
+    """
+    partitions = range_partitions(get_partitions(cur, table["name"]))
+    stats = get_partition_stats(cur, table["name"])
+    names = [p["name"] for p in partitions]
+    analyzed = last_maintenance(cur, "analyze", names)
+    frozen = last_maintenance(cur, "freeze", names)
+    actions = []
+    for p in partitions:
+        st = stats.get(p["name"])
+        if st is None:
+            continue
+        if is_sealed(table, p["end"], today):
+            if p["name"] not in frozen or st["mod_since_analyze"] or st["dead_rows"]:
+                actions.append(("freeze", p["name"], f"~{st['live_rows']} rows"))
+        elif p["start"] <= today:
+            if (st["last_analyze"] is None and p["name"] not in analyzed
+                    and st["live_rows"] >= analyze_after_rows):
+                actions.append(("analyze", p["name"], f"~{st['live_rows']} rows"))
+
+    if prewarm:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'), "
+                    "pg_postmaster_start_time();")
+        installed, started = cur.fetchone()
+        if not installed:
+            print(f"{table['name']}: pg_prewarm is not installed (CREATE EXTENSION pg_prewarm), skipping prewarm")
+            return actions
+        hot = [p["name"] for p in partitions
+               if p["start"] <= today and not is_sealed(table, p["end"], today)]
+        index_state = get_partition_indexes(cur, table["name"])
+        indexes = [name for part in hot for name, st in index_state.get(part, {}).items() if st["valid"]]
+        warmed = last_maintenance(cur, "prewarm", indexes)
+        actions.extend(("prewarm", name, "") for name in indexes
+                       if name not in warmed or warmed[name] < started)
+    return actions
+
+
+def choose_granularity(cur, table: dict, today: dt.date) -> tuple[str, str]:
+    """
+    Window granularity for the next partitions of one table, and why.
+
+    Fixed granularities are returned as configured. "adaptive" measures bytes and rows
+    per day over the most recent partitions that hold data (sealed ones preferred, the
+    current one counted up to today) and picks the longest granularity whose expected
+    partition stays within target_bytes and target_rows.
+    """
+    granularity = table.get("granularity", DEFAULT_GRANULARITY)
+    if granularity != "adaptive":
+        return granularity, "configured"
+
+    partitions = [p for p in get_partitions(cur, table["name"], sizes=True)
+                  if not p["is_default"] and p["start"] < today and p["rows_estimate"]]
+    if not partitions:
+        return DEFAULT_GRANULARITY, "adaptive: no analyzed partitions with data yet"
+    sample = sorted(partitions, key=lambda p: (p["end"] <= today, p["end"]))[-ADAPTIVE_SAMPLE_PARTITIONS:]
+    days = sum((min(p["end"], today) - p["start"]).days for p in sample)
+    bytes_per_day = sum(p["total_bytes"] for p in sample) / days
+    rows_per_day = sum(p["rows_estimate"] for p in sample) / days
+
+    by_length = sorted(GRANULARITIES, key=lambda g: GRANULARITIES[g]["days"])
+    chosen = by_length[0]
+    for g in by_length:
+        window = GRANULARITIES[g]["days"]
+        if table.get("target_bytes") and bytes_per_day * window > table["target_bytes"]:
+            break
+        if table.get("target_rows") and rows_per_day * window > table["target_rows"]:
+            break
+        chosen = g
+    expected = GRANULARITIES[chosen]["days"]
+    return chosen, (f"adaptive: {format_bytes(bytes_per_day)}/day, ~{rows_per_day:.0f} rows/day "
+                    f"over {len(sample)} partition(s) -> ~{format_bytes(bytes_per_day * expected)} per partition")
+
+
+def ensure_coverage(cur, table: dict, today: dt.date, ahead_days: int, dry_run: bool = False,
+                    granularity: str | None = None, stats: dict | None = None) -> list[str]:
+    """
+    Create every missing window of one parent table inside its coverage target.
+    granularity overrides the table's configured granularity; stats collects DDL
+    retries and lock waits (see run_ddl).
+    Returns the planned partition names.
+    """
+    parent = table["name"]
+    if granularity:
+        table = dict(table, granularity=granularity)
+    granularity, reason = choose_granularity(cur, table, today)
+    coverage_start = today - dt.timedelta(days=table.get("retention_days", 0))
+    coverage_end = today + dt.timedelta(days=ahead_days)
+    windows = get_partition_windows(cur, parent)
+    existing = [(start, end) for start, end, _ in windows]
+    planned = plan_missing_windows(existing, coverage_start, coverage_end, granularity)
+
+    # Defensive: never create a window that overlaps a real bound or reuses a name
+    # (create_partition would treat the attached table as already done)
+    existing_names = {name for _, _, name in windows}
+    overlaps = find_overlaps(existing + planned)
+    collisions = [partition_name(parent, s, e) for s, e in planned if partition_name(parent, s, e) in existing_names]
+    if overlaps or collisions:
+        raise RuntimeError(f"{parent}: planned windows conflict with existing partitions: {overlaps or collisions}")
+
+    print(f"{parent}: coverage {coverage_start} .. {coverage_end}, granularity {granularity} ({reason}), "
+          f"{len(existing)} existing, {len(planned)} missing")
+    names = []
+    for start, end in planned:
+        name = partition_name(parent, start, end)
+        names.append(name)
+        if dry_run:
+            print(f"  [dry-run] CREATE {name}  FOR VALUES FROM ('{start}') TO ('{end}')")
+        else:
+            part_stats = new_ddl_stats()
+            create_partition(cur, parent, start, end, table["indexes"], part_stats)
+            waited = (f", {part_stats['retries']} retries, waited {part_stats['lock_wait_seconds']:.1f}s"
+                      if part_stats["retries"] else "")
+            print(f"  created {name} in {part_stats['seconds']:.2f}s{waited}")
+            if stats is not None:
+                for key in part_stats:
+                    stats[key] += part_stats[key]
+    return names
+
+
+def find_expired_partitions(cur, parent_table: str, cutoff: dt.date) -> list[dict]:
+    """
+    Partitions of a parent whose upper bound is at or before the cutoff,
+    with their total size and whether a previous concurrent detach is still pending.
+    """
+    return [
+        {"name": p["name"], "start": p["start"], "end": p["end"],
+         "bytes": p["total_bytes"], "detach_pending": p["detach_pending"]}
+        for p in get_partitions(cur, parent_table, sizes=True)
+        if not p["is_default"] and p["end"] <= cutoff
+    ]
+
+
+def detach_partition(cur, parent_table: str, part_name: str, concurrently: bool = True,
+                     finalize: bool = False):
+    """
+    Detach a partition from its parent.
+    CONCURRENTLY only takes SHARE UPDATE EXCLUSIVE on the parent, so inserts are not blocked;
+    it must run outside a transaction block (autocommit). FINALIZE completes a detach that
+    was interrupted half-way.
+    """
+    if finalize:
+        mode = sql.SQL("FINALIZE")
+    elif concurrently:
+        mode = sql.SQL("CONCURRENTLY")
+    else:
+        mode = sql.SQL("")
+    cur.execute(
+        sql.SQL('ALTER TABLE "public".{} DETACH PARTITION "public".{} {};')
+        .format(sql.Identifier(parent_table), sql.Identifier(part_name), mode)
+    )
+
+
+def apply_retention(cur, table: dict, today: dt.date, dry_run: bool = False) -> int:
+    """
+    Detach (and drop, when retention_policy is "drop") every expired partition of one parent.
+    The cursor's connection must be in autocommit mode.
+    Returns the bytes reclaimed (or that would be reclaimed in dry-run).
+    """
+    parent = table["name"]
+    policy = table.get("retention_policy", "drop")
+    cutoff = today - dt.timedelta(days=table["retention_days"])
+    expired = find_expired_partitions(cur, parent, cutoff)
+    concurrently = cur.connection.server_version >= 140000
+    reclaim = sum(p["bytes"] for p in expired) if policy == "drop" else 0
+
+    print(f"{parent}: retention {table['retention_days']} days (cutoff {cutoff}), policy={policy}, "
+          f"{len(expired)} expired, {format_bytes(reclaim)} to reclaim")
+    for p in expired:
+        action = "DETACH + DROP" if policy == "drop" else "DETACH (keep)"
+        if dry_run:
+            print(f"  [dry-run] {action} {p['name']}  ({p['start']} .. {p['end']}, {format_bytes(p['bytes'])})")
+            continue
+        detach_partition(cur, parent, p["name"], concurrently=concurrently, finalize=p["detach_pending"])
+        if policy == "drop":
+            cur.execute(sql.SQL('DROP TABLE IF EXISTS "public".{};').format(sql.Identifier(p["name"])))
+            print(f"  dropped {p['name']} ({format_bytes(p['bytes'])})")
+        else:
+            print(f"  detached {p['name']} (kept as standalone table)")
+    return reclaim
+
+
+def check_partitioned(cur, parent: str):
+    """Raise if the parent table is missing or not partitioned."""
+    cur.execute(
+        """
+        SELECT EXISTS (
+          SELECT 1
+          FROM pg_partitioned_table pt
+          JOIN pg_class c ON c.oid = pt.partrelid
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+          WHERE n.nspname='public' AND c.relname=%s
+        );
+        """,
+        (parent,)
+    )
+    if not cur.fetchone()[0]:
+        raise RuntimeError(
+            f'Parent table "public.{parent}" is not a partitioned table. '
+            f'Please run your migration that creates it with PARTITION BY RANGE(created_at).'
+        )
+
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0].startswith("-"):
+        argv.insert(0, "ensure")  # default command keeps the plain cron invocation working
+
+    parser = argparse.ArgumentParser(description="Partition maintenance for devices tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(p):
+        p.add_argument("--dry-run", action="store_true", help="print the plan without changing anything")
+        p.add_argument("--table", action="append", dest="tables",
+                       help="limit to these parent tables (repeatable)")
+
+    ensure = sub.add_parser("ensure", help="create missing partitions up to the coverage horizon (default)")
+    add_common(ensure)
+    ensure.add_argument("--ahead-days", type=int, default=DEFAULT_AHEAD_DAYS,
+                        help=f"days after today that must be covered (default: {DEFAULT_AHEAD_DAYS})")
+    ensure.add_argument("--granularity", choices=list(GRANULARITIES) + ["adaptive"],
+                        help="window length for new partitions (default: per table in PARENT_TABLES)")
+    ensure.add_argument("--online", action="store_true",
+                        help="also build missing/invalid indexes of existing partitions with CREATE INDEX CONCURRENTLY")
+
+    retention = sub.add_parser("retention", help="detach/drop partitions older than retention_days")
+    add_common(retention)
+
+    seal = sub.add_parser("seal", help="swap sealed partitions from hot to sealed indexes (online)")
+    add_common(seal)
+
+    maintain = sub.add_parser("maintain", help="lifecycle hooks: ANALYZE new, VACUUM FREEZE sealed, prewarm hot")
+    add_common(maintain)
+    maintain.add_argument("--analyze-after-rows", type=int, default=ANALYZE_AFTER_ROWS,
+                          help=f"first ANALYZE of a hot partition after this many rows (default: {ANALYZE_AFTER_ROWS})")
+    maintain.add_argument("--prewarm", action="store_true",
+                          help="pg_prewarm the indexes of hot partitions once after each server restart")
+
+    report = sub.add_parser("report", help="list partitions from the catalog with estimates and gaps")
+    report.add_argument("--table", action="append", dest="tables",
+                        help="limit to these parent tables (repeatable)")
+    report.add_argument("--sizes", action="store_true", help="exact sizes with pg_total_relation_size")
+    report.add_argument("--ahead-days", type=int, default=DEFAULT_AHEAD_DAYS,
+                        help="coverage horizon used for gap detection")
+    return parser.parse_args(argv)
+
+
+def run_ensure(conn, cur, tables: list[dict], args):
+    # Each DDL step commits on its own (run_ddl), so no lock is held across partitions
+    conn.autocommit = True
+    today = dt.date.today()
+    stats = new_ddl_stats()
+    created = []
+    for t in tables:
+        created.extend(ensure_coverage(cur, t, today, args.ahead_days, dry_run=args.dry_run,
+                                       granularity=args.granularity, stats=stats))
+
+    if args.dry_run:
+        print(f"Dry run: {len(created)} partition(s) would be created")
+    else:
+        print("Partitions ensured:", ", ".join(created) if created else "none missing")
+        if created:
+            print(f"DDL: {stats['statements']} statements in {stats['seconds']:.2f}s, "
+                  f"{stats['retries']} lock retries, {stats['lock_wait_seconds']:.1f}s waiting for locks")
+
+    if args.online:
+        built = []
+        for t in tables:
+            built.extend(ensure_indexes_online(cur, t, today, dry_run=args.dry_run))
+        if built:
+            slowest = max(built, key=lambda b: b["seconds"])
+            print(f"Indexes built online: {len(built)} in {sum(b['seconds'] for b in built):.2f}s "
+                  f"(slowest {slowest['index']} {slowest['seconds']:.2f}s)")
+        elif not args.dry_run:
+            print("Indexes built online: none missing")
+
+
+def run_retention(conn, cur, tables: list[dict], args):
+    # DETACH ... CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+    today = dt.date.today()
+    reclaimed = sum(apply_retention(cur, t, today, dry_run=args.dry_run) for t in tables)
+    prefix = "Dry run: " if args.dry_run else ""
+    print(f"{prefix}Retention reclaimed {format_bytes(reclaimed)}")
+
+
+def run_seal(conn, cur, tables: list[dict], args):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+    today = dt.date.today()
+    totals = {"partitions": 0, "dropped_bytes": 0, "built_bytes": 0, "cache_bytes": 0}
+    for t in tables:
+        for key, value in apply_index_policy(cur, t, today, dry_run=args.dry_run).items():
+            totals[key] += value
+    if args.dry_run:
+        print(f"Dry run: {totals['partitions']} partition(s) to seal, "
+              f"{format_bytes(totals['dropped_bytes'])} of hot indexes to drop")
+    else:
+        saved = totals["dropped_bytes"] - totals["built_bytes"]
+        print(f"Sealed {totals['partitions']} partition(s): dropped {format_bytes(totals['dropped_bytes'])}, "
+              f"built {format_bytes(totals['built_bytes'])}, saved {format_bytes(saved)} on disk, "
+              f"{format_bytes(totals['cache_bytes'])} of shared_buffers freed")
+
+
+def run_maintain(conn, cur, tables: list[dict], args):
+    # VACUUM cannot run inside a transaction block
+    conn.autocommit = True
+    if not args.dry_run:
+        ensure_maintenance_log(cur)
+    today = dt.date.today()
+    statements = {
+        "analyze": lambda rel: sql.SQL('ANALYZE "public".{};').format(sql.Identifier(rel)),
+        "freeze": lambda rel: sql.SQL('VACUUM (FREEZE, ANALYZE) "public".{};').format(sql.Identifier(rel)),
+        "prewarm": lambda rel: sql.SQL("SELECT pg_prewarm((quote_ident('public') || '.' || quote_ident({}))::regclass);")
+        .format(sql.Literal(rel)),
+    }
+    counts = {action: 0 for action in statements}
+    seconds = 0.0
+    for t in tables:
+        actions = plan_maintenance(cur, t, today, args.analyze_after_rows, args.prewarm)
+        print(f"{t['name']}: {len(actions)} maintenance action(s) due")
+        for action, relation, detail in actions:
+            counts[action] += 1
+            if args.dry_run:
+                print(f"  [dry-run] {action} {relation}{f' ({detail})' if detail else ''}")
+                continue
+            seconds += run_maintenance(cur, action, relation, statements[action](relation), detail)
+    prefix = "Dry run: " if args.dry_run else ""
+    print(f"{prefix}Maintenance: {counts['analyze']} analyze, {counts['freeze']} freeze, "
+          f"{counts['prewarm']} prewarm" + ("" if args.dry_run else f" in {seconds:.2f}s"))
+
+
+def run_report(conn, cur, tables: list[dict], args):
+    today = dt.date.today()
+    for t in tables:
+        describe(cur, t["name"], sizes=args.sizes,
+                 coverage_start=today - dt.timedelta(days=t.get("retention_days", 0)),
+                 coverage_end=today + dt.timedelta(days=args.ahead_days))
+
+
+COMMANDS = {
+    "ensure": run_ensure,
+    "retention": run_retention,
+    "seal": run_seal,
+    "maintain": run_maintain,
+    "report": run_report,
+}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tables = [t for t in PARENT_TABLES if not args.tables or t["name"] in args.tables]
+    conn = None
     try:
-        with get_conn() as conn:
-            conn.autocommit = False
-            with conn.cursor() as cur:
-                # Acquire advisory lock to avoid concurrent runs
-                cur.execute("SELECT pg_try_advisory_lock(%s);", (ADVISORY_LOCK_KEY,))
-                locked = cur.fetchone()[0]
-                if not locked:
-                    print("Another partition job is running. Exiting.")
-                    return
-
-                # Ensure parent tables exist and are partitioned (defensive)
-                # If your migration already created parents, these will just no-op or raise if not partitioned.
-                # We won't try to convert here; keep this job for "future partitions" only.
-                for t in PARENT_TABLES:
-                    parent = t["name"]
-                    cur.execute(
-                        """
-                        SELECT EXISTS (
-                          SELECT 1
-                          FROM pg_partitioned_table pt
-                          JOIN pg_class c ON c.oid = pt.partrelid
-                          JOIN pg_namespace n ON n.oid = c.relnamespace
-                          WHERE n.nspname='public' AND c.relname=%s
-                        );
-                        """,
-                        (parent,)
-                    )
-                    is_partitioned = cur.fetchone()[0]
-                    if not is_partitioned:
-                        raise RuntimeError(
-                            f'Parent table "public.{parent}" is not a partitioned table. '
-                            f'Please run your migration that creates it with PARTITION BY RANGE(created_at).'
-                        )
-
-                created = []
-                for t in PARENT_TABLES:
-                    part = create_next_partition(cur, t["name"], t["index_sqls"])
-                    created.append(part)
-
-                conn.commit()
-                print("Partitions ensured:", ", ".join(created))
+        # Not "with conn": psycopg2 >= 2.9 opens a transaction there even in autocommit mode,
+        # and commands such as DETACH ... CONCURRENTLY must run outside one
+        conn = get_conn()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # Acquire advisory lock (session level) to avoid concurrent runs
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (ADVISORY_LOCK_KEY,))
+            locked = cur.fetchone()[0]
+            if not locked:
+                print("Another partition job is running. Exiting.")
+                return
+
+            # Ensure parent tables exist and are partitioned (defensive)
+            # We won't try to convert here; keep this job for partition maintenance only.
+            for t in tables:
+                check_partitioned(cur, t["name"])
+
+            try:
+                COMMANDS[args.command](conn, cur, tables, args)
+            finally:
+                conn.rollback()
+                conn.autocommit = True
+                cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_KEY,))
     except Exception as e:
         print("ERROR:", e, file=sys.stderr)
         sys.exit(1)
+    finally:
+        if conn is not None:
+            conn.close()
 
 
 if __name__ == "__main__":
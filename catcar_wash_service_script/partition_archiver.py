@@ -0,0 +1,710 @@
+#!/usr/bin/env python3
+"""
+Archive detached partitions of:
+  - public.tbl_devices_events   (PAYMENT history, kept for accounting)
+  - public.tbl_devices_state
+
+to compressed files before they are dropped, and restore them for ad-hoc queries.
+
+- Streams each partition through COPY ... TO STDOUT (one row at a time, bounded memory)
+  into Parquet (zstd compressed, needs pyarrow) or zstd compressed CSV (needs zstandard)
+- One file per partition plus a manifest.json with row counts and checksums
+- Verifies the archive (file sha256, row count, content sha256 of the COPY stream,
+  row count in the database) before a partition is dropped
+- Restore loads an archive back into a table and can attach it to the parent as a
+  temporary partition
+
+Candidates are standalone tables named parent_YYYYMMDD_to_YYYYMMDD, i.e. partitions
+detached by `partition_60d_cron.py retention` with retention_policy "keep".
+
+Usage:
+  python3 partition_archiver.py archive --dry-run
+  python3 partition_archiver.py archive --format parquet --drop
+  python3 partition_archiver.py archive --partition tbl_devices_events_20240914_to_20241113
+  python3 partition_archiver.py verify
+  python3 partition_archiver.py restore tbl_devices_events_20240914_to_20241113 --attach
+"""
+
+import argparse
+import csv
+import datetime as dt
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+from psycopg2 import sql
+
+from partition_60d_cron import (
+    ADVISORY_LOCK_KEY,
+    PARENT_TABLES,
+    format_bytes,
+    get_conn,
+    index_statement,
+    key_constraint_statements,
+    parent_key_constraints,
+    wanted_indexes,
+)
+from partition_catalog import NAME_WINDOW_RE, name_window
+
+ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archives")
+MANIFEST_FILE = "manifest.json"
+
+FORMATS = {
+    "parquet": ".parquet",
+    "csv.zst": ".csv.zst",
+}
+DEFAULT_FORMAT = "parquet"
+
+PARQUET_BATCH_ROWS = 50_000  # rows buffered per Parquet row group
+ZSTD_LEVEL = 10
+CHUNK_SIZE = 1024 * 1024
+
+# COPY text format escapes (both directions)
+_COPY_ESCAPES = {"\\": "\\\\", "\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t", "\v": "\\v"}
+_COPY_ESCAPE_RE = re.compile(r"[\\\b\f\n\r\t\v]")
+_COPY_UNESCAPE = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+_COPY_UNESCAPE_RE = re.compile(r"\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)")
+
+
+def _require(module: str, fmt: str):
+    """Import an optional dependency needed by one archive format."""
+    try:
+        return __import__(module)
+    except ImportError:
+        raise RuntimeError(f'Format "{fmt}" needs the "{module}" package: pip install {module}')
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _copy_unescape(value: str):
+    if value == "\\N":
+        return None
+    if "\\" not in value:
+        return value
+
+    def repl(m):
+        s = m.group(1)
+        if s[0] == "x" and len(s) > 1:
+            return chr(int(s[1:], 16))
+        if s[0] in "01234567":
+            return chr(int(s, 8))
+        return _COPY_UNESCAPE.get(s, s)
+
+    return _COPY_UNESCAPE_RE.sub(repl, value)
+
+
+def _copy_escape(value) -> str:
+    if value is None:
+        return "\\N"
+    return _COPY_ESCAPE_RE.sub(lambda m: _COPY_ESCAPES[m.group(0)], str(value))
+
+
+# ---------------------------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------------------------
+
+def load_manifest(archive_dir: str) -> dict:
+    path = os.path.join(archive_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"partitions": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(archive_dir: str, manifest: dict):
+    """Write the manifest atomically (tmp file + rename)."""
+    path = os.path.join(archive_dir, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------------------
+# Catalog
+# ---------------------------------------------------------------------------
+
+def parent_of(part_name: str) -> dict:
+    """The PARENT_TABLES entry a partition name belongs to."""
+    for t in PARENT_TABLES:
+        if part_name.startswith(t["name"] + "_") and NAME_WINDOW_RE.fullmatch(part_name[len(t["name"]):]):
+            return t
+    raise RuntimeError(f"{part_name} is not a partition of {', '.join(t['name'] for t in PARENT_TABLES)}")
+
+
+def get_table_info(cur, name: str) -> dict | None:
+    """
+    Size and partition status of a table in schema public.
+    Returns None when the table does not exist.
+    """
+    cur.execute(
+        """
+        SELECT c.relispartition, pg_total_relation_size(c.oid)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = %s AND c.relkind = 'r';
+        """,
+        (name,)
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {"attached": row[0], "bytes": row[1]}
+
+
+def find_detached_partitions(cur, parent_table: str) -> list[str]:
+    """Standalone (detached) tables named parent_YYYYMMDD_to_YYYYMMDD, oldest first."""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND NOT c.relispartition
+          AND c.relname LIKE %s;
+        """,
+        (parent_table.replace("_", r"\_") + r"\_%",)
+    )
+    names = [name for (name,) in cur.fetchall() if NAME_WINDOW_RE.fullmatch(name[len(parent_table):])]
+    return sorted(names, key=name_window)
+
+
+def get_columns(cur, table_name: str) -> list[tuple[str, str]]:
+    """(column, data_type) in table order."""
+    cur.execute(
+        """
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        WHERE a.attrelid = format('public.%%I', %s::text)::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum;
+        """,
+        (table_name,)
+    )
+    return cur.fetchall()
+
+
+def _is_timestamp(data_type: str) -> bool:
+    return data_type.startswith("timestamp")
+
+
+def _select_list(columns: list[tuple[str, str]]):
+    """
+    Column list for COPY (SELECT ...): timestamps are exported as epoch milliseconds
+    so Parquet gets a typed column without parsing timestamp text.
+    """
+    items = []
+    for name, data_type in columns:
+        if _is_timestamp(data_type):
+            items.append(sql.SQL("floor(extract(epoch FROM {0}) * 1000)::bigint AS {0}").format(sql.Identifier(name)))
+        else:
+            items.append(sql.Identifier(name))
+    return sql.SQL(", ").join(items)
+
+
+# ---------------------------------------------------------------------------
+# Writers (receive one COPY row per write() call)
+# ---------------------------------------------------------------------------
+
+class _CopyCounter:
+    """
+    Base for COPY TO STDOUT sinks. libpq hands out COPY data one row at a time and
+    psycopg2 calls write() once per row, so rows are counted per call and hashed as
+    they stream by (content_sha256 is the sha256 of the raw COPY stream).
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.rows += 1
+        self.hash.update(data)
+        self.write_row(data)
+
+    def write_row(self, data: bytes):
+        raise NotImplementedError
+
+
+class _ZstdCsvWriter(_CopyCounter):
+    """COPY ... (FORMAT csv) rows straight into a zstd stream."""
+
+    def __init__(self, path: str, header: list[str]):
+        super().__init__()
+        zstd = _require("zstandard", "csv.zst")
+        self._file = open(path, "wb")
+        self._stream = zstd.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._file)
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow(header)
+        self._stream.write(buf.getvalue().encode("utf-8"))
+
+    def write_row(self, data: bytes):
+        self._stream.write(data)
+
+    def close(self):
+        self._stream.close()  # flushes the zstd frame and closes the file
+
+
+class _ParquetWriter(_CopyCounter):
+    """COPY text rows, buffered PARQUET_BATCH_ROWS at a time into Parquet row groups."""
+
+    def __init__(self, path: str, columns: list[tuple[str, str]]):
+        super().__init__()
+        _require("pyarrow", "parquet")
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._columns = columns
+        fields = []
+        for name, data_type in columns:
+            if _is_timestamp(data_type):
+                fields.append(pa.field(name, pa.timestamp("ms", tz="UTC")))
+            elif data_type in ("integer", "bigint", "smallint"):
+                fields.append(pa.field(name, pa.int64()))
+            elif data_type == "boolean":
+                fields.append(pa.field(name, pa.bool_()))
+            else:
+                fields.append(pa.field(name, pa.string()))
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+        self._batch = [[] for _ in columns]
+
+    def write_row(self, data: bytes):
+        values = data.decode("utf-8").rstrip("\n").split("\t")
+        for i, value in enumerate(values):
+            self._batch[i].append(_copy_unescape(value))
+        if len(self._batch[0]) >= PARQUET_BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if not self._batch[0]:
+            return
+        arrays = []
+        for field, values in zip(self._schema, self._batch):
+            if self._pa.types.is_timestamp(field.type):
+                ms = self._pa.array([None if v is None else int(v) for v in values], self._pa.int64())
+                arrays.append(ms.cast(field.type))
+            elif self._pa.types.is_integer(field.type):
+                arrays.append(self._pa.array([None if v is None else int(v) for v in values], field.type))
+            elif self._pa.types.is_boolean(field.type):
+                arrays.append(self._pa.array([None if v is None else v == "t" for v in values], field.type))
+            else:
+                arrays.append(self._pa.array(values, field.type))
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+        self._batch = [[] for _ in self._columns]
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+# ---------------------------------------------------------------------------
+# Readers (archive -> COPY stream)
+# ---------------------------------------------------------------------------
+
+def _parquet_copy_rows(path: str, timestamps: str = "ms"):
+    """
+    Yield COPY text rows (bytes) from a Parquet archive.
+    timestamps="ms" reproduces the exported stream (for checksums),
+    timestamps="iso" produces values COPY FROM can load.
+    """
+    _require("pyarrow", "parquet")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(path)
+    ts_cols = [i for i, field in enumerate(pf.schema_arrow) if pa.types.is_timestamp(field.type)]
+    bool_cols = [i for i, field in enumerate(pf.schema_arrow) if pa.types.is_boolean(field.type)]
+    for batch in pf.iter_batches(batch_size=PARQUET_BATCH_ROWS):
+        cols = []
+        for i, column in enumerate(batch.columns):
+            if i in ts_cols:
+                if timestamps == "ms":
+                    values = column.cast(pa.int64()).to_pylist()
+                else:
+                    values = [None if v is None else v.isoformat() for v in column.to_pylist()]
+            elif i in bool_cols:
+                values = [None if v is None else ("t" if v else "f") for v in column.to_pylist()]
+            else:
+                values = column.to_pylist()
+            cols.append(values)
+        for row in zip(*cols):
+            yield ("\t".join(_copy_escape(v) for v in row) + "\n").encode("utf-8")
+
+
+class _IterReader:
+    """File-like read() over an iterator of bytes chunks, for COPY ... FROM STDIN."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def read(self, size=-1):
+        parts, n = [self._buf], len(self._buf)
+        while size < 0 or n < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            n += len(chunk)
+        data = b"".join(parts)
+        if size < 0:
+            self._buf = b""
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+    readline = read
+
+
+def _csv_zst_reader(path: str):
+    zstd = _require("zstandard", "csv.zst")
+    return zstd.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+
+
+def scan_archive(path: str, fmt: str) -> tuple[int, str]:
+    """
+    Re-read an archive end to end.
+    Returns (rows, content_sha256) comparable to what was recorded at export time.
+    """
+    h = hashlib.sha256()
+    rows = 0
+    if fmt == "parquet":
+        for row in _parquet_copy_rows(path, timestamps="ms"):
+            h.update(row)
+            rows += 1
+    else:
+        with _csv_zst_reader(path) as raw:
+            text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            text.readline()  # header
+            for record in _csv_records(text):
+                h.update(record.encode("utf-8"))
+                rows += 1
+    return rows, h.hexdigest()
+
+
+def _csv_records(text):
+    """Split a CSV text stream into raw records (a quoted field may span several lines)."""
+    pending = ""
+    for line in text:
+        pending += line
+        if pending.count('"') % 2 == 0:
+            yield pending
+            pending = ""
+    if pending:
+        yield pending
+
+
+# ---------------------------------------------------------------------------
+# Archive / verify / restore
+# ---------------------------------------------------------------------------
+
+def archive_partition(cur, part_name: str, archive_dir: str, fmt: str) -> dict:
+    """
+    Stream one (detached) partition into an archive file and return its manifest entry.
+    Runs the count and the COPY in one REPEATABLE READ snapshot.
+    """
+    table = parent_of(part_name)
+    start, end = name_window(part_name)
+    columns = get_columns(cur, part_name)
+    out_dir = os.path.join(archive_dir, table["name"])
+    os.makedirs(out_dir, exist_ok=True)
+    file_name = part_name + FORMATS[fmt]
+    path = os.path.join(out_dir, file_name)
+    tmp_path = path + ".tmp"
+
+    conn = cur.connection
+    conn.autocommit = False
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    started = dt.datetime.now(dt.timezone.utc)
+    try:
+        cur.execute(sql.SQL('SELECT count(*) FROM "public".{};').format(sql.Identifier(part_name)))
+        db_rows = cur.fetchone()[0]
+
+        if fmt == "parquet":
+            writer = _ParquetWriter(tmp_path, columns)
+            copy = sql.SQL('COPY (SELECT {} FROM "public".{}) TO STDOUT;').format(
+                _select_list(columns), sql.Identifier(part_name))
+        else:
+            writer = _ZstdCsvWriter(tmp_path, [name for name, _ in columns])
+            copy = sql.SQL('COPY "public".{} TO STDOUT WITH (FORMAT csv);').format(sql.Identifier(part_name))
+        try:
+            cur.copy_expert(copy.as_string(cur), writer, size=CHUNK_SIZE)
+        finally:
+            writer.close()
+        conn.commit()
+    finally:
+        conn.rollback()
+        conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT", autocommit=True)
+
+    if writer.rows != db_rows:
+        os.remove(tmp_path)
+        raise RuntimeError(f"{part_name}: exported {writer.rows} rows but the table has {db_rows}")
+    os.replace(tmp_path, path)
+    elapsed = (dt.datetime.now(dt.timezone.utc) - started).total_seconds()
+
+    return {
+        "partition": part_name,
+        "parent": table["name"],
+        "range_start": start.isoformat(),
+        "range_end": end.isoformat(),
+        "format": fmt,
+        "file": os.path.join(table["name"], file_name),
+        "bytes": os.path.getsize(path),
+        "sha256": _sha256_file(path),
+        "rows": writer.rows,
+        "content_sha256": writer.hash.hexdigest(),
+        "columns": [{"name": n, "type": t} for n, t in columns],
+        "archived_at": started.isoformat(),
+        "export_seconds": round(elapsed, 3),
+    }
+
+
+def verify_entry(archive_dir: str, entry: dict, cur=None) -> list[str]:
+    """
+    Check an archive against its manifest entry (and against the table when cur is given).
+    Returns a list of problems; empty means verified.
+    """
+    problems = []
+    path = os.path.join(archive_dir, entry["file"])
+    if not os.path.exists(path):
+        return [f"missing file {path}"]
+    if _sha256_file(path) != entry["sha256"]:
+        problems.append("file sha256 mismatch")
+    try:
+        rows, content_sha256 = scan_archive(path, entry["format"])
+    except Exception as e:
+        return problems + [f"unreadable archive: {e}"]
+    if rows != entry["rows"]:
+        problems.append(f"archive has {rows} rows, manifest says {entry['rows']}")
+    if content_sha256 != entry["content_sha256"]:
+        problems.append("content sha256 mismatch")
+    if cur is not None and get_table_info(cur, entry["partition"]) is not None:
+        cur.execute(sql.SQL('SELECT count(*) FROM "public".{};').format(sql.Identifier(entry["partition"])))
+        db_rows = cur.fetchone()[0]
+        if db_rows != entry["rows"]:
+            problems.append(f"table has {db_rows} rows, archive has {entry['rows']}")
+    return problems
+
+
+def restore_partition(cur, entry: dict, archive_dir: str, target: str, attach: bool = False):
+    """
+    Load an archive into a new table `target` (same columns and defaults as the parent)
+    with the parent's per-partition indexes and PRIMARY KEY / UNIQUE constraints;
+    optionally ATTACH it to the parent for its original range so it can be queried
+    through the parent.
+    """
+    table = parent_of(entry["partition"])
+    if get_table_info(cur, target) is not None:
+        raise RuntimeError(f'Table "public.{target}" already exists')
+
+    path = os.path.join(archive_dir, entry["file"])
+    cur.execute(
+        sql.SQL('CREATE TABLE "public".{} (LIKE "public".{} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);')
+        .format(sql.Identifier(target), sql.Identifier(table["name"]))
+    )
+    if entry["format"] == "parquet":
+        source = _IterReader(_parquet_copy_rows(path, timestamps="iso"))
+        copy = sql.SQL('COPY "public".{} FROM STDIN;').format(sql.Identifier(target))
+        cur.copy_expert(copy.as_string(cur), source, size=CHUNK_SIZE)
+    else:
+        with _csv_zst_reader(path) as source:
+            copy = sql.SQL('COPY "public".{} FROM STDIN WITH (FORMAT csv, HEADER);').format(sql.Identifier(target))
+            cur.copy_expert(copy.as_string(cur), source, size=CHUNK_SIZE)
+
+    cur.execute(sql.SQL('SELECT count(*) FROM "public".{};').format(sql.Identifier(target)))
+    rows = cur.fetchone()[0]
+    if rows != entry["rows"]:
+        raise RuntimeError(f"restored {rows} rows, manifest says {entry['rows']}")
+
+    for index in wanted_indexes(table, sealed=True):  # archived data is always sealed
+        cur.execute(index_statement(target, index))
+    # same PRIMARY KEY / UNIQUE constraints as the parent, so ATTACH can adopt them
+    for statement in key_constraint_statements(target, parent_key_constraints(cur, table["name"])):
+        cur.execute(statement)
+    if attach:
+        cur.execute(
+            sql.SQL('ALTER TABLE "public".{} ATTACH PARTITION "public".{} FOR VALUES FROM (%s) TO (%s);')
+            .format(sql.Identifier(table["name"]), sql.Identifier(target)),
+            (entry["range_start"], entry["range_end"])
+        )
+    return rows
+
+
+def run_archive(conn, cur, args):
+    manifest = load_manifest(args.dir)
+    if args.partitions:
+        candidates = args.partitions
+    else:
+        tables = [t for t in PARENT_TABLES if not args.tables or t["name"] in args.tables]
+        candidates = [name for t in tables for name in find_detached_partitions(cur, t["name"])]
+
+    print(f"{len(candidates)} detached partition(s) to archive into {args.dir} ({args.format})")
+    archived = dropped = reclaimed = failed = 0
+    for name in candidates:
+        info = get_table_info(cur, name)
+        if info is None:
+            print(f"  {name}: table not found, skipped")
+            continue
+        if info["attached"]:
+            print(f"  {name}: still attached, detach it first (partition_60d_cron.py retention), skipped")
+            continue
+
+        entry = manifest["partitions"].get(name)
+        if args.dry_run:
+            state = "already archived" if entry else "archive"
+            drop = " + DROP" if args.drop else ""
+            print(f"  [dry-run] {state}{drop} {name} ({format_bytes(info['bytes'])})")
+            continue
+
+        if entry is None or args.force:
+            entry = archive_partition(cur, name, args.dir, args.format)
+            manifest["partitions"][name] = entry
+            save_manifest(args.dir, manifest)
+            archived += 1
+            print(f"  archived {name}: {entry['rows']} rows, {format_bytes(info['bytes'])} -> "
+                  f"{format_bytes(entry['bytes'])} {entry['file']} ({entry['export_seconds']:.1f}s)")
+
+        problems = verify_entry(args.dir, entry, cur)
+        if problems:
+            failed += 1
+            print(f"  VERIFY FAILED {name}: {'; '.join(problems)} (table kept)", file=sys.stderr)
+            continue
+        print(f"  verified {name}")
+
+        if args.drop:
+            cur.execute(sql.SQL('DROP TABLE "public".{};').format(sql.Identifier(name)))
+            entry["dropped_at"] = dt.datetime.now(dt.timezone.utc).isoformat()
+            save_manifest(args.dir, manifest)
+            dropped += 1
+            reclaimed += info["bytes"]
+            print(f"  dropped {name} ({format_bytes(info['bytes'])})")
+
+    if not args.dry_run:
+        print(f"Archived {archived}, dropped {dropped} ({format_bytes(reclaimed)} reclaimed), "
+              f"{failed} failed verification")
+    if failed:
+        sys.exit(1)
+
+
+def run_verify(conn, cur, args):
+    manifest = load_manifest(args.dir)
+    names = args.partitions or sorted(manifest["partitions"])
+    failed = 0
+    for name in names:
+        entry = manifest["partitions"].get(name)
+        if entry is None:
+            print(f"  {name}: not in manifest", file=sys.stderr)
+            failed += 1
+            continue
+        problems = verify_entry(args.dir, entry, cur)
+        if problems:
+            failed += 1
+            print(f"  FAILED {name}: {'; '.join(problems)}", file=sys.stderr)
+        else:
+            print(f"  OK {name}: {entry['rows']} rows, {format_bytes(entry['bytes'])} ({entry['format']})")
+    print(f"Verified {len(names) - failed}/{len(names)} archive(s)")
+    if failed:
+        sys.exit(1)
+
+
+def run_restore(conn, cur, args):
+    manifest = load_manifest(args.dir)
+    entry = manifest["partitions"].get(args.partition)
+    if entry is None:
+        raise RuntimeError(f"{args.partition} is not in {os.path.join(args.dir, MANIFEST_FILE)}")
+    target = args.name or f"restored_{args.partition}"
+
+    problems = verify_entry(args.dir, entry)
+    if problems:
+        raise RuntimeError(f"archive of {args.partition} failed verification: {'; '.join(problems)}")
+
+    conn.autocommit = False
+    try:
+        rows = restore_partition(cur, entry, args.dir, target, attach=args.attach)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+    where = f"attached to {entry['parent']} for {entry['range_start']} .. {entry['range_end']}" if args.attach \
+        else "standalone"
+    print(f"Restored {rows} rows into public.{target} ({where})")
+    print(f"Drop it when done: DROP TABLE public.{target};")
+
+
+COMMANDS = {
+    "archive": run_archive,
+    "verify": run_verify,
+    "restore": run_restore,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Archive detached partitions to compressed files")
+    parser.add_argument("--dir", default=ARCHIVE_DIR,
+                        help=f"archive directory (default: $PARTITION_ARCHIVE_DIR or {ARCHIVE_DIR})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    archive = sub.add_parser("archive", help="archive detached partitions, verify, optionally drop")
+    archive.add_argument("--format", choices=list(FORMATS), default=DEFAULT_FORMAT)
+    archive.add_argument("--table", action="append", dest="tables",
+                         help="limit to detached partitions of these parent tables (repeatable)")
+    archive.add_argument("--partition", action="append", dest="partitions",
+                         help="archive only these partitions (repeatable)")
+    archive.add_argument("--drop", action="store_true", help="drop each partition once its archive is verified")
+    archive.add_argument("--force", action="store_true", help="re-export partitions that are already archived")
+    archive.add_argument("--dry-run", action="store_true", help="print the plan without changing anything")
+
+    verify = sub.add_parser("verify", help="verify archives against the manifest")
+    verify.add_argument("--partition", action="append", dest="partitions")
+
+    restore = sub.add_parser("restore", help="load an archive back into a table")
+    restore.add_argument("partition", help="archived partition name")
+    restore.add_argument("--name", help="target table (default: restored_<partition>)")
+    restore.add_argument("--attach", action="store_true",
+                         help="attach the restored table to the parent for its original range")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.dir, exist_ok=True)
+    conn = None
+    try:
+        conn = get_conn()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE 'UTC';")
+            # Same lock as partition_60d_cron.py: never archive/drop while retention is detaching
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (ADVISORY_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                print("Another partition job is running. Exiting.")
+                return
+            try:
+                COMMANDS[args.command](conn, cur, args)
+            finally:
+                conn.rollback()
+                conn.autocommit = True
+                cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_KEY,))
+    except Exception as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Partition introspection from the PostgreSQL catalog.
+
+Reads the real partition bounds of a RANGE partitioned table with
+pg_partition_tree() + pg_get_expr(relpartbound) instead of trusting the dates in
+child table names, so planning, retention and reporting see exactly what the
+database routes rows into.
+
+- One query per parent (no pg_class name scans), fine with thousands of partitions
+- Row estimates (reltuples) and heap size estimates (relpages) straight from pg_class;
+  exact total sizes (pg_total_relation_size) on request
+- Gap detection between consecutive partitions and inside a coverage window
+- Overlap detection for any interval list (e.g. planned windows vs existing ones)
+- Flags partitions whose name window disagrees with their real bounds
+- Per-partition index state and activity statistics (pg_stat_user_tables)
+
+Used by partition_60d_cron.py (ensure / retention / report).
+"""
+
+import datetime as dt
+import re
+
+UNBOUNDED_START = dt.date.min
+UNBOUNDED_END = dt.date.max
+
+NAME_WINDOW_RE = re.compile(r"_(\d{8})_to_(\d{8})$")
+
+PARTITIONS_SQL = """
+    SELECT
+      c.relname,
+      pg_get_expr(c.relpartbound, c.oid) AS bound,
+      (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \\(''([^'']*)''\\)'))[1]::timestamptz AS lower,
+      (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']*)''\\)'))[1]::timestamptz AS upper,
+      c.reltuples::bigint,
+      c.relpages::bigint * current_setting('block_size')::bigint AS heap_bytes,
+      CASE WHEN %(sizes)s THEN pg_total_relation_size(c.oid) END AS total_bytes,
+      i.inhdetachpending
+    FROM pg_partition_tree(format('%%I.%%I', %(schema)s::text, %(parent)s::text)::regclass) t
+    JOIN pg_class c ON c.oid = t.relid
+    JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = t.parentrelid
+    WHERE t.level = 1;
+"""
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "kB", "MB", "GB", "TB"):
+        if abs(n) < 1024 or unit == "TB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def get_partitions(cur, parent_table: str, schema: str = "public", sizes: bool = False) -> list[dict]:
+    """
+    Direct partitions of a RANGE partitioned parent, sorted by lower bound.
+
+    Each item:
+      name, bound (the FOR VALUES expression), lower/upper (timestamptz or None for
+      MINVALUE/MAXVALUE), start/end (dates in the session time zone, date.min/date.max
+      when unbounded), is_default, rows_estimate (None before the first ANALYZE),
+      heap_bytes (estimate), total_bytes (exact, only with sizes=True), detach_pending.
+    The DEFAULT partition, if any, is listed last.
+    """
+    cur.execute(PARTITIONS_SQL, {"parent": parent_table, "schema": schema, "sizes": sizes})
+    partitions = []
+    for name, bound, lower, upper, reltuples, heap_bytes, total_bytes, pending in cur.fetchall():
+        is_default = bound == "DEFAULT"
+        partitions.append({
+            "name": name,
+            "bound": bound,
+            "lower": lower,
+            "upper": upper,
+            "start": lower.date() if lower is not None else UNBOUNDED_START,
+            "end": upper.date() if upper is not None else UNBOUNDED_END,
+            "is_default": is_default,
+            "rows_estimate": reltuples if reltuples >= 0 else None,
+            "heap_bytes": heap_bytes,
+            "total_bytes": total_bytes,
+            "detach_pending": pending,
+        })
+    partitions.sort(key=lambda p: (p["is_default"], p["start"]))
+    return partitions
+
+
+def get_partition_indexes(cur, parent_table: str, schema: str = "public") -> dict[str, dict]:
+    """
+    Indexes of every direct partition of a parent, in one query:
+    {partition: {index_name: {"valid", "primary", "unique", "method", "bytes", "inherited"}}}
+    (inherited: the index is a partition of an index on the parent).
+    Partitions without indexes map to an empty dict.
+    """
+    cur.execute(
+        """
+        SELECT c.relname, i.relname, x.indisvalid, x.indisprimary, x.indisunique, am.amname,
+               pg_relation_size(i.oid), EXISTS (SELECT 1 FROM pg_inherits ii WHERE ii.inhrelid = i.oid)
+        FROM pg_partition_tree(format('%%I.%%I', %(schema)s::text, %(parent)s::text)::regclass) t
+        JOIN pg_class c ON c.oid = t.relid
+        LEFT JOIN pg_index x ON x.indrelid = c.oid
+        LEFT JOIN pg_class i ON i.oid = x.indexrelid
+        LEFT JOIN pg_am am ON am.oid = i.relam
+        WHERE t.level = 1
+        ORDER BY c.relname, i.relname;
+        """,
+        {"parent": parent_table, "schema": schema}
+    )
+    result = {}
+    for part, index, valid, primary, unique, method, size, inherited in cur.fetchall():
+        indexes = result.setdefault(part, {})
+        if index is not None:
+            indexes[index] = {"valid": valid, "primary": primary, "unique": unique, "method": method,
+                              "bytes": size, "inherited": inherited}
+    return result
+
+
+def get_partition_stats(cur, parent_table: str, schema: str = "public") -> dict[str, dict]:
+    """
+    Cumulative statistics (pg_stat_user_tables) of every direct partition of a parent:
+    {partition: {"live_rows", "mod_since_analyze", "ins_since_vacuum", "dead_rows",
+                 "last_analyze", "last_vacuum"}}
+    (last_* is the newer of the manual and the autovacuum timestamp, None if never).
+    """
+    cur.execute(
+        """
+        SELECT c.relname, s.n_live_tup, s.n_mod_since_analyze, s.n_ins_since_vacuum, s.n_dead_tup,
+               GREATEST(s.last_analyze, s.last_autoanalyze), GREATEST(s.last_vacuum, s.last_autovacuum)
+        FROM pg_partition_tree(format('%%I.%%I', %(schema)s::text, %(parent)s::text)::regclass) t
+        JOIN pg_class c ON c.oid = t.relid
+        JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE t.level = 1;
+        """,
+        {"parent": parent_table, "schema": schema}
+    )
+    return {
+        name: {"live_rows": live, "mod_since_analyze": mod, "ins_since_vacuum": ins, "dead_rows": dead,
+               "last_analyze": analyzed, "last_vacuum": vacuumed}
+        for name, live, mod, ins, dead, analyzed, vacuumed in cur.fetchall()
+    }
+
+
+def range_partitions(partitions: list[dict]) -> list[dict]:
+    """Partitions with a range bound (drops the DEFAULT partition)."""
+    return [p for p in partitions if not p["is_default"]]
+
+
+def find_gaps(partitions: list[dict], coverage_start: dt.date | None = None,
+              coverage_end: dt.date | None = None) -> list[tuple[dt.date, dt.date]]:
+    """
+    Uncovered [start, end) ranges between consecutive range partitions, and, when given,
+    before the first / after the last partition inside [coverage_start, coverage_end).
+    """
+    intervals = sorted((p["start"], p["end"]) for p in range_partitions(partitions))
+    gaps = []
+    cursor = coverage_start
+    for start, end in intervals:
+        if cursor is not None and start > cursor:
+            gap_end = start if coverage_end is None else min(start, coverage_end)
+            if cursor < gap_end:
+                gaps.append((cursor, gap_end))
+        cursor = end if cursor is None else max(cursor, end)
+    if coverage_end is not None and cursor is not None and cursor < coverage_end:
+        gaps.append((cursor, coverage_end))
+    return gaps
+
+
+def find_overlaps(intervals: list[tuple]) -> list[tuple[tuple, tuple]]:
+    """
+    Pairs of overlapping [start, end, ...] intervals.
+    Attached range partitions can never overlap, but name windows, detached tables or
+    planned windows checked against the catalog can.
+    """
+    ordered = sorted(intervals, key=lambda i: (i[0], i[1]))
+    overlaps = []
+    active = []
+    for current in ordered:
+        active = [a for a in active if a[1] > current[0]]
+        overlaps.extend((a, current) for a in active)
+        active.append(current)
+    return overlaps
+
+
+def name_window(name: str) -> tuple[dt.date, dt.date] | None:
+    """The window encoded in a parent_YYYYMMDD_to_YYYYMMDD name, or None."""
+    m = NAME_WINDOW_RE.search(name)
+    if not m:
+        return None
+    return (dt.datetime.strptime(m.group(1), "%Y%m%d").date(),
+            dt.datetime.strptime(m.group(2), "%Y%m%d").date())
+
+
+def find_name_mismatches(partitions: list[dict]) -> list[dict]:
+    """Range partitions whose name does not describe their real bounds."""
+    return [p for p in range_partitions(partitions) if name_window(p["name"]) != (p["start"], p["end"])]
+
+
+def describe(cur, parent_table: str, sizes: bool = False, coverage_start: dt.date | None = None,
+             coverage_end: dt.date | None = None):
+    """Print the interval list of one parent with estimates, gaps and naming problems."""
+    partitions = get_partitions(cur, parent_table, sizes=sizes)
+    total_rows = sum(p["rows_estimate"] or 0 for p in partitions)
+    total_bytes = sum((p["total_bytes"] if sizes else p["heap_bytes"]) or 0 for p in partitions)
+    print(f"{parent_table}: {len(partitions)} partitions, ~{total_rows} rows, "
+          f"{format_bytes(total_bytes)}{'' if sizes else ' heap (estimate)'}")
+    for p in partitions:
+        rows = "never analyzed" if p["rows_estimate"] is None else f"~{p['rows_estimate']} rows"
+        size = format_bytes(p["total_bytes"] if sizes else p["heap_bytes"])
+        flags = " [DETACH PENDING]" if p["detach_pending"] else ""
+        window = "DEFAULT" if p["is_default"] else f"{p['start']} .. {p['end']}"
+        print(f"  {window:<26} {p['name']:<48} {rows:>18} {size:>10}{flags}")
+    for start, end in find_gaps(partitions, coverage_start, coverage_end):
+        print(f"  GAP {start} .. {end}: inserts in this range fail")
+    for p in find_name_mismatches(partitions):
+        print(f"  NAME MISMATCH {p['name']}: {p['bound']}")
+    return partitions
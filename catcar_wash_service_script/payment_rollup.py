@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Incremental PAYMENT rollups of public.tbl_devices_events.
+
+Replaces the full REFRESH MATERIALIZED VIEW of mv_device_payments_hour/day/month/year
+(which re-parses the JSONB of every PAYMENT row ever stored) with summary tables that
+are maintained incrementally:
+
+  rollup_device_payments_hour   (device_id, hour_start, status, ...)
+  rollup_device_payments_day    (device_id, day, status, ...)
+  rollup_device_payments_month  (device_id, month_start, status, ...)
+  rollup_device_payments_year   (device_id, year_start, status, ...)
+
+Same columns and arithmetic as the materialized views (prisma migration
+520250829112710_materialzed_view): bucketed by payload->>'timestamp' in Asia/Bangkok,
+total_amount, coin_sum / bank_sum (denomination x count from payload->'coin' / 'bank')
+and qr_net_sum (payload->'qr'->>'net_amount'), plus a payments count.
+
+- A watermark on created_at (table rollup_watermarks) records how far events were rolled
+  up; a run only reads events from watermark - lookback onwards, so partition pruning
+  keeps it to the newest partition(s)
+- The service stores created_at = event timestamp and devices upload logs late, so the
+  hours of the lookback window are recomputed (delete + insert), not incremented:
+  re-running is idempotent and late uploads inside the lookback window are picked up
+- day is derived from the hours, month from the days, year from the months, only for
+  the periods touched by the run
+- Each batch (hours + day/month/year + watermark) commits in one transaction
+- Rollups outlive retention: hours older than the oldest remaining event are never
+  recomputed, so dropping old partitions keeps their totals
+
+Values are not rounded to numeric(10,2) at each level (the views round only their final
+sums); for whole-baht coin / bank values both are identical.
+Events without payload->>'timestamp' are skipped (the views put them in a NULL bucket).
+
+Usage:
+  python3 payment_rollup.py                       # roll up new events (default 72h lookback)
+  python3 payment_rollup.py run --since 2025-09-01  # recompute from a date (late uploads)
+  python3 payment_rollup.py run --full            # recompute from the oldest event
+  python3 payment_rollup.py status
+  python3 payment_rollup.py verify --level day --days 30   # compare with mv_device_payments_day
+"""
+
+import argparse
+import datetime as dt
+import sys
+import time
+from psycopg2 import sql
+
+from partition_60d_cron import get_conn
+
+ADVISORY_LOCK_KEY = 85123457  # arbitrary unique int for this job
+WATERMARK_NAME = "device_payments"
+TIME_ZONE = "Asia/Bangkok"
+LOOKBACK_HOURS = 72  # late uploads older than this need `run --since`
+BATCH_DAYS = 7  # created_at range per transaction when catching up
+
+HOUR_TABLE = "rollup_device_payments_hour"
+
+# level -> (rollup table, period column, source table, source column, materialized view)
+LEVELS = {
+    "hour": (HOUR_TABLE, "hour_start", None, None, "mv_device_payments_hour"),
+    "day": ("rollup_device_payments_day", "day", HOUR_TABLE, "hour_start", "mv_device_payments_day"),
+    "month": ("rollup_device_payments_month", "month_start", "rollup_device_payments_day", "day",
+              "mv_device_payments_month"),
+    "year": ("rollup_device_payments_year", "year_start", "rollup_device_payments_month", "month_start",
+             "mv_device_payments_year"),
+}
+
+VALUE_COLUMNS = ("total_amount", "coin_sum", "bank_sum", "qr_net_sum", "payments")
+
+# Same payment arithmetic as the materialized views, restricted to a created_at range
+# and to the hours [lo, hi_hour_end) of that range
+HOUR_INSERT_SQL = """
+    INSERT INTO rollup_device_payments_hour
+      (device_id, hour_start, status, total_amount, coin_sum, bank_sum, qr_net_sum, payments)
+    WITH payments AS (
+      SELECT
+        e.device_id,
+        date_trunc(
+          'hour',
+          to_timestamp((e.payload->>'timestamp')::bigint / 1000) AT TIME ZONE %(tz)s
+        ) AS hour_start,
+        e.payload
+      FROM tbl_devices_events e
+      WHERE e.created_at >= %(lo)s AND e.created_at < %(hi)s
+        AND e.payload->>'type' = 'PAYMENT'
+        AND e.payload->>'timestamp' IS NOT NULL
+    )
+    SELECT
+      p.device_id,
+      p.hour_start,
+      p.payload->>'status' AS status,
+      SUM((p.payload->>'total_amount')::numeric(10,2)) AS total_amount,
+      SUM(COALESCE(c.coin_sum, 0))                     AS coin_sum,
+      SUM(COALESCE(b.bank_sum, 0))                     AS bank_sum,
+      SUM(COALESCE(q.qr_net_sum, 0))                   AS qr_net_sum,
+      count(*)                                         AS payments
+    FROM payments p
+    LEFT JOIN LATERAL (
+      SELECT SUM((kv.key)::numeric(10,2) * (kv.value)::numeric(10,2)) AS coin_sum
+      FROM jsonb_each_text(p.payload->'coin') kv
+    ) c ON TRUE
+    LEFT JOIN LATERAL (
+      SELECT SUM((kv.key)::numeric(10,2) * (kv.value)::numeric(10,2)) AS bank_sum
+      FROM jsonb_each_text(p.payload->'bank') kv
+    ) b ON TRUE
+    LEFT JOIN LATERAL (
+      SELECT (p.payload->'qr'->>'net_amount')::numeric(10,2) AS qr_net_sum
+    ) q ON TRUE
+    WHERE p.hour_start >= %(lo)s::timestamptz AT TIME ZONE %(tz)s
+      AND p.hour_start < date_trunc('hour', %(hi)s::timestamptz AT TIME ZONE %(tz)s) + interval '1 hour'
+    GROUP BY p.device_id, p.hour_start, p.payload->>'status';
+"""
+
+
+def ensure_schema(cur):
+    """Create the rollup and watermark tables if missing (status is nullable, as in the views)."""
+    for level, (table, period, _, _, _) in LEVELS.items():
+        period_type = "timestamp" if level == "hour" else "date"
+        cur.execute(sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS "public".{table} (
+              device_id    text    NOT NULL,
+              {period}     {period_type} NOT NULL,
+              status       text,
+              total_amount numeric,
+              coin_sum     numeric NOT NULL,
+              bank_sum     numeric NOT NULL,
+              qr_net_sum   numeric NOT NULL,
+              payments     bigint  NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS {ux} ON "public".{table} (device_id, {period}, status) NULLS NOT DISTINCT;
+            CREATE INDEX IF NOT EXISTS {ix} ON "public".{table} ({period});
+            """
+        ).format(
+            table=sql.Identifier(table),
+            period=sql.Identifier(period),
+            period_type=sql.SQL(period_type),
+            ux=sql.Identifier(f"ux_{table}"),
+            ix=sql.Identifier(f"{table}_{period}_idx"),
+        ))
+    ensure_watermark_table(cur)
+
+
+def ensure_watermark_table(cur):
+    """rollup_watermarks: one row per rollup job (also used by device_state_rollup.py)."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "public".rollup_watermarks (
+          name       text PRIMARY KEY,
+          watermark  timestamptz NOT NULL,
+          updated_at timestamptz NOT NULL DEFAULT now()
+        );
+        """
+    )
+
+
+def get_watermark(cur, name: str, for_update: bool = False) -> dt.datetime | None:
+    cur.execute(
+        "SELECT watermark FROM rollup_watermarks WHERE name = %s" + (" FOR UPDATE;" if for_update else ";"),
+        (name,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(cur, name: str, watermark: dt.datetime):
+    cur.execute(
+        """
+        INSERT INTO rollup_watermarks (name, watermark) VALUES (%s, %s)
+        ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now();
+        """,
+        (name, watermark)
+    )
+
+
+def oldest_event(cur) -> dt.datetime | None:
+    """created_at of the oldest event still stored (min per partition via the index)."""
+    cur.execute("SELECT min(created_at) FROM tbl_devices_events;")
+    return cur.fetchone()[0]
+
+
+def floor_hour(cur, ts: dt.datetime) -> dt.datetime:
+    cur.execute("SELECT date_trunc('hour', %s::timestamptz);", (ts,))
+    return cur.fetchone()[0]
+
+
+def period_ranges(d_lo: dt.date, d_hi: dt.date) -> dict[str, tuple[dt.date, dt.date]]:
+    """[start, end) of the days / months / years touched by local dates d_lo .. d_hi."""
+    month_end = (d_hi.replace(day=1) + dt.timedelta(days=32)).replace(day=1)
+    return {
+        "day": (d_lo, d_hi + dt.timedelta(days=1)),
+        "month": (d_lo.replace(day=1), month_end),
+        "year": (d_lo.replace(month=1, day=1), d_hi.replace(year=d_hi.year + 1, month=1, day=1)),
+    }
+
+
+def rollup_level(cur, level: str, start: dt.date, end: dt.date) -> int:
+    """Recompute one derived level for periods in [start, end) from the level below it."""
+    table, period, source, source_column, _ = LEVELS[level]
+    cur.execute(
+        sql.SQL('DELETE FROM "public".{} WHERE {} >= %(start)s AND {} < %(end)s;').format(
+            sql.Identifier(table), sql.Identifier(period), sql.Identifier(period)),
+        {"start": start, "end": end}
+    )
+    cur.execute(
+        sql.SQL(
+            """
+            INSERT INTO "public".{table} (device_id, {period}, status, {columns})
+            SELECT device_id, date_trunc(%(unit)s, {source_column})::date, status, {sums}
+            FROM "public".{source}
+            WHERE {source_column} >= %(start)s AND {source_column} < %(end)s
+            GROUP BY 1, 2, 3;
+            """
+        ).format(
+            table=sql.Identifier(table),
+            period=sql.Identifier(period),
+            columns=sql.SQL(", ").join(sql.Identifier(c) for c in VALUE_COLUMNS),
+            source_column=sql.Identifier(source_column),
+            sums=sql.SQL(", ").join(sql.SQL("SUM({})").format(sql.Identifier(c)) for c in VALUE_COLUMNS),
+            source=sql.Identifier(source),
+        ),
+        {"unit": level, "start": start, "end": end}
+    )
+    return cur.rowcount
+
+
+def rollup_batch(cur, lo: dt.datetime, hi: dt.datetime) -> dict:
+    """
+    Recompute the hours of events with created_at in [lo, hi) (lo hour aligned) and the
+    days / months / years containing them. Runs in the caller's transaction.
+    """
+    params = {"lo": lo, "hi": hi, "tz": TIME_ZONE}
+    cur.execute(
+        """
+        DELETE FROM rollup_device_payments_hour
+        WHERE hour_start >= %(lo)s::timestamptz AT TIME ZONE %(tz)s
+          AND hour_start < date_trunc('hour', %(hi)s::timestamptz AT TIME ZONE %(tz)s) + interval '1 hour';
+        """,
+        params
+    )
+    cur.execute(HOUR_INSERT_SQL, params)
+    result = {"hours": cur.rowcount}
+    cur.execute(
+        "SELECT (%(lo)s::timestamptz AT TIME ZONE %(tz)s)::date, (%(hi)s::timestamptz AT TIME ZONE %(tz)s)::date;",
+        params
+    )
+    d_lo, d_hi = cur.fetchone()
+    for level, (start, end) in period_ranges(d_lo, d_hi).items():
+        result[level] = rollup_level(cur, level, start, end)
+    return result
+
+
+def run_rollup(conn, cur, args):
+    cur.execute("SELECT date_trunc('milliseconds', now());")
+    hi = cur.fetchone()[0]
+    oldest = oldest_event(cur)
+    watermark = get_watermark(cur, WATERMARK_NAME)
+    conn.commit()
+    if oldest is None:
+        print("tbl_devices_events is empty, nothing to roll up")
+        return
+
+    if args.full or watermark is None:
+        lo = oldest
+    elif args.since:
+        cur.execute("SELECT %s::timestamp AT TIME ZONE %s;", (args.since, TIME_ZONE))
+        lo = cur.fetchone()[0]
+    else:
+        lo = watermark - dt.timedelta(hours=args.lookback_hours)
+    # never recompute hours whose events were dropped by retention
+    lo = floor_hour(cur, max(lo, oldest))
+    print(f"Watermark {watermark or 'none'}, rolling up created_at {lo} .. {hi}")
+
+    started = time.perf_counter()
+    totals = {"batches": 0, "hours": 0}
+    batch_start = lo
+    while batch_start < hi:
+        batch_end = min(batch_start + dt.timedelta(days=args.batch_days), hi)
+        t0 = time.perf_counter()
+        get_watermark(cur, WATERMARK_NAME, for_update=True)
+        counts = rollup_batch(cur, batch_start, batch_end)
+        set_watermark(cur, WATERMARK_NAME, max(batch_end, watermark or batch_end))
+        conn.commit()
+        totals["batches"] += 1
+        totals["hours"] += counts["hours"]
+        print(f"  {batch_start} .. {batch_end}: {counts['hours']} hour, {counts['day']} day, "
+              f"{counts['month']} month, {counts['year']} year row(s) in {time.perf_counter() - t0:.2f}s")
+        batch_start = batch_end
+    print(f"Rolled up {totals['hours']} hour row(s) in {totals['batches']} batch(es), "
+          f"{time.perf_counter() - started:.2f}s; watermark {max(hi, watermark or hi)}")
+
+
+def run_status(conn, cur, args):
+    watermark = get_watermark(cur, WATERMARK_NAME)
+    cur.execute("SELECT max(created_at) FROM tbl_devices_events;")
+    newest = cur.fetchone()[0]
+    print(f"Watermark: {watermark or 'none (never run)'}")
+    print(f"Newest event: {newest or 'none'}")
+    if watermark and newest and newest > watermark:
+        print(f"  behind by {newest - watermark}")
+    for level, (table, period, _, _, _) in LEVELS.items():
+        cur.execute(sql.SQL('SELECT count(*), min({p}), max({p}) FROM "public".{t};').format(
+            p=sql.Identifier(period), t=sql.Identifier(table)))
+        rows, first, last = cur.fetchone()
+        print(f"  {table:<30} {rows:>10} rows  {first} .. {last}")
+
+
+def run_verify(conn, cur, args):
+    """Compare one rollup level with its materialized view over the last --days days."""
+    table, period, _, _, view = LEVELS[args.level]
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (view,))
+    if not cur.fetchone()[0]:
+        print(f"{view} does not exist, nothing to compare")
+        return
+    if args.refresh:
+        print(f"Refreshing {view} ...")
+        cur.execute(sql.SQL("REFRESH MATERIALIZED VIEW {};").format(sql.Identifier(view)))
+    cur.execute(
+        sql.SQL(
+            """
+            SELECT COALESCE(r.device_id, m.device_id), COALESCE(r.{p}, m.{p}), COALESCE(r.status, m.status),
+                   r.total_amount, m.total_amount, round(r.coin_sum, 2), m.coin_sum,
+                   round(r.bank_sum, 2), m.bank_sum, round(r.qr_net_sum, 2), m.qr_net_sum
+            FROM "public".{t} r
+            FULL JOIN {v} m
+              ON m.device_id = r.device_id AND m.{p} = r.{p} AND m.status IS NOT DISTINCT FROM r.status
+            WHERE COALESCE(r.{p}, m.{p}) >= (now() AT TIME ZONE %(tz)s)::date - %(days)s
+              AND (r.total_amount IS DISTINCT FROM m.total_amount
+                   OR round(r.coin_sum, 2) IS DISTINCT FROM m.coin_sum
+                   OR round(r.bank_sum, 2) IS DISTINCT FROM m.bank_sum
+                   OR round(r.qr_net_sum, 2) IS DISTINCT FROM m.qr_net_sum)
+            ORDER BY 2, 1, 3;
+            """
+        ).format(p=sql.Identifier(period), t=sql.Identifier(table), v=sql.Identifier(view)),
+        {"tz": TIME_ZONE, "days": args.days}
+    )
+    mismatches = cur.fetchall()
+    for row in mismatches[:20]:
+        print(f"  MISMATCH {row[0]} {row[1]} {row[2]}: rollup {row[3]}/{row[5]}/{row[7]}/{row[9]} "
+              f"view {row[4]}/{row[6]}/{row[8]}/{row[10]} (total/coin/bank/qr)")
+    print(f"{table} vs {view}, last {args.days} day(s): {len(mismatches)} mismatch(es)")
+    if mismatches:
+        sys.exit(2)
+
+
+COMMANDS = {
+    "run": run_rollup,
+    "status": run_status,
+    "verify": run_verify,
+}
+
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0].startswith("-"):
+        argv.insert(0, "run")  # default command keeps the plain cron invocation working
+
+    parser = argparse.ArgumentParser(description="Incremental PAYMENT rollups of tbl_devices_events")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="roll up events since the watermark (default)")
+    since = run.add_mutually_exclusive_group()
+    since.add_argument("--since", type=dt.date.fromisoformat,
+                       help="recompute from this local (Asia/Bangkok) date, e.g. after a late upload")
+    since.add_argument("--full", action="store_true", help="recompute from the oldest stored event")
+    run.add_argument("--lookback-hours", type=int, default=LOOKBACK_HOURS,
+                     help=f"hours before the watermark to recompute (default: {LOOKBACK_HOURS})")
+    run.add_argument("--batch-days", type=int, default=BATCH_DAYS,
+                     help=f"created_at days per transaction (default: {BATCH_DAYS})")
+
+    sub.add_parser("status", help="show the watermark and rollup table sizes")
+
+    verify = sub.add_parser("verify", help="compare a rollup level with its materialized view")
+    verify.add_argument("--level", choices=list(LEVELS), default="day")
+    verify.add_argument("--days", type=int, default=30, help="compare the last N days (default: 30)")
+    verify.add_argument("--refresh", action="store_true", help="refresh the materialized view first")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = None
+    try:
+        conn = get_conn()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE 'UTC';")
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (ADVISORY_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                print("Another rollup job is running. Exiting.")
+                return
+            try:
+                ensure_schema(cur)
+                conn.autocommit = False
+                COMMANDS[args.command](conn, cur, args)
+                conn.commit()
+            finally:
+                conn.rollback()
+                conn.autocommit = True
+                cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_KEY,))
+    except Exception as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()